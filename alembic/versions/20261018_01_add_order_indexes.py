@@ -0,0 +1,32 @@
+"""add indexes: orders(status, created_at) / orders(created_at) / order_items covering
+
+Revision ID: 20261018_01
+Revises: 20251025_01
+Create Date: 2026-10-18
+"""
+from alembic import op
+
+revision = "20261018_01"
+down_revision = "20251025_01"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # create_all 済みの環境もあるため if_not_exists で冪等に
+    op.create_index(
+        "ix_orders_status_created_at", "orders", ["status", "created_at"], if_not_exists=True
+    )
+    op.create_index("ix_orders_created_at", "orders", ["created_at"], if_not_exists=True)
+    op.create_index(
+        "ix_order_items_covering",
+        "order_items",
+        ["order_id", "menu_id", "quantity", "price"],
+        if_not_exists=True,
+    )
+
+
+def downgrade():
+    op.drop_index("ix_order_items_covering", table_name="order_items")
+    op.drop_index("ix_orders_created_at", table_name="orders")
+    op.drop_index("ix_orders_status_created_at", table_name="orders")
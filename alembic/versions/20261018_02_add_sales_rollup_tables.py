@@ -0,0 +1,49 @@
+"""add sales_hourly_rollup / order_hourly_rollup / sync_watermarks
+
+Revision ID: 20261018_02
+Revises: 20261018_01
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "20261018_02"
+down_revision = "20261018_01"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "sales_hourly_rollup",
+        sa.Column("menu_id", sa.Integer, nullable=False),
+        sa.Column("bucket", sa.DateTime, nullable=False),  # JST 時刻バケット
+        sa.Column("quantity", sa.Integer, nullable=False, server_default="0"),
+        sa.Column("lines", sa.Integer, nullable=False, server_default="0"),
+        sa.PrimaryKeyConstraint("menu_id", "bucket"),
+    )
+    op.create_index("ix_sales_hourly_rollup_bucket", "sales_hourly_rollup", ["bucket"])
+
+    op.create_table(
+        "order_hourly_rollup",
+        sa.Column("bucket", sa.DateTime, nullable=False),
+        sa.Column("orders", sa.Integer, nullable=False, server_default="0"),
+        sa.PrimaryKeyConstraint("bucket"),
+    )
+
+    op.create_table(
+        "sync_watermarks",
+        sa.Column("name", sa.String(length=64), nullable=False),
+        sa.Column("value", sa.String(length=64), nullable=False),
+        sa.Column("updated_at", sa.DateTime(timezone=True), nullable=False, server_default=sa.func.now()),
+        sa.PrimaryKeyConstraint("name"),
+    )
+    # 既存注文はこのマイグレーションの後に `python -m app.scripts.rebuild_sales_rollup` で取り込む（デプロイ手順）。
+    # リクエスト側の取り込みは上限件数ずつなので、実行しないと履歴が揃うまで時間がかかる
+
+
+def downgrade():
+    op.drop_table("sync_watermarks")
+    op.drop_table("order_hourly_rollup")
+    op.drop_index("ix_sales_hourly_rollup_bucket", table_name="sales_hourly_rollup")
+    op.drop_table("sales_hourly_rollup")
@@ -0,0 +1,21 @@
+"""add index menu_daily_forecast(ds)
+
+Revision ID: 20261018_03
+Revises: 20261018_02
+Create Date: 2026-10-18
+"""
+from alembic import op
+
+revision = "20261018_03"
+down_revision = "20261018_02"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # /api/analytics/forecast?menu_id=all は日付範囲だけで引く
+    op.create_index("ix_menu_daily_forecast_ds", "menu_daily_forecast", ["ds"], if_not_exists=True)
+
+
+def downgrade():
+    op.drop_index("ix_menu_daily_forecast_ds", table_name="menu_daily_forecast")
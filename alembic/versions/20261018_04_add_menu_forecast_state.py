@@ -0,0 +1,35 @@
+"""add menu_forecast_state (incremental retraining)
+
+Revision ID: 20261018_04
+Revises: 20261018_03
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "20261018_04"
+down_revision = "20261018_03"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "menu_forecast_state",
+        sa.Column("menu_id", sa.Integer, nullable=False),
+        sa.Column("config", sa.String(length=64), nullable=False),
+        sa.Column("config_hash", sa.String(length=40), nullable=False),
+        sa.Column("data_hash", sa.String(length=40), nullable=False),
+        sa.Column("data_max_ds", sa.Date, nullable=True),
+        sa.Column("data_rows", sa.Integer, nullable=False),
+        sa.Column("chosen_model", sa.String(length=64), nullable=True),
+        sa.Column("artifact", sa.Text, nullable=True),
+        sa.Column("forecast_start", sa.Date, nullable=True),
+        sa.Column("horizon", sa.Integer, nullable=True),
+        sa.Column("trained_at", sa.DateTime, server_default=sa.func.now(), nullable=False),
+        sa.PrimaryKeyConstraint("menu_id", "config"),
+    )
+
+
+def downgrade():
+    op.drop_table("menu_forecast_state")
@@ -0,0 +1,43 @@
+"""add forecast_model_registry; menu_forecast_state.artifact -> model_version
+
+Revision ID: 20261018_05
+Revises: 20261018_04
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "20261018_05"
+down_revision = "20261018_04"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "forecast_model_registry",
+        sa.Column("id", sa.Integer, primary_key=True, autoincrement=True),
+        sa.Column("menu_id", sa.Integer, nullable=False),
+        sa.Column("config", sa.String(length=64), nullable=False),
+        sa.Column("version", sa.Integer, nullable=False),
+        sa.Column("model", sa.String(length=64), nullable=False),
+        sa.Column("artifact", sa.Text, nullable=False),
+        sa.Column("metrics", sa.Text, nullable=True),
+        sa.Column("data_max_ds", sa.Date, nullable=True),
+        sa.Column("trained_at", sa.DateTime, server_default=sa.func.now(), nullable=False),
+        sa.UniqueConstraint("menu_id", "config", "version", name="uq_forecast_model_registry_version"),
+    )
+    op.create_index("ix_forecast_model_registry_menu_id", "forecast_model_registry", ["menu_id", "id"])
+
+    # モデル本体はレジストリへ。state は版番号だけ持つ（既存の artifact は次回学習で作り直す）
+    with op.batch_alter_table("menu_forecast_state") as batch:
+        batch.add_column(sa.Column("model_version", sa.Integer, nullable=True))
+        batch.drop_column("artifact")
+
+
+def downgrade():
+    with op.batch_alter_table("menu_forecast_state") as batch:
+        batch.add_column(sa.Column("artifact", sa.Text, nullable=True))
+        batch.drop_column("model_version")
+    op.drop_index("ix_forecast_model_registry_menu_id", table_name="forecast_model_registry")
+    op.drop_table("forecast_model_registry")
@@ -0,0 +1,30 @@
+"""add forecast_hyperparams
+
+Revision ID: 20261018_06
+Revises: 20261018_05
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "20261018_06"
+down_revision = "20261018_05"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "forecast_hyperparams",
+        sa.Column("menu_id", sa.Integer, primary_key=True),
+        sa.Column("config", sa.String(length=64), primary_key=True),
+        sa.Column("alpha", sa.Float, nullable=False),
+        sa.Column("n_lags", sa.Integer, nullable=False),
+        sa.Column("mae", sa.Float, nullable=True),
+        sa.Column("folds", sa.Integer, nullable=True),
+        sa.Column("tuned_at", sa.DateTime, server_default=sa.func.now(), nullable=False),
+    )
+
+
+def downgrade():
+    op.drop_table("forecast_hyperparams")
@@ -1,15 +1,43 @@
 import os
 import sys
 import argparse
-from datetime import date
-from typing import Optional, Tuple
+from datetime import date, timedelta
+from typing import List, Optional, Tuple
 
+import numpy as np
 import pandas as pd
-from sqlalchemy import create_engine, text, inspect
-from sqlalchemy.engine import Engine
-
-
-def parse_args() -> argparse.Namespace:
+from sqlalchemy import (
+    Boolean, Column, Date, Integer, MetaData, Table,
+    case, column, create_engine, delete, func, inspect, insert, select, table, text,
+)
+from sqlalchemy.engine import Connection, Engine
+
+# backend を sys.path に追加（python backend/app/etl/day2_build_menu_daily_train.py で直接実行するため）
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+if BACKEND_DIR not in sys.path:
+    sys.path.append(BACKEND_DIR)
+
+from app.models import SyncWatermark
+from app.services.calendar_features import calendar_for
+from app.services.timebucket import JST_TZ_NAME, jst_date, jst_day_range_utc, utc_bound
+
+# DB 側で日次集計できない方言のとき、明細をこの行数ずつ読んで畳み込む
+AGG_CHUNK_ROWS = 100_000
+
+TRAIN_TABLE = "menu_daily_train"
+DEFAULT_CSV = "backend/data/processed/menu_daily_train.csv"
+# --incremental：最後に作った日（JST）。次回はこの日の LATE_DAYS 日前から作り直す
+WATERMARK_NAME = "menu_daily_train.last_ds"
+DEFAULT_LATE_DAYS = 2
+WATERMARK_TABLE = SyncWatermark.__table__
+
+# 品質チェック：外れ値は |y - 中央値| > OUTLIER_Z × 1.4826 × MAD、0 が ZERO_RUN_DAYS 日以上続いたら 0 連続として数える
+QUALITY_TABLE = "menu_daily_train_quality"
+OUTLIER_Z = 5.0
+ZERO_RUN_DAYS = 7
+
+
+def parse_args(argv=None) -> argparse.Namespace:
     parser = argparse.ArgumentParser()
     parser.add_argument(
         "--database-url",
@@ -18,8 +46,8 @@ def parse_args() -> argparse.Namespace:
     )
     parser.add_argument(
         "--csv",
-        default="backend/data/processed/menu_daily_train.csv",
-        help="出力CSVパス",
+        default=None,
+        help=f"出力CSVパス（既定は {DEFAULT_CSV}。--incremental では指定したときだけ全件を書き出す）",
     )
     parser.add_argument(
         "--start",
@@ -34,14 +62,36 @@ def parse_args() -> argparse.Namespace:
     parser.add_argument(
         "--include-month-end",
         action="store_true",
-        help="is_month_end(0/1) を付与して出力",
+        help="CSV に is_month_end(0/1) 列を出す（テーブルには --incremental と同じく常に書く）",
     )
     parser.add_argument(
         "--holiday-csv",
         default=None,
         help="祝日一覧CSV（1列または 'ds' 列に YYYY-MM-DD）。与えた場合は is_holiday(0/1) 付与",
     )
-    return parser.parse_args()
+    parser.add_argument(
+        "--chunk-rows",
+        type=int,
+        default=AGG_CHUNK_ROWS,
+        help="DB 側で集計できない方言のとき、明細を何行ずつ読むか",
+    )
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="watermark（前回作った最終日）以降だけを集計し直して upsert する（主キー (menu_id, ds) を保つ）",
+    )
+    parser.add_argument(
+        "--quality-table",
+        default=QUALITY_TABLE,
+        help="品質チェック結果（メニューごと）の追記先テーブル（空文字で保存しない）",
+    )
+    parser.add_argument(
+        "--late-days",
+        type=int,
+        default=DEFAULT_LATE_DAYS,
+        help="--incremental で watermark の何日前から作り直すか（遅れて入る注文の取り込み用）",
+    )
+    return parser.parse_args(argv)
 
 
 def get_engine(db_url: str) -> Engine:
@@ -56,50 +106,77 @@ def fetch_menu_ids(engine: Engine) -> pd.Series:
     return df["menu_id"]
 
 
-def fetch_order_daily_agg(engine: Engine) -> pd.DataFrame:
+def _order_lines(engine: Engine):
     """
-    orders × order_items を想定して menu_id / created_at / quantity を取得。
+    (menu_id, created_at, quantity) の列と FROM 句。
     - 現在のスキーマ（menu_id/quantityは order_items 側）なら JOIN。
     - 互換用に、order_items が無ければ orders 直読み（旧スキーマ互換）。
     """
     tables = set(inspect(engine).get_table_names())
-    use_join = ("order_items" in tables) and ("orders" in tables)
+    if ("order_items" in tables) and ("orders" in tables):
+        oi = table("order_items", column("order_id"), column("menu_id"), column("quantity"))
+        o = table("orders", column("id"), column("created_at"))
+        return oi.c.menu_id, o.c.created_at, oi.c.quantity, oi.join(o, oi.c.order_id == o.c.id)
+    o = table("orders", column("menu_id"), column("created_at"), column("quantity"))
+    return o.c.menu_id, o.c.created_at, o.c.quantity, o
+
+
+def _daily_sum(lines: pd.DataFrame) -> pd.DataFrame:
+    """明細 (menu_id, created_at, quantity) → JST の日次合計 (menu_id, ds, y)"""
+    # created_at は UTC（naive なら UTC とみなす）→ JST の日付
+    ds = pd.to_datetime(lines["created_at"], utc=True, format="mixed").dt.tz_convert(JST_TZ_NAME).dt.date
+    # quantity を安全に数値化し、負値は0で丸め
+    qty = pd.to_numeric(lines["quantity"], errors="coerce").fillna(0).clip(lower=0)
+    g = pd.DataFrame({"menu_id": lines["menu_id"], "ds": ds, "y": qty})
+    return g.groupby(["menu_id", "ds"], as_index=False)["y"].sum()
 
-    with engine.begin() as conn:
-        if use_join:
-            sql = text("""
-                SELECT
-                  oi.menu_id   AS menu_id,
-                  o.created_at AS created_at,
-                  oi.quantity  AS quantity
-                FROM order_items AS oi
-                JOIN orders AS o ON oi.order_id = o.id
-            """)
-        else:
-            sql = text("""
-                SELECT
-                  menu_id,
-                  created_at,
-                  quantity
-                FROM orders
-            """)
-        df = pd.read_sql(sql, conn)
 
-    if df.empty:
-        return pd.DataFrame(columns=["menu_id", "ds", "y"])
+def _stream_daily_agg(engine: Engine, sql, chunk_rows: int) -> pd.DataFrame:
+    """明細を chunk_rows 行ずつサーバ側カーソルで読み、日次に畳みながら足し込む（メモリは メニュー × 日数 で頭打ち）"""
+    acc = pd.DataFrame(columns=["menu_id", "ds", "y"])
+    with engine.connect() as conn:
+        result = conn.execution_options(stream_results=True, yield_per=chunk_rows).execute(sql)
+        for rows in result.partitions(chunk_rows):
+            part = _daily_sum(pd.DataFrame(rows, columns=["menu_id", "created_at", "quantity"]))
+            acc = part if acc.empty else pd.concat([acc, part]).groupby(["menu_id", "ds"], as_index=False)["y"].sum()
+    return acc
 
-    # created_at → 日付
-    df["ds"] = pd.to_datetime(df["created_at"]).dt.date
 
-    # quantity を安全に数値化し、負値は0で丸め
-    df["quantity"] = pd.to_numeric(df["quantity"], errors="coerce").fillna(0)
-    df.loc[df["quantity"] < 0, "quantity"] = 0
+def fetch_order_daily_agg(engine: Engine, chunk_rows: int = AGG_CHUNK_ROWS, pushdown: bool = True,
+                          since: Optional[date] = None, menu_ids: Optional[List[int]] = None) -> pd.DataFrame:
+    """
+    メニュー × JST の日付 ごとの数量合計 (menu_id, ds, y)。
+    - SQLite / PostgreSQL は DB 側で JST の日付に丸めて GROUP BY（転送はメニュー × 日数 行だけ）
+    - それ以外の方言（または pushdown=False）は明細をチャンクで流して Python 側で集計
+    - since（JST の日付）以降 / menu_ids だけに絞れる（created_at は UTC の境界と直接比べる）
+    """
+    dialect = engine.dialect.name
+    menu_id, created_at, quantity, src = _order_lines(engine)
+    day = jst_date(created_at, dialect) if pushdown else None
+    where = []
+    if since is not None:
+        where.append(created_at >= utc_bound(jst_day_range_utc(since, since)[0], dialect))
+    if menu_ids is not None:
+        where.append(menu_id.in_(list(menu_ids)))
+
+    if day is not None:
+        qty = func.coalesce(case((quantity > 0, quantity), else_=0), 0)
+        sql = (
+            select(menu_id.label("menu_id"), day.label("ds"), func.sum(qty).label("y"))
+            .select_from(src)
+            .where(*where)
+            .group_by(menu_id, day)
+        )
+        with engine.connect() as conn:
+            g = pd.DataFrame(conn.execute(sql).all(), columns=["menu_id", "ds", "y"])
+    else:
+        g = _stream_daily_agg(engine, select(menu_id, created_at, quantity).select_from(src).where(*where), chunk_rows)
 
-    # 日次合計
-    g = df.groupby(["menu_id", "ds"], as_index=False)["quantity"].sum()
-    g = g.rename(columns={"quantity": "y"})
+    if g.empty:
+        return pd.DataFrame(columns=["menu_id", "ds", "y"])
     g["ds"] = pd.to_datetime(g["ds"]).dt.date
-    return g[["menu_id", "ds", "y"]]
+    g["y"] = pd.to_numeric(g["y"], errors="coerce").fillna(0)
+    return g.sort_values(["menu_id", "ds"]).reset_index(drop=True)[["menu_id", "ds", "y"]]
 
 
 def resolve_date_range(agg: pd.DataFrame, start: Optional[str], end: Optional[str]) -> Tuple[date, date]:
@@ -124,27 +201,43 @@ def build_date_spine(start_date: date, end_date: date) -> pd.DataFrame:
 
 
 def add_basic_features(df: pd.DataFrame, include_month_end: bool, holiday_csv: Optional[str]) -> pd.DataFrame:
-    s = pd.to_datetime(df["ds"])
+    # 共通カレンダー表から引く（曜日: 月曜=0, …, 日曜=6）
+    cal = calendar_for(df["ds"], holiday_csv=holiday_csv)
 
-    # 曜日: 月曜=0, …, 日曜=6
-    df["dow"] = s.dt.weekday
+    df["dow"] = cal["dow"].to_numpy()
 
     if include_month_end:
-        df["is_month_end"] = s.dt.is_month_end.astype(int)
+        df["is_month_end"] = cal["is_month_end"].to_numpy()
 
     if holiday_csv:
-        hol = pd.read_csv(holiday_csv)
-        if "ds" in hol.columns:
-            hol_dates = pd.to_datetime(hol["ds"]).dt.date
-        else:
-            hol_dates = pd.to_datetime(hol.iloc[:, 0]).dt.date
-        hol_set = set(hol_dates.tolist())
-        df["is_holiday"] = df["ds"].apply(lambda d: 1 if d in hol_set else 0)
+        df["is_holiday"] = cal["holiday"].to_numpy()
 
     return df
 
 
-def write_table(engine: Engine, df: pd.DataFrame):
+def build_train_rows(menu_ids: List[int], agg: pd.DataFrame, start_date: date, end_date: date) -> pd.DataFrame:
+    """menu_id × start_date..end_date の全組合せに日次合計を左結合（注文の無い日は 0）"""
+    calendar = build_date_spine(start_date, end_date)
+    all_pairs = (
+        pd.MultiIndex.from_product(
+            [list(menu_ids), calendar["ds"].tolist()],
+            names=["menu_id", "ds"]
+        ).to_frame(index=False)
+    )
+
+    # 左結合し欠損は 0（FutureWarning を回避して堅く数値化）
+    merged = all_pairs.merge(agg, on=["menu_id", "ds"], how="left")
+    merged["y"] = pd.to_numeric(merged["y"], errors="coerce").fillna(0)
+    merged.loc[merged["y"] < 0, "y"] = 0
+    merged["y"] = merged["y"].astype("int64")
+    return merged
+
+
+def write_table(engine: Engine, df: pd.DataFrame, end_date: date):
+    """
+    全件作り直し。主キー (menu_id, ds) 付きのテーブル（train_table）を空にして入れ直し、
+    同じトランザクションで watermark を end_date にする（次の --incremental はそこから続ける）。
+    """
     cols = ["menu_id", "ds", "y", "dow"]
     if "is_month_end" in df.columns:
         cols.append("is_month_end")
@@ -152,72 +245,273 @@ def write_table(engine: Engine, df: pd.DataFrame):
         cols.append("is_holiday")
 
     out = df[cols].copy()
+    t = train_table(engine, include_holiday="is_holiday" in out.columns)
     with engine.begin() as conn:
-        out.to_sql("menu_daily_train", conn, if_exists="replace", index=False)
+        conn.execute(delete(t))
+        upsert_train_rows(conn, t, out)
+        write_watermark(conn, end_date)
     return out
 
 
-def acceptance_check(df: pd.DataFrame) -> None:
-    neg = (df["y"] < 0).sum()
-    holes_total = 0
-    for _, g in df.groupby("menu_id"):
-        s = pd.to_datetime(g["ds"]).sort_values().reset_index(drop=True)
-        delta = s.diff().dropna().dt.days
-        holes_total += int((delta > 1).sum())
+QUALITY_COLS = [
+    "menu_id", "rows", "first_ds", "last_ds", "negatives", "duplicates", "gaps", "missing_days",
+    "outliers", "zero_runs", "max_zero_run", "ok",
+]
+
+
+def quality_report(df: pd.DataFrame, outlier_z: float = OUTLIER_Z, min_zero_run: int = ZERO_RUN_DAYS) -> pd.DataFrame:
+    """
+    メニューごとの品質指標（列は QUALITY_COLS）。全体を 1 回だけ (menu_id, ds) で並べ、
+    1 行前との差（shift / diff）と groupby の集約だけで求める（メニューごとのループなし）。
+    """
+    if df.empty:
+        return pd.DataFrame(columns=QUALITY_COLS)
+    d = pd.DataFrame({
+        "menu_id": df["menu_id"].to_numpy(),
+        "ds": pd.to_datetime(df["ds"]).to_numpy(),
+        "y": pd.to_numeric(df["y"], errors="coerce").to_numpy(dtype=float),
+    }).sort_values(["menu_id", "ds"], kind="stable", ignore_index=True)
+
+    mid = d["menu_id"].to_numpy()
+    same = np.r_[False, mid[1:] == mid[:-1]]  # 1 行前が同じメニュー
+    step = np.r_[0, np.diff(d["ds"].to_numpy()) // np.timedelta64(1, "D")]
+    step = np.where(same, step, 0)
+    y = d["y"].to_numpy()
+
+    # 外れ値：メニューごとの中央値と MAD（MAD=0 のメニューは判定しない）
+    g = d.groupby("menu_id", sort=False)["y"]
+    med = g.transform("median").to_numpy()
+    mad = (d["y"] - med).abs().groupby(d["menu_id"], sort=False).transform("median").to_numpy()
+    outlier = (mad > 0) & (np.abs(y - med) > outlier_z * 1.4826 * mad)
+
+    # 0 の連続：連続した日（差が 1 日）の 0 をひとつの区間にまとめる
+    zero = y == 0
+    zero_start = zero & ~(np.r_[False, zero[:-1]] & same & (step == 1))
+    run_id = np.cumsum(zero_start)
+    runs = pd.DataFrame({"menu_id": mid[zero], "run": run_id[zero]}).groupby(["menu_id", "run"]).size()
+
+    d = d.assign(
+        negatives=y < 0,
+        duplicates=same & (step == 0),
+        gaps=step > 1,
+        missing_days=np.where(step > 1, step - 1, 0),
+        outliers=outlier,
+    )
+    rep = d.groupby("menu_id").agg(
+        rows=("ds", "size"), first_ds=("ds", "min"), last_ds=("ds", "max"),
+        negatives=("negatives", "sum"), duplicates=("duplicates", "sum"), gaps=("gaps", "sum"),
+        missing_days=("missing_days", "sum"), outliers=("outliers", "sum"),
+    )
+    rep["zero_runs"] = (runs >= min_zero_run).groupby(level="menu_id").sum().reindex(rep.index, fill_value=0)
+    rep["max_zero_run"] = runs.groupby(level="menu_id").max().reindex(rep.index, fill_value=0)
+    rep["ok"] = (rep["negatives"] == 0) & (rep["duplicates"] == 0) & (rep["gaps"] == 0)
+    rep["first_ds"] = rep["first_ds"].dt.date
+    rep["last_ds"] = rep["last_ds"].dt.date
+    num = ["rows", "negatives", "duplicates", "gaps", "missing_days", "outliers", "zero_runs", "max_zero_run", "ok"]
+    rep[num] = rep[num].astype("int64")
+    return rep.reset_index()[QUALITY_COLS]
+
+
+def write_quality_report(engine: Engine, table_name: str, rep: pd.DataFrame) -> None:
+    """品質チェック結果を run_at 付きで追記（テーブルが無ければ作成）"""
+    if not table_name or rep.empty:
+        return
+    out = rep.copy()
+    out.insert(0, "run_at", pd.Timestamp.now(tz="UTC").tz_localize(None))
+    with engine.begin() as conn:
+        out.to_sql(table_name, conn, if_exists="append", index=False)
+
+
+def acceptance_check(df: pd.DataFrame) -> pd.DataFrame:
+    rep = quality_report(df)
+    neg = int(rep["negatives"].sum())
+    holes_total = int(rep["gaps"].sum())
+    dups = int(rep["duplicates"].sum())
 
     print("=== Acceptance Check ===")
     print(f"y < 0 件数: {neg}")
-    print(f"連続日付の穴発生 menu_id 数: {holes_total}")
-    if neg == 0 and holes_total == 0:
+    print(f"連続日付の穴発生 menu_id 数: {int((rep['gaps'] > 0).sum())}（穴 {holes_total} 箇所）")
+    print(f"(menu_id, ds) の重複: {dups}")
+    print(f"外れ値: {int(rep['outliers'].sum())} 行 / 0 が {ZERO_RUN_DAYS} 日以上続く区間: {int(rep['zero_runs'].sum())}")
+    if neg == 0 and holes_total == 0 and dups == 0:
         print("OK: 任意の menu_id で 連続日付（穴なし） & y≥0 を満たしています。")
     else:
         print("NG: 条件を満たしていません。前処理/元データを確認してください。")
+    return rep
 
 
-def main():
-    args = parse_args()
+# ---------- 差分更新（--incremental） ----------
+def read_watermark(engine: Engine) -> Optional[date]:
+    WATERMARK_TABLE.create(engine, checkfirst=True)
+    with engine.connect() as conn:
+        v = conn.execute(select(WATERMARK_TABLE.c.value).where(WATERMARK_TABLE.c.name == WATERMARK_NAME)).scalar()
+    return date.fromisoformat(v) if v else None
+
+
+def write_watermark(conn: Connection, last_ds: date) -> None:
+    WATERMARK_TABLE.create(conn, checkfirst=True)
+    conn.execute(delete(WATERMARK_TABLE).where(WATERMARK_TABLE.c.name == WATERMARK_NAME))
+    conn.execute(insert(WATERMARK_TABLE).values(name=WATERMARK_NAME, value=last_ds.isoformat()))
+
+
+def train_table(engine: Engine, include_holiday: bool) -> Table:
+    """
+    menu_daily_train を反映して返す。無ければ (menu_id, ds) を主キーにして作る（alembic 20251024_02 と同じ列）。
+    既存テーブルに is_holiday が無く include_holiday なら列を足す。
+    """
+    md = MetaData()
+    if inspect(engine).has_table(TRAIN_TABLE):
+        t = Table(TRAIN_TABLE, md, autoload_with=engine)
+        if include_holiday and "is_holiday" not in t.c:
+            with engine.begin() as conn:
+                conn.execute(text(f"ALTER TABLE {TRAIN_TABLE} ADD COLUMN is_holiday INTEGER"))
+            t = Table(TRAIN_TABLE, MetaData(), autoload_with=engine)
+        return t
+    extra = [Column("is_holiday", Integer, nullable=True)] if include_holiday else []
+    t = Table(
+        TRAIN_TABLE, md,
+        Column("menu_id", Integer, primary_key=True),
+        Column("ds", Date, primary_key=True),
+        Column("y", Integer, nullable=False),
+        Column("dow", Integer, nullable=False),
+        Column("is_month_end", Boolean, nullable=False, server_default=text("false")),
+        *extra,
+    )
+    t.create(engine)
+    return t
+
+
+def _table_rows(t: Table, df: pd.DataFrame) -> List[dict]:
+    """テーブルにある列だけを、列の型に合わせて（Boolean は bool に）行の dict にする"""
+    cols = [c for c in t.columns if c.name in df.columns]
+    out = df[[c.name for c in cols]].astype(object)
+    for c in cols:
+        if isinstance(c.type, Boolean):
+            out[c.name] = out[c.name].map(bool)
+        elif c.name != "ds":
+            out[c.name] = out[c.name].map(int)
+    return out.to_dict("records")
+
+
+def upsert_train_rows(conn: Connection, t: Table, df: pd.DataFrame) -> None:
+    """(menu_id, ds) で upsert。主キーの無い旧テーブル（to_sql の replace 製）や他方言は範囲を消して入れ直す"""
+    rows = _table_rows(t, df)
+    if not rows:
+        return
+    dialect = conn.dialect.name
+    if dialect in ("sqlite", "postgresql") and {c.name for c in t.primary_key.columns} == {"menu_id", "ds"}:
+        if dialect == "sqlite":
+            from sqlalchemy.dialects.sqlite import insert as dialect_insert
+        else:
+            from sqlalchemy.dialects.postgresql import insert as dialect_insert
+        stmt = dialect_insert(t)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=["menu_id", "ds"],
+            set_={c: stmt.excluded[c] for c in rows[0] if c not in ("menu_id", "ds")},
+        )
+        conn.execute(stmt, rows)
+        return
+    conn.execute(delete(t).where(
+        t.c.menu_id.in_(sorted({r["menu_id"] for r in rows})),
+        t.c.ds >= df["ds"].min(), t.c.ds <= df["ds"].max(),
+    ))
+    conn.execute(insert(t), rows)
+
+
+def run_incremental(engine: Engine, args: argparse.Namespace, menu_ids: List[int]) -> pd.DataFrame:
+    """
+    watermark の late_days 日前以降だけを集計し直して upsert し、watermark を進める。書いた行を返す。
+    - watermark が無い / テーブルが空 のときは全期間（--start / --end も効く。テーブルは主キー付きで作る）
+    - テーブルにまだ無いメニュー（新メニュー）はテーブルの初日から埋める（全件作り直しと同じ結果にする）
+    """
+    t = train_table(engine, include_holiday=bool(args.holiday_csv))
+    wm = read_watermark(engine)
+    with engine.connect() as conn:
+        first_ds, known = conn.execute(select(func.min(t.c.ds), func.count(func.distinct(t.c.menu_id)))).one()
+        existing = set(conn.execute(select(t.c.menu_id).distinct()).scalars()) if known else set()
+
+    since = wm - timedelta(days=args.late_days) if (wm is not None and first_ds is not None) else None
+    agg = fetch_order_daily_agg(engine, chunk_rows=args.chunk_rows, since=since)
+
+    if since is None:
+        start_date, end_date = resolve_date_range(agg, args.start, args.end)
+        rows = build_train_rows(menu_ids, agg, start_date, end_date)
+    else:
+        default_end = max(pd.to_datetime(agg["ds"].max()).date(), wm) if not agg.empty else wm
+        end_date = pd.to_datetime(args.end).date() if args.end else default_end
+        old = [m for m in menu_ids if m in existing]
+        new = [m for m in menu_ids if m not in existing]
+        parts = [build_train_rows(old, agg, since, end_date)] if old and since <= end_date else []
+        if new:
+            first = pd.to_datetime(first_ds).date()
+            agg_new = fetch_order_daily_agg(engine, chunk_rows=args.chunk_rows, menu_ids=new)
+            parts.append(build_train_rows(new, agg_new, first, end_date))
+        rows = pd.concat(parts, ignore_index=True) if parts else build_train_rows([], agg, end_date, end_date)
+        print(f"[INFO] incremental: watermark={wm} since={since} end={end_date} new_menus={len(new)}")
+
+    rows = add_basic_features(rows, include_month_end=True, holiday_csv=args.holiday_csv)
+    with engine.begin() as conn:
+        upsert_train_rows(conn, t, rows)
+        if not rows.empty:
+            write_watermark(conn, max(rows["ds"]))
+    return rows
+
+
+def export_csv(engine: Engine, path: str, chunk_rows: int = AGG_CHUNK_ROWS) -> int:
+    """menu_daily_train 全件を CSV に（チャンクで書き出す）"""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    n = 0
+    with engine.connect() as conn:
+        sql = text(f"SELECT * FROM {TRAIN_TABLE} ORDER BY menu_id, ds")
+        for i, chunk in enumerate(pd.read_sql(sql, conn, chunksize=chunk_rows)):
+            chunk.to_csv(path, index=False, mode="w" if i == 0 else "a", header=(i == 0))
+            n += len(chunk)
+    return n
+
+
+def main(argv=None):
+    args = parse_args(argv)
     engine = get_engine(args.database_url)
 
     print(f"[INFO] DB: {args.database_url}")
-    print(f"[INFO] 出力CSV: {args.csv}")
-
     menu_ids = fetch_menu_ids(engine)
-    agg = fetch_order_daily_agg(engine)
+
+    if args.incremental:
+        out = run_incremental(engine, args, menu_ids.tolist())
+        if args.csv:
+            n = export_csv(engine, args.csv, args.chunk_rows)
+            print(f"[INFO] 出力CSV: {args.csv} ({n:,} 行)")
+        write_quality_report(engine, args.quality_table, acceptance_check(out))
+        print(f"\n[DONE] menu_daily_train {len(out):,} 行を upsert しました。")
+        return
+
+    csv_path = args.csv or DEFAULT_CSV
+    print(f"[INFO] 出力CSV: {csv_path}")
+
+    agg = fetch_order_daily_agg(engine, chunk_rows=args.chunk_rows)
     start_date, end_date = resolve_date_range(agg, args.start, args.end)
-    calendar = build_date_spine(start_date, end_date)
 
     # menu_id × 連続日付 の全組合せ
-    all_pairs = (
-        pd.MultiIndex.from_product(
-            [menu_ids.tolist(), calendar["ds"].tolist()],
-            names=["menu_id", "ds"]
-        ).to_frame(index=False)
-    )
-
-    # 左結合し欠損は 0（FutureWarning を回避して堅く数値化）
-    merged = all_pairs.merge(agg, on=["menu_id", "ds"], how="left")
-    merged["y"] = pd.to_numeric(merged["y"], errors="coerce").fillna(0)
-    merged.loc[merged["y"] < 0, "y"] = 0
-    merged["y"] = merged["y"].astype("int64")
+    merged = build_train_rows(menu_ids.tolist(), agg, start_date, end_date)
 
-    # 特徴量
+    # 特徴量（is_month_end は --incremental と揃えて常に作る。フラグは CSV の列だけ）
     merged = add_basic_features(
         merged,
-        include_month_end=args.include_month_end,
+        include_month_end=True,
         holiday_csv=args.holiday_csv,
     )
 
     # 保存（DB & CSV）
-    out = write_table(engine, merged)
-    os.makedirs(os.path.dirname(args.csv), exist_ok=True)
-    out.to_csv(args.csv, index=False)
+    out = write_table(engine, merged, end_date)
+    os.makedirs(os.path.dirname(csv_path), exist_ok=True)
+    (out if args.include_month_end else out.drop(columns="is_month_end")).to_csv(csv_path, index=False)
 
     # 受け入れチェック & サマリ
-    acceptance_check(out)
+    write_quality_report(engine, args.quality_table, acceptance_check(out))
     print("\n=== Summary ===")
     print(out.head(8).to_string(index=False))
     print(f"\n[DONE] menu_daily_train {len(out):,} 行を作成・保存しました。")
 
 
 if __name__ == "__main__":
-    sys.exit(main())
\ No newline at end of file
+    sys.exit(main())
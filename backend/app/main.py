@@ -10,6 +10,7 @@ from app.routers import analytics as analytics_router
 
 from app.database import Base, engine, SessionLocal
 from app.models import Menu, Order, OrderItem
+from app.services.order_events import broker as order_events
 
 app = FastAPI(title="Udon App API")
 
@@ -100,6 +101,12 @@ def _startup():
     _bootstrap_seed()
 
 
+@app.on_event("shutdown")
+def _shutdown():
+    # SSE (/orders/stream) の接続を閉じてワーカーの終了を妨げない
+    order_events.close()
+
+
 @app.get("/healthz")
 def healthz():
     return {"ok": True}
\ No newline at end of file
@@ -1,15 +1,31 @@
 # backend/app/ml/train_forecast.py
 import argparse
+import csv
+import hashlib
+import io
+import json
+import os
 import sys
 import warnings
+from dataclasses import dataclass
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
 import numpy as np
 import pandas as pd
-from sqlalchemy import create_engine, text
+from sqlalchemy import MetaData, Table, create_engine, delete, func, insert, inspect, select, text, update
 from sklearn.linear_model import Ridge, Lasso
 from sklearn.preprocessing import OneHotEncoder
 from sklearn.compose import ColumnTransformer
 from sklearn.pipeline import Pipeline
-from sklearn.metrics import mean_absolute_error
+
+# backend を sys.path に追加（python backend/app/ml/train_forecast.py で直接実行するため）
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+if BACKEND_DIR not in sys.path:
+    sys.path.append(BACKEND_DIR)
+
+from app.models import ForecastHyperparams, ForecastModelRegistry, MenuForecastState
+from app.services.calendar_features import calendar_for
+from app.services.forecast_models import BASELINE_SPECS, baseline_weights
 
 warnings.filterwarnings("ignore", category=FutureWarning)
 
@@ -21,41 +37,129 @@ except Exception:
     pass
 
 
-def _make_holiday_flag(dates: pd.Series) -> pd.Series:
-    try:
-        import holidays  # type: ignore
-        jp_holidays = holidays.country_holidays("JP")
-        return dates.apply(lambda d: 1 if pd.Timestamp(d).date() in jp_holidays else 0)
-    except Exception:
-        return pd.Series([0] * len(dates), index=dates.index)
+# -------- Dense history（メニュー × 日の実績行列） --------
+def dense_matrix(df: pd.DataFrame, menu_ids: list, start: pd.Timestamp, days: int, dtype=float) -> np.ndarray:
+    """(メニュー, 日) の実績行列。列 j は start + j 日。行が無い日は NaN"""
+    out = np.full((len(menu_ids), days), np.nan, dtype=dtype)
+    row = pd.Index(menu_ids).get_indexer(df["menu_id"])
+    col = ((df["ds"] - start) // pd.Timedelta(days=1)).to_numpy()
+    keep = (row >= 0) & (col >= 0) & (col < days)
+    out[row[keep], col[keep]] = df["y"].to_numpy(dtype=float)[keep]
+    return out
+
+
+@dataclass(frozen=True)
+class MenuSeries:
+    """1 メニュー分の連続した日次実績（DenseHistory の行のビュー。欠損日は NaN）"""
+    start: pd.Timestamp
+    values: np.ndarray
+
+    @property
+    def last_date(self) -> pd.Timestamp:
+        return self.start + pd.Timedelta(days=len(self.values) - 1)
+
+    def frame(self) -> pd.DataFrame:
+        """学習・予測関数に渡す (ds, y)。欠損日の行は作らない（menu_daily_train の行と同じ）"""
+        ok = ~np.isnan(self.values)
+        ds = pd.date_range(self.start, periods=len(self.values), freq="D")[ok]
+        return pd.DataFrame({"ds": ds, "y": self.values[ok].astype(float)})
+
+
+@dataclass(frozen=True)
+class DenseHistory:
+    """
+    menu_daily_train を 1 回だけ (メニュー, 日) の連続した float32 行列に並べたもの。
+    メニューごとの処理には行のビュー（MenuSeries）を渡し、DataFrame の絞り込み・コピーを繰り返さない。
+    ワーカープロセスへはそのメニューの行（float32 の配列 1 本）だけが送られる。
+    """
+    menu_ids: list
+    index: dict          # menu_id → 行番号
+    start: pd.Timestamp  # 列 0 の日付
+    y: np.ndarray        # (メニュー数, 日数) float32。行が無い日は NaN
+    first: np.ndarray    # 各メニューの最初 / 最後に実績のある列
+    last: np.ndarray
+
+    @classmethod
+    def from_frame(cls, df: pd.DataFrame) -> "DenseHistory":
+        menu_ids = sorted(int(m) for m in df["menu_id"].unique())
+        start = df["ds"].min().normalize()
+        days = (df["ds"].max().normalize() - start).days + 1
+        y = dense_matrix(df, menu_ids, start, days, dtype=np.float32)
+        has = ~np.isnan(y)
+        return cls(
+            menu_ids=menu_ids, index={m: i for i, m in enumerate(menu_ids)}, start=start, y=y,
+            first=has.argmax(axis=1), last=days - 1 - has[:, ::-1].argmax(axis=1),
+        )
+
+    @property
+    def last_date(self) -> pd.Timestamp:
+        return self.start + pd.Timedelta(days=self.y.shape[1] - 1)
+
+    def series(self, menu_id: int) -> MenuSeries:
+        i = self.index[menu_id]
+        a, b = int(self.first[i]), int(self.last[i])
+        return MenuSeries(self.start + pd.Timedelta(days=a), self.y[i, a:b + 1])
+
+    def window(self, menu_ids: list, dates: pd.DatetimeIndex) -> np.ndarray:
+        """menu_ids × dates の実績 (M, H)。範囲外の日は NaN"""
+        col = ((pd.DatetimeIndex(dates) - self.start) // pd.Timedelta(days=1)).to_numpy()
+        inside = (col >= 0) & (col < self.y.shape[1])
+        rows = self.y[[self.index[m] for m in menu_ids]]
+        return np.where(inside[None], rows[:, np.clip(col, 0, self.y.shape[1] - 1)], np.nan).astype(float)
+
+    def frame(self) -> pd.DataFrame:
+        """全メニューの縦持ち (menu_id, ds, y)。(menu_id, ds) 順（--global 用）"""
+        rows, cols = np.nonzero(~np.isnan(self.y))
+        return pd.DataFrame({
+            "menu_id": np.asarray(self.menu_ids, dtype=np.int64)[rows],
+            "ds": self.start + pd.to_timedelta(cols, unit="D"),
+            "y": self.y[rows, cols].astype(float),
+        })
 
 
 # -------- Baselines --------
-def baseline_naive_tminus7(train_df: pd.DataFrame, test_dates: pd.DatetimeIndex) -> pd.Series:
-    hist = train_df.set_index("ds")["y"]
-    return pd.Series([hist.get(d - pd.Timedelta(days=7), np.nan) for d in test_dates], index=test_dates)
+# 同じ曜日の過去 k 週（t-7, t-14, ...）の実績を集約する（種類は BASELINE_SPECS）。
+# 学習データに無い日（欠損・予測期間内）は使わない。メニュー × 日の密な行列に並べ、
+# 全メニュー × 全予測日を 1 回の配列演算で求める。
+
+def baseline_matrix(name: str, hist: np.ndarray, pos: np.ndarray) -> np.ndarray:
+    """
+    hist: (M, T) の実績行列（使わない日は NaN）, pos: 予測する日の列位置 (H,) → (M, H)。
+    遡れる実績が 1 つも無い日は NaN。
+    """
+    kind, k = BASELINE_SPECS[name]
+    lag = np.asarray(pos)[:, None] - 7 * np.arange(1, k + 1)[None, :]  # (H, k)
+    inside = (lag >= 0) & (lag < hist.shape[1])
+    vals = np.where(inside[None], hist[:, np.clip(lag, 0, hist.shape[1] - 1)], np.nan)  # (M, H, k)
+    ok = ~np.isnan(vals)
+    out = np.full(vals.shape[:2], np.nan)
+    if kind == "median":
+        has = ok.any(axis=2)
+        out[has] = np.nanmedian(vals[has], axis=1)
+        return out
+    w = np.asarray(baseline_weights(name))
+    den = ok.astype(float) @ w
+    np.divide(np.where(ok, vals, 0.0) @ w, den, out=out, where=den > 0)
+    return out
 
 
-def baseline_seasonal_ma(train_df: pd.DataFrame, test_dates: pd.DatetimeIndex, k: int = 2) -> pd.Series:
-    hist = train_df.set_index("ds")["y"]
-    out = []
-    for d in test_dates:
-        vals = []
-        for i in range(1, k + 1):
-            v = hist.get(d - pd.Timedelta(days=7 * i), np.nan)
-            if pd.notna(v): vals.append(v)
-        out.append(np.mean(vals) if vals else np.nan)
-    return pd.Series(out, index=test_dates)
+def baselines_for(name: str, train_df: pd.DataFrame, menu_ids: list, test_dates: pd.DatetimeIndex) -> np.ndarray:
+    """train_df（menu_id, ds, y）だけを履歴として menu_ids × test_dates のベースラインを一括で求める (M, H)"""
+    if name not in BASELINE_SPECS:
+        raise ValueError(name)
+    test_dates = pd.DatetimeIndex(test_dates)
+    if len(test_dates) == 0:
+        return np.empty((len(menu_ids), 0))
+    start = test_dates.min() - pd.Timedelta(days=7 * BASELINE_SPECS[name][1])
+    days = (test_dates.max() - start).days + 1
+    pos = ((test_dates - start) // pd.Timedelta(days=1)).to_numpy()
+    return baseline_matrix(name, dense_matrix(train_df, menu_ids, start, days), pos)
 
 
 def compute_baseline(name: str, train_df: pd.DataFrame, test_dates: pd.DatetimeIndex) -> pd.Series:
-    if name == "naive_tminus7":
-        return baseline_naive_tminus7(train_df, test_dates)
-    if name == "seasonal_ma_k2":
-        return baseline_seasonal_ma(train_df, test_dates, k=2)
-    if name == "seasonal_ma_k4":
-        return baseline_seasonal_ma(train_df, test_dates, k=4)
-    raise ValueError(name)
+    """1 メニュー分（train_df は 1 メニューの ds, y）"""
+    one = train_df[["ds", "y"]].assign(menu_id=0)
+    return pd.Series(baselines_for(name, one, [0], test_dates)[0], index=pd.DatetimeIndex(test_dates))
 
 
 # -------- ML (Prophet / sklearn) --------
@@ -83,205 +187,1140 @@ def fit_predict_prophet(train_df: pd.DataFrame, predict_dates: pd.DatetimeIndex)
     return out.set_index("ds").reindex(predict_dates).reset_index().rename(columns={"index": "ds"})
 
 
-def _build_sklearn_pipeline(model_name: str) -> Pipeline:
-    num_feats = [f"lag{i}" for i in range(1, 8)] + ["is_month_end", "holiday"]
-    cat_feats = ["dow"]
+N_LAGS = 7
+# --tune で探索していないときの正則化の強さ
+DEFAULT_ALPHA = {"ridge": 1.0, "lasso": 0.0005}
+
+
+def lag_feats(n_lags: int = N_LAGS) -> list[str]:
+    return [f"lag{i}" for i in range(1, n_lags + 1)]
+
+
+def feature_cols(n_lags: int = N_LAGS) -> list[str]:
+    return lag_feats(n_lags) + ["is_month_end", "holiday", "dow"]
+
+
+LAG_FEATS = lag_feats()
+FEATURE_COLS = feature_cols()
+
+
+def _hyper(model_name: str, params: dict | None) -> tuple[float, int]:
+    """params（{"alpha", "n_lags"}、--tune の結果）→ (alpha, ラグ日数)。無い値は既定値"""
+    params = params or {}
+    return float(params.get("alpha", DEFAULT_ALPHA[model_name])), int(params.get("n_lags", N_LAGS))
+
+
+def _build_sklearn_pipeline(model_name: str, cat_feats: tuple = ("dow",), params: dict | None = None) -> Pipeline:
+    if model_name not in DEFAULT_ALPHA:
+        raise ValueError(model_name)
+    alpha, n_lags = _hyper(model_name, params)
+    num_feats = lag_feats(n_lags) + ["is_month_end", "holiday"]
+    cat_feats = list(cat_feats)
     if model_name == "ridge":
-        base = Ridge(alpha=1.0, random_state=0)
-    elif model_name == "lasso":
-        base = Lasso(alpha=0.0005, random_state=0, max_iter=10000)
+        base = Ridge(alpha=alpha, random_state=0)
     else:
-        raise ValueError(model_name)
+        base = Lasso(alpha=alpha, random_state=0, max_iter=10000)
     pre = ColumnTransformer([("num", "passthrough", num_feats), ("cat", OneHotEncoder(handle_unknown="ignore"), cat_feats)])
     return Pipeline([("pre", pre), ("model", base)])
 
 
-def make_lag_features(df: pd.DataFrame) -> pd.DataFrame:
+def make_lag_features(df: pd.DataFrame, n_lags: int = N_LAGS) -> pd.DataFrame:
     out = df.sort_values("ds").copy()
-    for i in range(1, 8):
+    for i in range(1, n_lags + 1):
         out[f"lag{i}"] = out["y"].shift(i)
-    out["holiday"] = _make_holiday_flag(out["ds"])
+    cal = calendar_for(out["ds"])
+    out["holiday"] = cal["holiday"].to_numpy()
     if "is_month_end" not in out.columns:
-        out["is_month_end"] = out["ds"].dt.is_month_end.astype(int)
+        out["is_month_end"] = cal["is_month_end"].to_numpy()
     if "dow" not in out.columns:
-        out["dow"] = out["ds"].dt.dayofweek.astype(int)
+        out["dow"] = cal["dow"].to_numpy()
+    return out
+
+
+def calendar_features(dates: pd.DatetimeIndex) -> pd.DataFrame:
+    """予測期間全体のカレンダー特徴量を一括で作る（1 日ずつ作らない）"""
+    return calendar_for(dates)[["is_month_end", "holiday", "dow"]]
+
+
+def linear_artifact(pipe: Pipeline, model_name: str) -> dict:
+    """
+    学習済みの線形パイプラインを JSON にできる係数の dict にする（予測に sklearn が要らない）。
+        yhat = intercept + lag_w · (lag1..lagN) + is_month_end_w*月末 + holiday_w*祝日 + dow_w[曜日] (+ menu_w[menu_id])
+    """
+    pre, model = pipe.named_steps["pre"], pipe.named_steps["model"]
+    idx = {n: i for i, n in enumerate(pre.get_feature_names_out())}
+    coef = np.asarray(model.coef_, dtype=float)
+    n_lags = sum(1 for n in idx if n.startswith("num__lag"))
+    art = {
+        "kind": "linear",
+        "model": model_name,
+        "n_lags": n_lags,
+        "alpha": float(model.alpha),
+        "intercept": float(model.intercept_),
+        "lag_w": [float(coef[idx[f"num__{f}"]]) for f in lag_feats(n_lags)],
+        "is_month_end_w": float(coef[idx["num__is_month_end"]]),
+        "holiday_w": float(coef[idx["num__holiday"]]),
+        "dow_w": [0.0] * 7,  # 学習に出てこなかった曜日は 0（OneHotEncoder の ignore と同じ）
+    }
+    enc = pre.named_transformers_["cat"]
+    for feat, cats in zip(enc.feature_names_in_, enc.categories_):
+        weights = {int(c): float(coef[idx[f"cat__{feat}_{c}"]]) for c in cats}
+        if feat == "dow":
+            for d, w in weights.items():
+                art["dow_w"][d] = w
+        elif feat == "menu_id":
+            art["menu_w"] = {str(m): w for m, w in weights.items()}
+    return art
+
+
+def menu_artifact(art: dict, menu_id: int) -> dict:
+    """global モデルの artifact を 1 メニュー分に畳む（menu_w を切片に足す）"""
+    out = {k: v for k, v in art.items() if k != "menu_w"}
+    out["intercept"] = art["intercept"] + art.get("menu_w", {}).get(str(int(menu_id)), 0.0)
     return out
 
 
+def artifact_base(art: dict, cal: pd.DataFrame) -> np.ndarray:
+    """ラグ以外の項（切片＋カレンダー）を予測期間ぶんまとめて計算"""
+    return (
+        art["intercept"]
+        + art["is_month_end_w"] * cal["is_month_end"].to_numpy(dtype=float)
+        + art["holiday_w"] * cal["holiday"].to_numpy(dtype=float)
+        + np.asarray(art["dow_w"])[cal["dow"].to_numpy(dtype=int)]
+    )
+
+
+def predict_artifact(art: dict | None, train_df: pd.DataFrame, predict_dates: pd.DatetimeIndex) -> np.ndarray:
+    """保存済み artifact（linear / baseline）で予測。artifact が無ければ NaN。"""
+    if art is None:
+        return np.full(len(predict_dates), np.nan)
+    if art["kind"] == "baseline":
+        return compute_baseline(art["name"], train_df, predict_dates).to_numpy(dtype=float)
+    history = train_df.sort_values("ds")["y"].to_numpy(dtype=float)
+    return recursive_predict(artifact_base(art, calendar_features(predict_dates)), np.asarray(art["lag_w"]), history)
+
+
+def recursive_predict(base: np.ndarray, w: np.ndarray, history: np.ndarray) -> np.ndarray:
+    """
+    再帰予測。直近 N 日の窓を事前確保した配列上でずらすだけで、ステップごとの割り当てはない。
+    history が N 日に満たない分は NaN（= 予測も NaN）。
+    """
+    n, h = len(w), len(base)
+    buf = np.full(n + h, np.nan)
+    tail = np.asarray(history, dtype=float)[-n:]
+    buf[n - len(tail):n] = tail
+    w_chrono = w[::-1]  # 古い順（lagN..lag1）に並べた重み
+    for t in range(h):
+        buf[n + t] = base[t] + w_chrono @ buf[t:t + n]
+    return buf[n:]
+
+
+def _fit_sklearn(feat: pd.DataFrame, model_name: str, params: dict | None = None):
+    """make_lag_features 済みの行で学習。ラグが揃う行が 14 未満なら None。"""
+    cols = feature_cols(_hyper(model_name, params)[1])
+    feat = feat.dropna(subset=cols + ["y"])
+    if len(feat) < 14:
+        return None
+    pipe = _build_sklearn_pipeline(model_name, params=params)
+    pipe.fit(feat[cols], feat["y"].values)
+    return pipe
+
+
+def fit_sklearn_artifact(train_df: pd.DataFrame, model_name: str, params: dict | None = None) -> dict | None:
+    pipe = _fit_sklearn(make_lag_features(train_df, _hyper(model_name, params)[1]), model_name, params)
+    return linear_artifact(pipe, model_name) if pipe is not None else None
+
+
+def forecast_frame(predict_dates: pd.DatetimeIndex, yhat: np.ndarray, q: float | None = None) -> pd.DataFrame:
+    """q（予測区間の半幅）が無ければ lo = hi = yhat。下限は 0 で切る（数量なので）。"""
+    yhat = np.asarray(yhat, dtype=float)
+    if q is None:
+        lo = hi = yhat
+    else:
+        lo, hi = np.maximum(yhat - q, 0.0), yhat + q
+    return pd.DataFrame({"ds": predict_dates, "yhat": yhat, "yhat_lo": lo, "yhat_hi": hi})
+
+
+def artifact_forecast(art: dict | None, train_df: pd.DataFrame, predict_dates: pd.DatetimeIndex) -> pd.DataFrame:
+    """artifact で予測し、artifact に区間（interval.q）があれば lo/hi も付ける"""
+    q = (art or {}).get("interval", {}).get("q")
+    return forecast_frame(predict_dates, predict_artifact(art, train_df, predict_dates), q)
+
+
 def fit_predict_sklearn(train_df: pd.DataFrame, predict_dates: pd.DatetimeIndex, model_name: str) -> pd.DataFrame:
-    pipe = _build_sklearn_pipeline(model_name)
-    feat = make_lag_features(train_df).dropna().copy()
+    art = fit_sklearn_artifact(train_df, model_name)
+    return forecast_frame(predict_dates, predict_artifact(art, train_df, predict_dates))
+
+
+# -------- Global model（全メニュー共通の 1 モデル） --------
+GLOBAL_FEATURE_COLS = FEATURE_COLS + ["menu_id"]
+
+
+def make_global_lag_features(df: pd.DataFrame, n_lags: int = N_LAGS) -> pd.DataFrame:
+    """全メニュー分のラグ特徴量を一括で作る（menu_id ごとに shift）"""
+    out = df.sort_values(["menu_id", "ds"]).reset_index(drop=True)
+    g = out.groupby("menu_id", sort=False)["y"]
+    for i in range(1, n_lags + 1):
+        out[f"lag{i}"] = g.shift(i)
+    cal = calendar_for(out["ds"])
+    out["holiday"] = cal["holiday"].to_numpy()
+    if "is_month_end" not in out.columns:
+        out["is_month_end"] = cal["is_month_end"].to_numpy()
+    if "dow" not in out.columns:
+        out["dow"] = cal["dow"].to_numpy()
+    return out
+
+
+def _fit_global(feat: pd.DataFrame, model_name: str, params: dict | None = None):
+    cols = feature_cols(_hyper(model_name, params)[1])
+    feat = feat.dropna(subset=cols + ["y"])
     if len(feat) < 14:
-        yhat = pd.Series([np.nan] * len(predict_dates), index=predict_dates)
-        return pd.DataFrame({"ds": predict_dates, "yhat": yhat.values, "yhat_lo": yhat.values, "yhat_hi": yhat.values})
-
-    X = feat[[f"lag{i}" for i in range(1, 8)] + ["is_month_end", "holiday", "dow"]]
-    y = feat["y"].values
-    pipe.fit(X, y)
-
-    hist = train_df.set_index("ds")[["y"]].copy()
-    hist["is_month_end"] = hist.index.is_month_end.astype(int)
-    hist["dow"] = hist.index.dayofweek.astype(int)
-    hist["holiday"] = _make_holiday_flag(pd.Series(hist.index))
-
-    preds = []
-    rolling = hist.copy()
-    for d in predict_dates:
-        last7 = [rolling.iloc[-i]["y"] if len(rolling) >= i else np.nan for i in range(1, 8)]
-        row = {**{f"lag{i}": last7[i - 1] for i in range(1, 8)},
-               "is_month_end": int(pd.Timestamp(d).is_month_end),
-               "holiday": int(_make_holiday_flag(pd.Series([d])).iloc[0]),
-               "dow": int(pd.Timestamp(d).dayofweek)}
-        yhat = float(pipe.predict(pd.DataFrame([row]))[0])
-        preds.append(yhat)
-        rolling.loc[pd.Timestamp(d), ["y", "is_month_end", "dow", "holiday"]] = [yhat, row["is_month_end"], row["dow"], row["holiday"]]
-
-    yhat = pd.Series(preds, index=predict_dates)
-    return pd.DataFrame({"ds": predict_dates, "yhat": yhat.values, "yhat_lo": yhat.values, "yhat_hi": yhat.values})
+        return None
+    pipe = _build_sklearn_pipeline(model_name, cat_feats=("dow", "menu_id"), params=params)
+    pipe.fit(feat[cols + ["menu_id"]], feat["y"].values)
+    return pipe
+
+
+def _history_tails(df: pd.DataFrame, menu_ids: list, n_lags: int = N_LAGS) -> np.ndarray:
+    """
+    (メニュー数, n_lags) の直近履歴（古い順）。
+    n_lags 日に満たない新メニューは手元の平均で埋める（履歴 0 日なら NaN）。
+    """
+    tails = np.full((len(menu_ids), n_lags), np.nan)
+    pos = {m: i for i, m in enumerate(menu_ids)}
+    last = df.sort_values("ds").groupby("menu_id")["y"].apply(lambda s: s.to_numpy(dtype=float)[-n_lags:])
+    for mid, vals in last.items():
+        if mid not in pos or len(vals) == 0:
+            continue
+        row = tails[pos[mid]]
+        row[:] = vals.mean()
+        row[n_lags - len(vals):] = vals
+    return tails
+
+
+def recursive_predict_batch(base: np.ndarray, w: np.ndarray, tails: np.ndarray) -> np.ndarray:
+    """recursive_predict の全メニュー同時版。base: (M, H), tails: (M, N) → (M, H)"""
+    m, h = base.shape
+    n = len(w)
+    buf = np.empty((m, n + h))
+    buf[:, :n] = tails
+    w_chrono = w[::-1]
+    for t in range(h):
+        buf[:, n + t] = base[:, t] + buf[:, t:t + n] @ w_chrono
+    return buf[:, n:]
+
+
+def predict_global(art: dict, history: pd.DataFrame, predict_dates: pd.DatetimeIndex, menu_ids: list) -> pd.DataFrame:
+    """全メニュー × 全予測日を（共通のカレンダー項 ＋ メニュー切片）と行列の再帰で求める"""
+    h, m = len(predict_dates), len(menu_ids)
+    menu_w = art.get("menu_w", {})
+    offsets = np.array([menu_w.get(str(int(mid)), 0.0) for mid in menu_ids])
+    base = artifact_base(art, calendar_features(predict_dates))[None, :] + offsets[:, None]
+    w = np.asarray(art["lag_w"])
+    yhat = recursive_predict_batch(base, w, _history_tails(history, menu_ids, len(w))).ravel()
+    return pd.DataFrame({
+        "menu_id": np.repeat(menu_ids, h),
+        "ds": np.tile(predict_dates.to_numpy(), m),
+        "yhat": yhat, "yhat_lo": yhat, "yhat_hi": yhat,
+    })
+
+
+def fit_global_artifact(train_df: pd.DataFrame, model_name: str, params: dict | None = None) -> dict | None:
+    pipe = _fit_global(make_global_lag_features(train_df, _hyper(model_name, params)[1]), model_name, params)
+    return linear_artifact(pipe, f"global_{model_name}") if pipe is not None else None
+
+
+# fit_predict_global の art 省略時（学習する）。学習に失敗した None を渡されたら学習し直さない
+_FIT = object()
+
+
+def fit_predict_global(train_df: pd.DataFrame, predict_dates: pd.DatetimeIndex, model_name: str,
+                       menu_ids: list | None = None, art=_FIT,
+                       params: dict | None = None) -> pd.DataFrame:
+    """
+    全メニューを 1 回で学習・予測。columns: menu_id, ds, yhat, yhat_lo, yhat_hi
+    art を渡すとそれで予測だけする（None なら全部 NaN）。
+    """
+    menu_ids = sorted(train_df["menu_id"].unique().tolist()) if menu_ids is None else list(menu_ids)
+    if art is _FIT:
+        art = fit_global_artifact(train_df, model_name, params)
+    if art is None:
+        nan = np.full(len(menu_ids) * len(predict_dates), np.nan)
+        return pd.DataFrame({"menu_id": np.repeat(menu_ids, len(predict_dates)),
+                             "ds": np.tile(predict_dates.to_numpy(), len(menu_ids)),
+                             "yhat": nan, "yhat_lo": nan, "yhat_hi": nan})
+    return predict_global(art, train_df, predict_dates, menu_ids)
 
 
 # -------- Backtest --------
-def single_split_backtest(model_kind: str, baseline_name: str, df_one: pd.DataFrame, horizon: int) -> dict:
-    if len(df_one) < horizon + 14:
-        return {"mae_ml": np.inf, "mae_base": np.inf, "win": False}
-    df_one = df_one.sort_values("ds")
-    cutoff = df_one["ds"].max() - pd.Timedelta(days=horizon)
-    train = df_one[df_one["ds"] <= cutoff].copy()
-    test = df_one[(df_one["ds"] > cutoff) & (df_one["ds"] <= cutoff + pd.Timedelta(days=horizon))].copy()
-    test_dates = pd.DatetimeIndex(test["ds"])
+# 予測区間の既定の被覆率（--coverage）
+DEFAULT_COVERAGE = 0.8
+_NO_STATS = {"mae": np.inf, "mape": np.nan, "bias": np.nan, "q": None}
+
+
+def conformal_halfwidth(abs_resid: np.ndarray, coverage: float) -> float | None:
+    """
+    split conformal：|残差| の ceil((n+1)·coverage) 番目の値を区間の半幅にする。
+    残差が少なくてその順位が n を超えるときは最大値で代用（被覆の保証は弱くなる）。
+    """
+    r = np.sort(abs_resid[np.isfinite(abs_resid)])
+    if len(r) == 0:
+        return None
+    k = int(np.ceil((len(r) + 1) * coverage))
+    return float(r[min(k, len(r)) - 1])
+
+
+def _error_stats(y: np.ndarray, yhat: np.ndarray, coverage: float = DEFAULT_COVERAGE) -> dict:
+    """MAE / MAPE（y>0 の日のみ, %） / bias（平均の yhat - y） / q（予測区間の半幅）"""
+    if len(y) == 0 or np.isnan(yhat).any():
+        return dict(_NO_STATS)
+    e = yhat - y
+    pos = y > 0
+    return {
+        "mae": float(np.abs(e).mean()),
+        "mape": float((np.abs(e[pos]) / y[pos]).mean() * 100) if pos.any() else np.nan,
+        "bias": float(e.mean()),
+        "q": conformal_halfwidth(np.abs(e), coverage),
+    }
+
+
+def _fold_masks(df_one: pd.DataFrame, cutoff: pd.Timestamp, horizon: int) -> tuple[np.ndarray, np.ndarray]:
+    in_train = (df_one["ds"] <= cutoff).to_numpy()
+    in_test = ((df_one["ds"] > cutoff) & (df_one["ds"] <= cutoff + pd.Timedelta(days=horizon))).to_numpy()
+    return in_train, in_test
+
 
-    yhat_base = compute_baseline(baseline_name, train, test_dates)
-    mae_base = mean_absolute_error(test["y"].values, yhat_base.values)
+def _fold_predict_sklearn(model_kind: str, df_one: pd.DataFrame, feat: pd.DataFrame,
+                          in_train: np.ndarray, in_test: np.ndarray, params: dict | None = None) -> np.ndarray:
+    """cutoff までで学習し、テスト期間を再帰予測（学習できなければ NaN）"""
+    # ラグは過去の y しか参照しないので、全期間の特徴量を切り出してもリークしない
+    pipe = _fit_sklearn(feat[in_train], model_kind, params)
+    if pipe is None:
+        return np.full(int(in_test.sum()), np.nan)
+    art = linear_artifact(pipe, model_kind)
+    test_cal = feat.loc[in_test, ["is_month_end", "holiday", "dow"]]
+    history = df_one.loc[in_train, "y"].to_numpy(dtype=float)
+    return recursive_predict(artifact_base(art, test_cal), np.asarray(art["lag_w"]), history)
 
+
+def _backtest_fold(model_kind: str, baseline_name: str, df_one: pd.DataFrame, feat: pd.DataFrame,
+                   cutoff: pd.Timestamp, horizon: int, params: dict | None = None):
+    """1 fold 分の (y, yhat_ml, yhat_base)。特徴量は全期間で作った feat を cutoff で切って使う。"""
+    in_train, in_test = _fold_masks(df_one, cutoff, horizon)
+    train = df_one[in_train]
+    test_dates = pd.DatetimeIndex(df_one.loc[in_test, "ds"])
+    y = df_one.loc[in_test, "y"].to_numpy(dtype=float)
+
+    yhat_base = compute_baseline(baseline_name, train, test_dates).to_numpy(dtype=float)
     if model_kind == "prophet":
-        yhat_ml_df = fit_predict_prophet(train, test_dates)
-        yhat_ml = yhat_ml_df["yhat"]
+        yhat_ml = fit_predict_prophet(train, test_dates)["yhat"].to_numpy(dtype=float)
+    else:
+        yhat_ml = _fold_predict_sklearn(model_kind, df_one, feat, in_train, in_test, params)
+    return y, yhat_ml, yhat_base
+
+
+def backtest_cutoffs(df_one: pd.DataFrame, horizon: int, folds: int, step: int | None = None,
+                     min_train: int = N_LAGS + 14) -> list[pd.Timestamp]:
+    """cutoff = 最終日 - horizon - k*step（k=0..folds-1）のうち、学習に min_train 日以上あるもの（新しい順）"""
+    step = step or horizon
+    last = df_one["ds"].max()
+    cutoffs = []
+    for k in range(folds):
+        cutoff = last - pd.Timedelta(days=horizon + k * step)
+        if int((df_one["ds"] <= cutoff).sum()) >= min_train:
+            cutoffs.append(cutoff)
+    return cutoffs
+
+
+def rolling_origin_backtest(model_kind: str, baseline_name: str, df_one: pd.DataFrame, horizon: int,
+                            folds: int = 3, step: int | None = None, workers: int = 1,
+                            coverage: float = DEFAULT_COVERAGE, params: dict | None = None) -> dict:
+    """
+    ローリング起点のバックテスト。cutoff = 最終日 - horizon - k*step（k=0..folds-1）。
+    学習データが足りない fold は捨て、残りの fold の誤差をまとめて MAE/MAPE/bias と区間の半幅 q を出す。
+    """
+    df_one = df_one.sort_values("ds").reset_index(drop=True)
+    n_lags = _hyper(model_kind, params)[1] if model_kind != "prophet" else N_LAGS
+    cutoffs = backtest_cutoffs(df_one, horizon, folds, step, max(n_lags, N_LAGS) + 14)
+    if len(df_one) < horizon + 14 or not cutoffs:
+        return _backtest_result(_NO_STATS, _NO_STATS, 0)
+
+    feat = make_lag_features(df_one, n_lags) if model_kind != "prophet" else None
+
+    def _run(cutoff):
+        return _backtest_fold(model_kind, baseline_name, df_one, feat, cutoff, horizon, params)
+
+    if workers > 1 and len(cutoffs) > 1:
+        # fold は独立。sklearn/numpy の計算は GIL を離すのでスレッドで足りる（メニュー単位のプロセス並列と併用可）
+        with ThreadPoolExecutor(max_workers=workers) as ex:
+            parts = list(ex.map(_run, cutoffs))
+    else:
+        parts = [_run(c) for c in cutoffs]
+
+    y = np.concatenate([p[0] for p in parts])
+    ml = _error_stats(y, np.concatenate([p[1] for p in parts]), coverage)
+    base = _error_stats(y, np.concatenate([p[2] for p in parts]), coverage)
+    return _backtest_result(ml, base, len(cutoffs))
+
+
+def _backtest_result(ml: dict, base: dict, folds: int) -> dict:
+    return {
+        "mae_ml": ml["mae"], "mae_base": base["mae"], "win": bool(ml["mae"] <= base["mae"]) and folds > 0,
+        "mape_ml": ml["mape"], "mape_base": base["mape"],
+        "bias_ml": ml["bias"], "bias_base": base["bias"],
+        "q_ml": ml["q"], "q_base": base["q"],
+        "folds": folds,
+    }
+
+
+def with_interval(art: dict | None, q: float | None, coverage: float) -> dict | None:
+    """バックテストの残差から求めた区間の半幅を artifact に持たせる（再利用・オンライン推論でも使う）"""
+    if art is None or q is None:
+        return art
+    return {**art, "interval": {"coverage": coverage, "q": q}}
+
+
+def single_split_backtest(model_kind: str, baseline_name: str, df_one: pd.DataFrame, horizon: int) -> dict:
+    """直近 horizon 日だけで比べる旧来の判定（= 1 fold のローリング起点）"""
+    return rolling_origin_backtest(model_kind, baseline_name, df_one, horizon, folds=1)
+
+
+def global_backtest(model_kind: str, baseline_name: str, df: pd.DataFrame, horizon: int, menu_ids: list,
+                    folds: int = 3, step: int | None = None, workers: int = 1,
+                    coverage: float = DEFAULT_COVERAGE, params: dict | None = None) -> dict:
+    """
+    global モデル版のローリング起点バックテスト。fold ごとに 1 回だけ学習し、全メニューをまとめて予測する。
+    戻り値: {menu_id: rolling_origin_backtest と同じ形の dict}
+    """
+    step = step or horizon
+    last = df["ds"].max()
+    feat = make_global_lag_features(df, _hyper(model_kind, params)[1])
+    dense = DenseHistory.from_frame(df)
+
+    def _run(k):
+        cutoff = last - pd.Timedelta(days=horizon + k * step)
+        pipe = _fit_global(feat[feat["ds"] <= cutoff], model_kind, params)
+        if pipe is None:
+            return {}
+        test_dates = pd.date_range(cutoff + pd.Timedelta(days=1), periods=horizon, freq="D")
+        train = df[df["ds"] <= cutoff]
+        mids = [m for m in menu_ids if m in dense.index and dense.series(m).start <= cutoff]
+        if not mids:
+            return {}
+        fc = predict_global(linear_artifact(pipe, model_kind), train, test_dates, mids)
+        yhat = fc["yhat"].to_numpy().reshape(len(mids), horizon)
+        base = baselines_for(baseline_name, train, mids, test_dates)
+        actual = dense.window(mids, test_dates)
+        out = {}
+        for i, mid in enumerate(mids):
+            ok = ~np.isnan(actual[i])
+            if ok.any():
+                out[mid] = (actual[i][ok], yhat[i][ok], base[i][ok])
+        return out
+
+    if workers > 1 and folds > 1:
+        with ThreadPoolExecutor(max_workers=workers) as ex:
+            parts = list(ex.map(_run, range(folds)))
     else:
-        yhat_ml_df = fit_predict_sklearn(train, test_dates, model_kind)
-        yhat_ml = yhat_ml_df["yhat"]
+        parts = [_run(k) for k in range(folds)]
 
-    mae_ml = mean_absolute_error(test["y"].values, yhat_ml.values)
-    return {"mae_ml": mae_ml, "mae_base": mae_base, "win": bool(mae_ml <= mae_base)}
+    results = {}
+    for mid in menu_ids:
+        got = [p[mid] for p in parts if mid in p]
+        if not got:
+            results[mid] = _backtest_result(_NO_STATS, _NO_STATS, 0)
+            continue
+        y = np.concatenate([g[0] for g in got])
+        results[mid] = _backtest_result(
+            _error_stats(y, np.concatenate([g[1] for g in got]), coverage),
+            _error_stats(y, np.concatenate([g[2] for g in got]), coverage),
+            len(got),
+        )
+    return results
+
+
+def save_backtest_results(engine, table: str, results: list[dict], args) -> None:
+    """メニューごとのバックテスト結果を追記（テーブルが無ければ作成）"""
+    if not results:
+        return
+    out = pd.DataFrame(results)
+    out.insert(0, "run_at", pd.Timestamp.now(tz="UTC").tz_localize(None))
+    out["model"] = args.model
+    out["baseline"] = args.baseline
+    out["horizon"] = args.horizon
+    out["win"] = out["win"].astype(int)
+    cols = ["run_at", "menu_id", "model", "baseline", "horizon", "folds",
+            "mae_ml", "mape_ml", "bias_ml", "mae_base", "mape_base", "bias_base", "win"]
+    # to_sql は inf を書けないので NULL に
+    out = out[cols].replace([np.inf, -np.inf], np.nan)
+    with engine.begin() as conn:
+        out.to_sql(table, conn, if_exists="append", index=False)
 
 
 # -------- Save (schema-aware) --------
-def _table_columns(conn, table: str) -> list[str]:
-    rows = conn.execute(text(f"PRAGMA table_info({table})")).mappings().all()
-    return [r["name"] for r in rows]
+FORECAST_KEY = ["menu_id", "ds", "model"]
+# PostgreSQL でこの行数を超えたら COPY → 一時テーブル → upsert にする
+COPY_THRESHOLD = 5000
+
+
+def _forecast_rows(cols: list[str], items: list[tuple]) -> list[dict]:
+    """items → 挿入行（lo/hi が無い・欠損なら yhat で埋める。テーブルに無い列は出さない）"""
+    has_lo, has_hi = "yhat_lo" in cols, "yhat_hi" in cols
+    rows = []
+    for menu_id, df_fcst, model_name in items:
+        yhat = df_fcst["yhat"].to_numpy(dtype=float)
+        lo = df_fcst["yhat_lo"].to_numpy(dtype=float) if "yhat_lo" in df_fcst.columns else yhat
+        hi = df_fcst["yhat_hi"].to_numpy(dtype=float) if "yhat_hi" in df_fcst.columns else yhat
+        lo, hi = np.where(np.isnan(lo), yhat, lo), np.where(np.isnan(hi), yhat, hi)
+        for i, d in enumerate(pd.DatetimeIndex(df_fcst["ds"]).date):
+            row = {"menu_id": int(menu_id), "ds": d, "model": model_name,
+                   "yhat": None if np.isnan(yhat[i]) else float(yhat[i])}
+            if has_lo: row["yhat_lo"] = None if np.isnan(lo[i]) else float(lo[i])
+            if has_hi: row["yhat_hi"] = None if np.isnan(hi[i]) else float(hi[i])
+            rows.append(row)
+    return rows
+
+
+def _dialect_insert(dialect: str):
+    if dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+    else:
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+    return dialect_insert
+
+
+def _upsert_stmt(table: Table, dialect: str):
+    """(menu_id, ds, model) で衝突したら値と trained_at を更新する INSERT"""
+    stmt = _dialect_insert(dialect)(table)
+    set_ = {c.name: stmt.excluded[c.name] for c in table.c if c.name in ("yhat", "yhat_lo", "yhat_hi")}
+    if "trained_at" in table.c:
+        set_["trained_at"] = func.current_timestamp()
+    return stmt.on_conflict_do_update(index_elements=[table.c[k] for k in FORECAST_KEY], set_=set_)
+
+
+def _copy_upsert_pg(conn, table: Table, rows: list[dict]) -> None:
+    """PostgreSQL: COPY で一時テーブルに流し込み、INSERT ... SELECT ... ON CONFLICT で反映"""
+    cols = list(rows[0].keys())
+    buf = io.StringIO()
+    csv.writer(buf).writerows([[("" if r[c] is None else r[c]) for c in cols] for r in rows])
+    buf.seek(0)
+    col_list = ", ".join(cols)
+    updates = [f"{c} = EXCLUDED.{c}" for c in cols if c in ("yhat", "yhat_lo", "yhat_hi")]
+    if "trained_at" in table.c:
+        updates.append("trained_at = CURRENT_TIMESTAMP")
+    conn.execute(text(f"CREATE TEMP TABLE _fcst_stage (LIKE {table.name} INCLUDING DEFAULTS) ON COMMIT DROP"))
+    with conn.connection.driver_connection.cursor() as cur:
+        cur.copy_expert(f"COPY _fcst_stage ({col_list}) FROM STDIN WITH (FORMAT csv)", buf)
+    conn.execute(text(
+        f"INSERT INTO {table.name} ({col_list}) SELECT {col_list} FROM _fcst_stage "
+        f"ON CONFLICT ({', '.join(FORECAST_KEY)}) DO UPDATE SET {', '.join(updates)}"
+    ))
+
+
+def _delete_insert(conn, table: Table, rows: list[dict]) -> None:
+    """主キーが (menu_id, ds, model) でないテーブル向け：既存行を消してから入れ直す"""
+    keys = {(r["menu_id"], r["model"]) for r in rows}
+    for menu_id, model_name in keys:
+        ds = [r["ds"] for r in rows if r["menu_id"] == menu_id and r["model"] == model_name]
+        conn.execute(delete(table).where(table.c.menu_id == menu_id, table.c.model == model_name, table.c.ds.in_(ds)))
+    conn.execute(insert(table), rows)
 
 
 def save_forecast(engine, table_forecast: str, menu_id: int, df_fcst: pd.DataFrame, model_name: str):
     """df_fcst columns: ds, yhat, yhat_lo, yhat_hi（lo/hiは存在しない場合もあり得るが、この関数で吸収）"""
-    if df_fcst.empty:
+    save_forecasts(engine, table_forecast, [(menu_id, df_fcst, model_name)])
+
+
+def save_forecasts(engine, table_forecast: str, items: list[tuple]):
+    """
+    items: [(menu_id, df_fcst, model_name), ...] を 1 トランザクション・1 文で upsert。
+    スキーマは SQLAlchemy の inspect で読むので SQLite / PostgreSQL の両方で動く。
+    """
+    if not items:
         return
-    # 万一 lo/hi が無い場合は yhat で埋める
-    for c in ("yhat_lo", "yhat_hi"):
-        if c not in df_fcst.columns:
-            df_fcst[c] = df_fcst["yhat"]
+    with engine.begin() as conn:
+        table = Table(table_forecast, MetaData(), autoload_with=conn)
+        rows = _forecast_rows([c.name for c in table.c], items)
+        if not rows:
+            return
+        dialect = conn.dialect.name
+        pk = set(inspect(conn).get_pk_constraint(table_forecast).get("constrained_columns") or [])
+        if dialect not in ("sqlite", "postgresql") or pk != set(FORECAST_KEY):
+            _delete_insert(conn, table, rows)
+        elif dialect == "postgresql" and len(rows) > COPY_THRESHOLD:
+            _copy_upsert_pg(conn, table, rows)
+        else:
+            conn.execute(_upsert_stmt(table, dialect), rows)
+
+
+# -------- Incremental（入力が変わったメニューだけ学習し直す） --------
+STATE_TABLE = MenuForecastState.__table__
+REGISTRY_TABLE = ForecastModelRegistry.__table__
+# この設定が変わったら全メニュー学習し直す（horizon は学習に影響しないので含めない）
+CONFIG_ARGS = ("baseline", "min_history", "folds", "fold_step", "coverage")
+
+
+def config_name(args) -> str:
+    return f"global_{args.model}" if args.global_model else args.model
+
+
+def config_hash(args, params: dict | None = None) -> str:
+    """params はそのメニューのハイパーパラメータ（--tune の結果）。変われば学習し直す"""
+    cfg = {k: getattr(args, k) for k in CONFIG_ARGS}
+    cfg.update(model=config_name(args), n_lags=N_LAGS)
+    if params:
+        cfg.update(alpha=float(params["alpha"]), n_lags=int(params["n_lags"]))
+    return hashlib.sha1(json.dumps(cfg, sort_keys=True).encode()).hexdigest()
+
+
+def menu_fingerprints(hist: DenseHistory) -> dict[int, dict]:
+    """メニューごとの 行数 / 最終日 / 内容ハッシュ（初日 ＋ 行列の行のバイト列）"""
+    out = {}
+    for mid in hist.menu_ids:
+        s = hist.series(mid)
+        out[mid] = {
+            "data_hash": hashlib.sha1(s.start.date().isoformat().encode() + s.values.tobytes()).hexdigest(),
+            "data_rows": int((~np.isnan(s.values)).sum()),
+            "data_max_ds": s.last_date.date(),
+        }
+    return out
+
+
+def load_states(engine, config: str) -> dict[int, dict]:
+    STATE_TABLE.create(engine, checkfirst=True)
+    with engine.connect() as conn:
+        rows = conn.execute(select(STATE_TABLE).where(STATE_TABLE.c.config == config)).mappings().all()
+    return {int(r["menu_id"]): dict(r) for r in rows}
+
 
+def plan_incremental(menu_ids: list, states: dict, fps: dict, cfg_hashes: dict[int, str],
+                     predict_dates: pd.DatetimeIndex, horizon: int, force: tuple = ()) -> tuple[list, list, list]:
+    """
+    (学習し直す, 保存済みモデルで予測だけやり直す, 何もしない) に振り分ける。
+    cfg_hashes は {menu_id: config_hash}。force のメニューは必ず学習し直す。
+    """
+    train, reuse, unchanged = [], [], []
+    start = predict_dates[0].date()
+    for mid in menu_ids:
+        st = states.get(mid)
+        if (mid in force or st is None
+                or st["config_hash"] != cfg_hashes[mid] or st["data_hash"] != fps[mid]["data_hash"]):
+            train.append(mid)
+        elif st["forecast_start"] == start and st["horizon"] == horizon:
+            unchanged.append(mid)
+        elif st["model_version"] is not None:
+            reuse.append(mid)
+        else:
+            train.append(mid)  # prophet は保存していないので学習し直す
+    return train, reuse, unchanged
+
+
+def _upsert_by_key(conn, table: Table, rows: list[dict], key: tuple, stamp: str) -> None:
+    """key 列で upsert し、stamp 列を現在時刻にする（ON CONFLICT の無い方言は delete → insert）"""
+    if conn.dialect.name in ("sqlite", "postgresql"):
+        stmt = _dialect_insert(conn.dialect.name)(table)
+        set_ = {c: stmt.excluded[c] for c in rows[0] if c not in key}
+        set_[stamp] = func.current_timestamp()
+        conn.execute(stmt.on_conflict_do_update(index_elements=list(key), set_=set_), rows)
+    else:
+        for r in rows:
+            conn.execute(delete(table).where(*(table.c[k] == r[k] for k in key)))
+        conn.execute(insert(table), rows)
+
+
+def save_states(engine, config: str, rows: list[dict], clear: list = ()) -> None:
+    """
+    学習したメニューの状態を upsert（trained_at も更新）。
+    clear は学習を試みたが保存しなかったメニュー。古い状態が残ると次の --incremental が古いモデルを使うので消す。
+    """
+    clear = sorted(set(clear) - {r["menu_id"] for r in rows})
+    if not rows and not clear:
+        return
+    STATE_TABLE.create(engine, checkfirst=True)
     with engine.begin() as conn:
-        cols = _table_columns(conn, table_forecast)
-        has_lo = "yhat_lo" in cols
-        has_hi = "yhat_hi" in cols
-
-        # 既存削除（同 menu_id × ds × model）
-        placeholders = ",".join([f":ds{i}" for i in range(len(df_fcst))])
-        del_params = {"menu_id": menu_id, "model": model_name}
-        del_params.update({f"ds{i}": pd.Timestamp(d).date() for i, d in enumerate(df_fcst["ds"])})
-        conn.execute(text(f"""
-            DELETE FROM {table_forecast}
-             WHERE menu_id = :menu_id
-               AND model   = :model
-               AND ds IN ({placeholders})
-        """), del_params)
-
-        # 挿入カラムをスキーマに合わせて構築
-        base_cols = ["menu_id", "ds", "yhat", "model"]
-        insert_cols = base_cols + (["yhat_lo"] if has_lo else []) + (["yhat_hi"] if has_hi else [])
-        values_clause = "(" + ", ".join([f":{c}" for c in insert_cols]) + ")"
-
-        rows = []
-        for r in df_fcst.itertuples(index=False):
-            row = {
-                "menu_id": menu_id,
-                "ds": pd.Timestamp(r.ds).date(),
-                "yhat": float(r.yhat) if pd.notna(r.yhat) else None,
-                "model": model_name,
-            }
-            if has_lo: row["yhat_lo"] = float(r.yhat_lo) if pd.notna(r.yhat_lo) else float(r.yhat) if pd.notna(r.yhat) else None
-            if has_hi: row["yhat_hi"] = float(r.yhat_hi) if pd.notna(r.yhat_hi) else float(r.yhat) if pd.notna(r.yhat) else None
-            rows.append(row)
+        if clear:
+            conn.execute(delete(STATE_TABLE).where(STATE_TABLE.c.config == config, STATE_TABLE.c.menu_id.in_(clear)))
+        if rows:
+            _upsert_by_key(conn, STATE_TABLE, rows, ("menu_id", "config"), "trained_at")
+
+
+def _json_safe(d: dict | None) -> dict | None:
+    """inf / NaN は JSON に書けないので None に"""
+    if d is None:
+        return None
+    return {k: (None if isinstance(v, float) and not np.isfinite(v) else v) for k, v in d.items()}
+
+
+def register_models(engine, config: str, items: list[dict]) -> dict[int, int]:
+    """
+    学習したモデルを forecast_model_registry に新しい版として追加し、{menu_id: version} を返す。
+    items: [{"menu_id", "model", "artifact", "metrics", "data_max_ds"}, ...]（artifact が None のものは登録しない）
+    """
+    items = [it for it in items if it["artifact"] is not None]
+    if not items:
+        return {}
+    REGISTRY_TABLE.create(engine, checkfirst=True)
+    ids = [it["menu_id"] for it in items]
+    with engine.begin() as conn:
+        cur = dict(conn.execute(
+            select(REGISTRY_TABLE.c.menu_id, func.max(REGISTRY_TABLE.c.version))
+            .where(REGISTRY_TABLE.c.config == config, REGISTRY_TABLE.c.menu_id.in_(ids))
+            .group_by(REGISTRY_TABLE.c.menu_id)
+        ).all())
+        rows = [{
+            "menu_id": it["menu_id"], "config": config, "version": cur.get(it["menu_id"], 0) + 1,
+            "model": it["model"], "artifact": json.dumps(it["artifact"]),
+            "metrics": json.dumps(_json_safe(it["metrics"])) if it["metrics"] is not None else None,
+            "data_max_ds": it["data_max_ds"],
+        } for it in items]
+        conn.execute(insert(REGISTRY_TABLE), rows)
+    return {r["menu_id"]: r["version"] for r in rows}
+
+
+def load_registered(engine, config: str, versions: dict[int, int]) -> dict[int, dict]:
+    """{menu_id: version} の artifact を読む"""
+    if not versions:
+        return {}
+    REGISTRY_TABLE.create(engine, checkfirst=True)
+    with engine.connect() as conn:
+        rows = conn.execute(
+            select(REGISTRY_TABLE.c.menu_id, REGISTRY_TABLE.c.version, REGISTRY_TABLE.c.artifact)
+            .where(REGISTRY_TABLE.c.config == config, REGISTRY_TABLE.c.menu_id.in_(list(versions)))
+        ).all()
+    return {mid: json.loads(art) for mid, ver, art in rows if versions.get(mid) == ver}
+
+
+def touch_states(engine, config: str, menu_ids: list, predict_dates: pd.DatetimeIndex) -> None:
+    """保存済みモデルで予測し直したメニューの予測期間だけ更新"""
+    if not menu_ids:
+        return
+    with engine.begin() as conn:
+        conn.execute(
+            update(STATE_TABLE)
+            .where(STATE_TABLE.c.config == config, STATE_TABLE.c.menu_id.in_(menu_ids))
+            .values(forecast_start=predict_dates[0].date(), horizon=len(predict_dates))
+        )
+
+
+# -------- Hyperparameter search（--tune） --------
+HYPERPARAM_TABLE = ForecastHyperparams.__table__
+# global モデルの行の menu_id（メニューの id は 1 から振られるので重ならない）
+GLOBAL_MENU_ID = 0
+TUNE_ALPHAS = {"ridge": (0.1, 1.0, 10.0, 100.0), "lasso": (0.0001, 0.0005, 0.005, 0.05)}
+TUNE_LAGS = (7, 14, 21)
+# fold を 1 つ評価するごとに、途中の MAE が最良のこの倍を超えた候補は残りの fold を打ち切る
+TUNE_PRUNE_RATIO = 1.25
+
+
+def param_grid(model_name: str, alphas=None, lags=None) -> list[dict]:
+    """alpha × ラグ日数の候補。既定値（DEFAULT_ALPHA, N_LAGS）の組を先頭に置き、同点ならそれを選ぶ"""
+    alphas = alphas or TUNE_ALPHAS[model_name]
+    lags = lags or TUNE_LAGS
+    grid = [{"alpha": float(a), "n_lags": int(n)} for n in lags for a in alphas]
+    default = {"alpha": DEFAULT_ALPHA[model_name], "n_lags": N_LAGS}
+    if default in grid:
+        grid.remove(default)
+        grid.insert(0, default)
+    return grid
+
+
+def search_hyperparams(evaluate, grid: list[dict], n_folds: int, mapper=map) -> dict | None:
+    """
+    fold を新しい順に 1 つずつ、残っている全候補で評価する（全候補が同じ fold で比べられる）。
+    途中の MAE が最良の TUNE_PRUNE_RATIO 倍を超えた候補と、学習できなかった候補はそこで打ち切る。
+    evaluate(params, k) は fold k の |誤差| の配列（学習できなければ None）。mapper で候補を並列に評価する。
+    戻り値: {"alpha", "n_lags", "mae", "folds", "tried", "pruned"}（どの候補も評価できなければ None）
+    """
+    abs_sum = np.zeros(len(grid))
+    count = np.zeros(len(grid))
+    alive = list(range(len(grid)))
+    for k in range(n_folds):
+        for i, err in zip(alive, mapper(evaluate, [grid[i] for i in alive], [k] * len(alive))):
+            if err is None or len(err) == 0 or not np.isfinite(err).all():
+                abs_sum[i] = np.inf
+            else:
+                abs_sum[i] += err.sum()
+                count[i] += len(err)
+        mae = abs_sum / np.maximum(count, 1)
+        alive = [i for i in alive if np.isfinite(mae[i])]
+        if not alive:
+            return None
+        best = min(mae[i] for i in alive)
+        if k < n_folds - 1:
+            alive = [i for i in alive if mae[i] <= best * TUNE_PRUNE_RATIO]
+    i = min(alive, key=lambda j: mae[j])  # 同点なら grid の順（既定値が先）
+    return {**grid[i], "mae": float(mae[i]), "folds": n_folds, "tried": len(grid), "pruned": len(grid) - len(alive)}
+
+
+def tune_menu(model_kind: str, df_one: pd.DataFrame, horizon: int, folds: int = 3,
+              step: int | None = None, grid: list[dict] | None = None) -> dict | None:
+    """1 メニュー分の探索。メニュー単位のワーカープロセスの中で逐次に回す。"""
+    grid = grid or param_grid(model_kind)
+    df_one = df_one.sort_values("ds").reset_index(drop=True)
+    if len(df_one) < horizon + 14:
+        return None
+    # 全候補を同じ fold で比べるため、fold は最長のラグでも学習できるものに揃える（足りなければ長いラグを諦める）
+    lags = sorted({p["n_lags"] for p in grid})
+    cutoffs = []
+    while lags:
+        cutoffs = backtest_cutoffs(df_one, horizon, folds, step, max(max(lags), N_LAGS) + 14)
+        if cutoffs:
+            break
+        lags.pop()
+    if not cutoffs:
+        return None
+    grid = [p for p in grid if p["n_lags"] in lags]
+    feats = {n: make_lag_features(df_one, n) for n in lags}
+
+    def _eval(params, k):
+        in_train, in_test = _fold_masks(df_one, cutoffs[k], horizon)
+        yhat = _fold_predict_sklearn(model_kind, df_one, feats[params["n_lags"]], in_train, in_test, params)
+        return None if np.isnan(yhat).any() else np.abs(yhat - df_one.loc[in_test, "y"].to_numpy(dtype=float))
+
+    return search_hyperparams(_eval, grid, len(cutoffs))
+
+
+def _global_fold_errors(model_kind: str, df: pd.DataFrame, horizon: int, cutoffs: list,
+                        params: dict, k: int) -> np.ndarray | None:
+    """global モデルの 1 候補 × 1 fold の |誤差|（全メニュー分）。ワーカープロセスで動くようモジュール直下に置く"""
+    cutoff = cutoffs[k]
+    train = df[df["ds"] <= cutoff]
+    pipe = _fit_global(make_global_lag_features(train, params["n_lags"]), model_kind, params)
+    if pipe is None:
+        return None
+    test = df[(df["ds"] > cutoff) & (df["ds"] <= cutoff + pd.Timedelta(days=horizon))]
+    mids = sorted(set(train["menu_id"]) & set(test["menu_id"]))
+    if not mids:
+        return None
+    test_dates = pd.date_range(cutoff + pd.Timedelta(days=1), periods=horizon, freq="D")
+    fc = predict_global(linear_artifact(pipe, model_kind), train, test_dates, mids)
+    m = fc.merge(test[["menu_id", "ds", "y"]], on=["menu_id", "ds"])
+    return np.abs(m["yhat"].to_numpy() - m["y"].to_numpy(dtype=float))
+
+
+def tune_global(model_kind: str, df: pd.DataFrame, horizon: int, folds: int = 3, step: int | None = None,
+                grid: list[dict] | None = None, workers: int = 1) -> dict | None:
+    """global モデルの探索。候補はプロセスプールで並列に評価する（fold ごとに打ち切りを判定）"""
+    grid = grid or param_grid(model_kind)
+    step = step or horizon
+    last = df["ds"].max()
+    cutoffs = [last - pd.Timedelta(days=horizon + k * step) for k in range(folds)]
+    evaluate = partial(_global_fold_errors, model_kind, df, horizon, cutoffs)
+    if workers > 1 and len(grid) > 1:
+        with ProcessPoolExecutor(max_workers=workers) as ex:
+            return search_hyperparams(evaluate, grid, len(cutoffs), mapper=ex.map)
+    return search_hyperparams(evaluate, grid, len(cutoffs))
+
+
+def load_hyperparams(engine, config: str) -> dict[int, dict]:
+    """保存済みの {menu_id: {"alpha", "n_lags"}}（global は GLOBAL_MENU_ID）"""
+    HYPERPARAM_TABLE.create(engine, checkfirst=True)
+    with engine.connect() as conn:
+        rows = conn.execute(select(HYPERPARAM_TABLE).where(HYPERPARAM_TABLE.c.config == config)).mappings().all()
+    return {int(r["menu_id"]): {"alpha": float(r["alpha"]), "n_lags": int(r["n_lags"])} for r in rows}
+
+
+def save_hyperparams(engine, config: str, tuned: dict[int, dict]) -> None:
+    """探索結果を upsert（次回以降はこの値を使い、探索しない）"""
+    if not tuned:
+        return
+    rows = [{"menu_id": mid, "config": config, "alpha": t["alpha"], "n_lags": t["n_lags"],
+             "mae": t["mae"], "folds": t["folds"]} for mid, t in tuned.items()]
+    with engine.begin() as conn:
+        _upsert_by_key(conn, HYPERPARAM_TABLE, rows, ("menu_id", "config"), "tuned_at")
+
+
+def _tune_log(label, t: dict) -> str:
+    return (f"[tune] {label} alpha={t['alpha']:g} n_lags={t['n_lags']} mae={t['mae']:.3f} "
+            f"folds={t['folds']} pruned={t['pruned']}/{t['tried']}")
+
+
+# -------- Per-menu pipeline --------
+def process_menu(mid: int, df_one: pd.DataFrame, predict_dates: pd.DatetimeIndex, args,
+                 params: dict | None = None) -> dict:
+    """
+    1メニュー分の (探索 →) バックテスト → 本学習/ベースライン → 予測。
+    params は保存済みのハイパーパラメータ。無くて --tune なら、ここ（ワーカープロセス内）で探索する。
+    ワーカープロセスでも動くよう DB には触れず、ログも戻り値で返す（出力順を決定的にするため）。
+    """
+    logs: list[tuple[str, str]] = []
+    out = {"menu_id": mid, "status": "saved", "bt": None, "fc": None, "model_name": None, "artifact": None,
+           "ml_lost": False, "tuned": None, "logs": logs}
+
+    if len(df_one) < args.min_history:
+        logs.append(("out", f"[skip-short] menu_id={mid} history={len(df_one)} < {args.min_history}"))
+        out["status"] = "short"
+        return out
+
+    if params is None and args.tune and args.model != "prophet":
+        grid = param_grid(args.model, args.tune_alphas, args.tune_lags)
+        out["tuned"] = tune_menu(args.model, df_one, args.horizon, args.folds, args.fold_step, grid)
+        if out["tuned"] is not None:
+            params = {k: out["tuned"][k] for k in ("alpha", "n_lags")}
+            logs.append(("out", _tune_log(f"menu_id={mid}", out["tuned"])))
+
+    bt = rolling_origin_backtest(
+        args.model, args.baseline, df_one, args.horizon,
+        folds=args.folds, step=args.fold_step, workers=args.fold_workers, coverage=args.coverage, params=params,
+    )
+    out["bt"] = bt
+    logs.append(("out", f"[bt] menu_id={mid} folds={bt['folds']} mae_ml={bt['mae_ml']:.3f} mae_base={bt['mae_base']:.3f} win={bt['win']}"))
+
+    train_all = df_one.copy()
+    if bt["win"]:
+        if args.model == "prophet":
+            fc = fit_predict_prophet(train_all, predict_dates)
+        else:
+            out["artifact"] = with_interval(fit_sklearn_artifact(train_all, args.model, params), bt["q_ml"], args.coverage)
+            fc = artifact_forecast(out["artifact"], train_all, predict_dates)
+        model_name = args.model
+    else:
+        out["artifact"] = with_interval({"kind": "baseline", "name": args.baseline}, bt["q_base"], args.coverage)
+        fc = artifact_forecast(out["artifact"], train_all, predict_dates)
+        model_name = args.baseline
+        out["ml_lost"] = True
+
+    if fc["yhat"].isna().sum() > 0:
+        logs.append(("err", f"[warn] menu_id={mid} 予測に欠損が含まれるためスキップ"))
+        out["status"] = "nan"
+        return out
+
+    out["fc"] = fc
+    out["model_name"] = model_name
+    return out
+
+
+def _process_menu_star(job):
+    """job = (menu_id, MenuSeries, ...)。DataFrame はワーカー側で行のビューから作る"""
+    mid, series, *rest = job
+    return process_menu(mid, series.frame(), *rest)
 
-        conn.execute(text(
-            f"INSERT INTO {table_forecast} ({', '.join(insert_cols)}) VALUES {values_clause}"
-        ), rows)
+
+def _print_logs(logs):
+    for stream, msg in logs:
+        print(msg, file=sys.stderr if stream == "err" else sys.stdout)
+
+
+def process_global(df: pd.DataFrame, menu_ids: list, predict_dates: pd.DatetimeIndex, args,
+                   params: dict | None = None) -> list[dict]:
+    """
+    --global: 全メニューで 1 モデルを学習し 1 回で予測する。戻り値は process_menu と同じ形の dict のリスト。
+    min_history 未満の新メニューもスキップせず global モデルの予測を使う（バックテストなし）。
+    """
+    art = fit_global_artifact(df, args.model, params)
+    fc_all = fit_predict_global(df, predict_dates, args.model, menu_ids, art=art)
+    fc_by_menu = {m: g.drop(columns="menu_id").reset_index(drop=True) for m, g in fc_all.groupby("menu_id")}
+    base_all = baselines_for(args.baseline, df, menu_ids, predict_dates)
+    lengths = df.groupby("menu_id").size()
+    long_ids = [m for m in menu_ids if lengths.get(m, 0) >= args.min_history]
+    bts = global_backtest(
+        args.model, args.baseline, df, args.horizon, long_ids,
+        folds=args.folds, step=args.fold_step, workers=args.fold_workers, coverage=args.coverage, params=params,
+    )
+
+    out = []
+    for i, mid in enumerate(menu_ids):
+        logs: list[tuple[str, str]] = []
+        res = {"menu_id": mid, "status": "saved", "bt": bts.get(mid), "fc": None, "model_name": None,
+               "artifact": menu_artifact(art, mid) if art else None, "ml_lost": False, "tuned": None, "logs": logs}
+        fc = fc_by_menu[mid]
+        model_name = f"global_{args.model}"
+        bt = res["bt"]
+        if bt is None:
+            logs.append(("out", f"[short->global] menu_id={mid} history={lengths.get(mid, 0)} < {args.min_history}"))
+        else:
+            logs.append(("out", f"[bt] menu_id={mid} folds={bt['folds']} mae_ml={bt['mae_ml']:.3f} mae_base={bt['mae_base']:.3f} win={bt['win']}"))
+            if bt["win"]:
+                res["artifact"] = with_interval(res["artifact"], bt["q_ml"], args.coverage)
+                fc = forecast_frame(predict_dates, fc["yhat"].to_numpy(), bt["q_ml"])
+            else:
+                res["artifact"] = with_interval({"kind": "baseline", "name": args.baseline}, bt["q_base"], args.coverage)
+                fc = forecast_frame(predict_dates, base_all[i], bt["q_base"])
+                model_name = args.baseline
+                res["ml_lost"] = True
+        if fc["yhat"].isna().sum() > 0:
+            logs.append(("err", f"[warn] menu_id={mid} 予測に欠損が含まれるためスキップ"))
+            res["status"] = "nan"
+        else:
+            res["fc"] = fc
+            res["model_name"] = model_name
+        out.append(res)
+    return out
 
 
 # -------- Main --------
-def main():
+def _float_list(s: str) -> list[float]:
+    return [float(v) for v in s.split(",") if v.strip()]
+
+
+def _int_list(s: str) -> list[int]:
+    return [int(v) for v in s.split(",") if v.strip()]
+
+
+def main(argv=None):
     ap = argparse.ArgumentParser()
     ap.add_argument("--database-url", type=str, required=True)
     ap.add_argument("--table-train", dest="table_train", type=str, default="menu_daily_train")
     ap.add_argument("--table-forecast", dest="table_forecast", type=str, default="menu_daily_forecast")
     ap.add_argument("--model", type=str, choices=["prophet", "ridge", "lasso"], required=True)
-    ap.add_argument("--baseline", type=str, choices=["naive_tminus7", "seasonal_ma_k2", "seasonal_ma_k4"], default="seasonal_ma_k4")
+    ap.add_argument("--baseline", type=str, choices=list(BASELINE_SPECS), default="seasonal_ma_k4",
+                    help="ML と比べるベースライン（同じ曜日の過去 k 週の 平均 / 中央値 / 指数加重平均）")
     ap.add_argument("--horizon", type=int, default=7)
     ap.add_argument("--min-history", dest="min_history", type=int, default=35)
     ap.add_argument("--only-menu-id", dest="only_menu_id", type=int, default=None)
-    args = ap.parse_args()
+    ap.add_argument("--workers", type=int, default=1, help="メニュー単位の並列学習プロセス数（1=逐次）")
+    ap.add_argument("--folds", type=int, default=1,
+                    help="ローリング起点バックテストの fold 数（既定 1=直近の 1 分割のみ。2 以上で複数起点）")
+    ap.add_argument("--fold-step", dest="fold_step", type=int, default=None, help="fold 間の起点のずらし幅（日）。既定は horizon")
+    ap.add_argument("--fold-workers", dest="fold_workers", type=int, default=1, help="fold の並列スレッド数")
+    ap.add_argument("--coverage", type=float, default=DEFAULT_COVERAGE,
+                    help="予測区間（yhat_lo / yhat_hi）の被覆率。バックテスト残差の split conformal で求める")
+    ap.add_argument("--global", dest="global_model", action="store_true",
+                    help="全メニューを menu_id の one-hot 付きの 1 モデルで学習・予測（ridge/lasso のみ）")
+    ap.add_argument("--incremental", action="store_true",
+                    help="menu_forecast_state と比べて入力が変わったメニューだけ学習し直す")
+    ap.add_argument("--table-backtest", dest="table_backtest", type=str, default="menu_forecast_backtest",
+                    help="バックテスト結果の追記先（空文字で保存しない）")
+    ap.add_argument("--tune", action="store_true",
+                    help="alpha とラグ日数をバックテストで探索し forecast_hyperparams に保存（保存済みのメニューは探索しない）")
+    ap.add_argument("--retune", action="store_true", help="保存済みのハイパーパラメータを無視して探索し直す（--tune を含む）")
+    ap.add_argument("--tune-alphas", dest="tune_alphas", type=_float_list, default=None,
+                    help="alpha の候補（カンマ区切り）。既定は TUNE_ALPHAS")
+    ap.add_argument("--tune-lags", dest="tune_lags", type=_int_list, default=None,
+                    help="ラグ日数の候補（カンマ区切り）。既定は TUNE_LAGS")
+    args = ap.parse_args(argv)
+    args.tune = args.tune or args.retune
 
     if args.model == "prophet" and not _HAS_PROPHET:
         print("ERROR: prophet が未インストールです。pip install prophet", file=sys.stderr)
         sys.exit(1)
+    if args.global_model and args.model == "prophet":
+        print("ERROR: --global は ridge / lasso のみ対応です", file=sys.stderr)
+        sys.exit(1)
+    if args.tune and args.model == "prophet":
+        print("ERROR: --tune は ridge / lasso のみ対応です", file=sys.stderr)
+        sys.exit(1)
 
     engine = create_engine(args.database_url)
-    df = pd.read_sql(f"SELECT menu_id, ds, y, dow, is_month_end FROM {args.table_train}", engine, parse_dates=["ds"])
+    # dow / is_month_end はカレンダーから作り直すので読まない
+    df = pd.read_sql(f"SELECT menu_id, ds, y FROM {args.table_train}", engine, parse_dates=["ds"])
     if df.empty:
         print("menu_daily_train が空です。処理を終了します。", file=sys.stderr)
         sys.exit(0)
 
-    global_max_ds = df["ds"].max()
-    predict_dates = pd.date_range(global_max_ds + pd.Timedelta(days=1), periods=args.horizon, freq="D")
+    # 1 回だけ (メニュー, 日) の行列にして、以降はその行のビューを使う
+    hist = DenseHistory.from_frame(df)
+    del df
+    predict_dates = pd.date_range(hist.last_date + pd.Timedelta(days=1), periods=args.horizon, freq="D")
 
-    menu_ids = sorted(df["menu_id"].unique().tolist())
+    menu_ids = list(hist.menu_ids)
     if args.only_menu_id is not None:
         menu_ids = [m for m in menu_ids if m == args.only_menu_id]
 
     results = []
-    saved = skipped_short = skipped_ml_lost = 0
+    to_save = []
+    trained = []
+    skipped_short = skipped_ml_lost = 0
 
-    for mid in menu_ids:
-        df_one = df[df["menu_id"] == mid].sort_values("ds").reset_index(drop=True)
-        if len(df_one) < args.min_history:
-            skipped_short += 1
-            print(f"[skip-short] menu_id={mid} history={len(df_one)} < {args.min_history}")
-            continue
+    config = config_name(args)
+    # 保存済みのハイパーパラメータは --tune なしでも使う（--retune のときだけ捨てて探索し直す）
+    hyper = {} if args.model == "prophet" or args.retune else load_hyperparams(engine, config)
+    if args.global_model:
+        to_tune = menu_ids if args.tune and GLOBAL_MENU_ID not in hyper else []
+    else:
+        to_tune = [m for m in menu_ids if m not in hyper] if args.tune else []
 
-        bt = single_split_backtest(args.model, args.baseline, df_one, args.horizon)
-        results.append({"menu_id": mid, **bt})
-        print(f"[bt] menu_id={mid} mae_ml={bt['mae_ml']:.3f} mae_base={bt['mae_base']:.3f} win={bt['win']}")
+    def _params(mid):
+        return hyper.get(GLOBAL_MENU_ID if args.global_model else mid)
 
-        train_all = df_one.copy()
-        if bt["win"]:
-            if args.model == "prophet":
-                fc = fit_predict_prophet(train_all, predict_dates)
-            else:
-                fc = fit_predict_sklearn(train_all, predict_dates, args.model)
-            model_name = args.model
-        else:
-            yhat = compute_baseline(args.baseline, train_all, predict_dates)
-            fc = pd.DataFrame({"ds": predict_dates, "yhat": yhat.values})
-            fc["yhat_lo"] = fc["yhat_hi"] = fc["yhat"]  # ベースラインは lo=hi=yhat
-            model_name = args.baseline
-            skipped_ml_lost += 1
+    # 状態（menu_forecast_state）は --incremental でなくても学習したら書く（次の --incremental が古い版を使わないように）
+    fps = menu_fingerprints(hist)
+    train_ids, reuse_ids, unchanged_ids = menu_ids, [], []
+    if args.incremental:
+        states = load_states(engine, config)
+        cfg_hashes = {mid: config_hash(args, _params(mid)) for mid in menu_ids}
+        # 探索するメニューは選ばれる値が変わり得るので学習し直す
+        train_ids, reuse_ids, unchanged_ids = plan_incremental(
+            menu_ids, states, fps, cfg_hashes, predict_dates, args.horizon, force=tuple(to_tune))
+        if args.global_model and train_ids:
+            # global は 1 モデルなので、1 メニューでも変われば全体を学習し直す
+            train_ids, reuse_ids, unchanged_ids = menu_ids, [], []
+        for mid in unchanged_ids:
+            print(f"[unchanged] menu_id={mid} 入力・予測期間とも前回と同じ")
+        arts = load_registered(engine, config, {m: states[m]["model_version"] for m in reuse_ids})
+        for mid in list(reuse_ids):
+            st = states[mid]
+            fc = artifact_forecast(arts.get(mid), hist.series(mid).frame(), predict_dates)
+            if fc["yhat"].isna().any():
+                print(f"[warn] menu_id={mid} 予測に欠損が含まれるためスキップ", file=sys.stderr)
+                reuse_ids.remove(mid)
+                continue
+            print(f"[reuse] menu_id={mid} model={st['chosen_model']}")
+            to_save.append((mid, fc, st["chosen_model"]))
 
-        if fc["yhat"].isna().sum() > 0:
-            print(f"[warn] menu_id={mid} 予測に欠損が含まれるためスキップ", file=sys.stderr)
-            continue
+    tuned = {}
+    jobs = ((mid, hist.series(mid), predict_dates, args, hyper.get(mid)) for mid in train_ids)
+
+    def _collect(res):
+        nonlocal skipped_short, skipped_ml_lost
+        _print_logs(res["logs"])
+        if res["tuned"] is not None:
+            tuned[res["menu_id"]] = res["tuned"]
+        if res["status"] == "short":
+            skipped_short += 1
+            return
+        if res["bt"] is not None:
+            results.append({"menu_id": res["menu_id"], **res["bt"]})
+        skipped_ml_lost += int(res["ml_lost"])
+        if res["status"] == "saved":
+            to_save.append((res["menu_id"], res["fc"], res["model_name"]))
+            trained.append(res)
+
+    if args.global_model:
+        df = hist.frame()
+        gparams = hyper.get(GLOBAL_MENU_ID)
+        if to_tune and train_ids:
+            # 候補ごとに全メニュー分を学習するので、メニューではなく候補をプロセスプールに配る
+            grid = param_grid(args.model, args.tune_alphas, args.tune_lags)
+            t = tune_global(args.model, df, args.horizon, args.folds, args.fold_step, grid, workers=args.workers)
+            if t is not None:
+                print(_tune_log("global", t))
+                tuned[GLOBAL_MENU_ID] = t
+                gparams = {k: t[k] for k in ("alpha", "n_lags")}
+        # 学習は全メニュー（--only-menu-id は出力の絞り込みだけ）
+        for res in process_global(df, train_ids, predict_dates, args, gparams) if train_ids else []:
+            _collect(res)
+    elif args.workers > 1 and len(train_ids) > 1:
+        # map は入力順に結果を返すので、ログと保存順はワーカー数によらず同じ
+        with ProcessPoolExecutor(max_workers=args.workers) as ex:
+            for res in ex.map(_process_menu_star, jobs):
+                _collect(res)
+    else:
+        for job in jobs:
+            _collect(_process_menu_star(job))
 
-        save_forecast(engine, args.table_forecast, mid, fc, model_name)
-        saved += 1
+    # 予測はまとめて 1 トランザクションで保存
+    save_forecasts(engine, args.table_forecast, to_save)
+    save_hyperparams(engine, config, tuned)
+    if args.table_backtest:
+        save_backtest_results(engine, args.table_backtest, results, args)
+    # 学習したモデルはレジストリへ（/api/analytics/forecast/online が最新版を使う）
+    versions = register_models(engine, config_name(args), [{
+        "menu_id": res["menu_id"], "model": res["model_name"], "artifact": res["artifact"], "metrics": res["bt"],
+        "data_max_ds": hist.series(res["menu_id"]).last_date.date(),
+    } for res in trained])
+    for mid, t in tuned.items():
+        hyper[mid] = {k: t[k] for k in ("alpha", "n_lags")}
+    save_states(engine, config, [{
+        "menu_id": res["menu_id"], "config": config, "config_hash": config_hash(args, _params(res["menu_id"])),
+        **fps[res["menu_id"]], "chosen_model": res["model_name"], "model_version": versions.get(res["menu_id"]),
+        "forecast_start": predict_dates[0].date(), "horizon": args.horizon,
+    } for res in trained], clear=train_ids)
+    if args.incremental:
+        touch_states(engine, config, reuse_ids, predict_dates)
+    for mid, _, model_name in to_save:
         print(f"[save] menu_id={mid} -> {args.table_forecast} (model={model_name})")
+    saved = len(to_save)
 
     win_rate = (pd.DataFrame(results)["win"].mean() * 100) if results else 0.0
     print("\n=== Summary ===")
@@ -290,8 +1329,13 @@ def main():
     print(f"Skipped (short hist): {skipped_short}")
     print(f"ML lost -> baseline : {skipped_ml_lost}")
     print(f"ML win rate         : {win_rate:.1f}% (by MAE)")
+    if args.incremental:
+        print(f"Unchanged (skipped) : {len(unchanged_ids)}")
+        print(f"Reused models       : {len(reuse_ids)}")
+    if args.tune:
+        print(f"Tuned               : {len(tuned)}")
 
 
 if __name__ == "__main__":
     from sqlalchemy import create_engine
-    main()
\ No newline at end of file
+    main()
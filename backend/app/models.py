@@ -1,7 +1,7 @@
 # app/models.py
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
-from sqlalchemy import Column, Integer, String, ForeignKey, DateTime, UniqueConstraint
+from sqlalchemy import Column, Integer, String, Text, ForeignKey, DateTime, Date, Float, UniqueConstraint, Index
 from app.database import Base   # ← ここだけから Base を輸入。declarative_base() は絶対に呼ばない。
 
 
@@ -24,6 +24,12 @@ class Order(Base):
 
     items = relationship("OrderItem", back_populates="order", cascade="all, delete-orphan")
 
+    __table_args__ = (
+        # GET /orders?status= と analytics / forecast の期間フィルタ用
+        Index("ix_orders_status_created_at", "status", "created_at"),
+        Index("ix_orders_created_at", "created_at"),
+    )
+
 
 class OrderItem(Base):
     __tablename__ = "order_items"
@@ -33,4 +39,102 @@ class OrderItem(Base):
     price = Column(Integer, nullable=False)   # 注文時の価格スナップショット
     quantity = Column(Integer, nullable=False, default=1)
 
-    order = relationship("Order", back_populates="items")
\ No newline at end of file
+    order = relationship("Order", back_populates="items")
+
+    __table_args__ = (
+        # 集計 JOIN をインデックスのみで完結させるカバリングインデックス
+        Index("ix_order_items_covering", "order_id", "menu_id", "quantity", "price"),
+    )
+
+
+# ---------- analytics 用ロールアップ（app/services/rollup.py が更新） ----------
+class SalesHourlyRollup(Base):
+    """メニュー × JST 1時間バケットの販売数量"""
+    __tablename__ = "sales_hourly_rollup"
+    menu_id = Column(Integer, primary_key=True)
+    bucket = Column(DateTime, primary_key=True)          # JST 時刻（分以下切り捨て, naive）
+    quantity = Column(Integer, nullable=False, default=0)
+    lines = Column(Integer, nullable=False, default=0)   # order_items 行数
+
+    __table_args__ = (
+        Index("ix_sales_hourly_rollup_bucket", "bucket"),
+    )
+
+
+class OrderHourlyRollup(Base):
+    """JST 1時間バケットの注文件数（明細を持つ注文のみ）"""
+    __tablename__ = "order_hourly_rollup"
+    bucket = Column(DateTime, primary_key=True)
+    orders = Column(Integer, nullable=False, default=0)
+
+
+class SyncWatermark(Base):
+    """差分処理の進捗（名前 → 値）"""
+    __tablename__ = "sync_watermarks"
+    name = Column(String(64), primary_key=True)
+    value = Column(String(64), nullable=False)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now(), nullable=False)
+
+
+# ---------- 需要予測（app/ml/train_forecast.py が書き込む） ----------
+class MenuDailyForecast(Base):
+    __tablename__ = "menu_daily_forecast"
+    menu_id = Column(Integer, primary_key=True)
+    ds = Column(Date, primary_key=True)
+    model = Column(String(64), primary_key=True)     # 'ridge' / 'seasonal_ma_k4' など
+    yhat = Column(Float, nullable=False)             # 数量
+    yhat_lo = Column(Float, nullable=False)
+    yhat_hi = Column(Float, nullable=False)
+    trained_at = Column(DateTime, server_default=func.now(), nullable=False)
+
+    __table_args__ = (
+        # menu_id='all' のとき日付範囲だけで引くため
+        Index("ix_menu_daily_forecast_ds", "ds"),
+    )
+
+
+class MenuForecastState(Base):
+    """差分学習用：メニュー × 設定ごとの入力データ指紋と学習済みモデル"""
+    __tablename__ = "menu_forecast_state"
+    menu_id = Column(Integer, primary_key=True)
+    config = Column(String(64), primary_key=True)    # 'ridge' / 'global_ridge' など
+    config_hash = Column(String(40), nullable=False)  # baseline / min_history / folds などの指紋
+    data_hash = Column(String(40), nullable=False)    # menu_daily_train のこのメニュー分の指紋
+    data_max_ds = Column(Date, nullable=True)
+    data_rows = Column(Integer, nullable=False)
+    chosen_model = Column(String(64), nullable=True)  # 実際に保存した予測のモデル（ML 負けならベースライン名）
+    model_version = Column(Integer, nullable=True)    # forecast_model_registry の version。prophet は NULL
+    forecast_start = Column(Date, nullable=True)      # 最後に書いた予測の初日と日数
+    horizon = Column(Integer, nullable=True)
+    trained_at = Column(DateTime, server_default=func.now(), nullable=False)
+
+
+class ForecastModelRegistry(Base):
+    """学習済み需要予測モデル（メニュー × 設定ごとに版を重ねる）。各メニューの最新行をオンライン推論で使う"""
+    __tablename__ = "forecast_model_registry"
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    menu_id = Column(Integer, nullable=False)
+    config = Column(String(64), nullable=False)       # 'ridge' / 'global_ridge' など（学習時の設定）
+    version = Column(Integer, nullable=False)         # (menu_id, config) ごとに 1, 2, ...
+    model = Column(String(64), nullable=False)        # 予測に使うモデル（ML 負けならベースライン名）
+    artifact = Column(Text, nullable=False)           # JSON（kind=linear / baseline）
+    metrics = Column(Text, nullable=True)             # バックテスト結果（JSON）
+    data_max_ds = Column(Date, nullable=True)
+    trained_at = Column(DateTime, server_default=func.now(), nullable=False)
+
+    __table_args__ = (
+        UniqueConstraint("menu_id", "config", "version", name="uq_forecast_model_registry_version"),
+        Index("ix_forecast_model_registry_menu_id", "menu_id", "id"),
+    )
+
+
+class ForecastHyperparams(Base):
+    """train_forecast --tune で選んだハイパーパラメータ（メニュー × 設定ごと。global モデルは menu_id=0）"""
+    __tablename__ = "forecast_hyperparams"
+    menu_id = Column(Integer, primary_key=True)
+    config = Column(String(64), primary_key=True)    # 'ridge' / 'global_ridge' など
+    alpha = Column(Float, nullable=False)
+    n_lags = Column(Integer, nullable=False)
+    mae = Column(Float, nullable=True)               # 探索時のバックテスト MAE
+    folds = Column(Integer, nullable=True)
+    tuned_at = Column(DateTime, server_default=func.now(), nullable=False)
@@ -1,15 +1,21 @@
 # backend/app/routers/analytics.py
 from __future__ import annotations
 
-from typing import Literal, List, Dict, Any
-from datetime import date  # 👈 追加
+from typing import Literal, List, Dict, Any, Optional
+from datetime import date, datetime, timedelta, timezone  # 👈 追加
 
 from fastapi import APIRouter, Depends, HTTPException, Query
 from sqlalchemy.orm import Session
-from sqlalchemy import select, func, desc, text
+from sqlalchemy import select, func, desc, case, true
 
 from ..database import get_db
-from ..models import Menu, Order, OrderItem
+from ..models import Menu, Order, OrderItem, SalesHourlyRollup, OrderHourlyRollup, MenuDailyForecast
+from ..services.rollup import JST, catch_up_rollups, jst_now
+from ..services.cache import analytics_cache
+from ..services.timebucket import jst_date
+from ..services.forecast_models import (
+    model_store, history_days, holidays_between, interval_halfwidth, predict as predict_online,
+)
 from .deps import require_staff  # ✅ 共通のスタッフ認証を使用
 
 
@@ -20,77 +26,167 @@ router = APIRouter(
 )
 
 
-@router.get("/summary")
-def summary(
-    range: Literal["today", "7d", "30d"] = Query("today"),
-    db: Session = Depends(get_db),
-) -> Dict[str, Any]:
-    from datetime import datetime, timedelta, timezone
+# ---- ロールアップ読み出し ----
+# 売上系エンドポイントは orders ⋈ order_items を毎回集計せず、
+# JST 1時間バケットのロールアップ（app/services/rollup.py）から読む。
+# 金額は従来どおり「数量 × 現在の Menu.price」。
 
-    now = datetime.now(timezone.utc)
-    if range == "today":
-        start = now.replace(hour=0, minute=0, second=0, microsecond=0)
-    elif range == "7d":
-        start = now - timedelta(days=7)
-    else:
-        start = now - timedelta(days=30)
+# 結果はエンドポイント＋パラメータ単位で analytics_cache（TTL/LRU）に載せ、
+# 注文の作成・ステータス変更時に orders ルーターが invalidate する。
+# 未反映の注文は注文の書き込み後にバックグラウンドで取り込まれる。キャッシュミス時も念のため
+# 取り込むが、件数に上限（REQUEST_CATCHUP_ORDERS）があり、全履歴の取り込みはリクエストでは行わない。
 
-    try:
-        order_count = db.execute(
-            select(func.count(Order.id)).where(Order.created_at >= start)
-        ).scalar_one()
-        total_amount = db.execute(
-            select(func.coalesce(func.sum(OrderItem.quantity * Menu.price), 0))
-            .join(Menu, Menu.id == OrderItem.menu_id)
-            .join(Order, Order.id == OrderItem.order_id)
-            .where(Order.created_at >= start)
-        ).scalar_one()
-    except Exception:
-        # created_at が NULL などでエラーになった場合のフォールバック
-        order_count = db.execute(select(func.count(Order.id))).scalar_one()
-        total_amount = db.execute(
-            select(func.coalesce(func.sum(OrderItem.quantity * Menu.price), 0))
-            .join(Menu, Menu.id == OrderItem.menu_id)
-            .join(Order, Order.id == OrderItem.order_id)
-        ).scalar_one()
+def _catch_up_rollups(kwargs: Dict[str, Any]) -> None:
+    catch_up_rollups(kwargs["db"])
 
-    return {
-        "range": range,
-        "period_start": start.isoformat(),
-        "period_end": now.isoformat(),
-        "order_count": int(order_count or 0),
-        "total_amount": int(total_amount or 0),
-    }
 
+_cached_rollup = analytics_cache.cached(before_miss=_catch_up_rollups)
+_cached = analytics_cache.cached()
 
-@router.get("/top-menus")
-def top_menus(
-    limit: int = 10,
-    days: int = 30,
-    db: Session = Depends(get_db),
-) -> List[Dict[str, Any]]:
+
+def _start_bucket(days: int) -> Optional[datetime]:
+    """直近 days 日の開始バケット（JST, 時単位切り捨て）。days <= 0 は全期間。"""
+    if days <= 0:
+        return None
+    return (jst_now() - timedelta(days=days)).replace(minute=0, second=0, microsecond=0)
+
+
+def _today_bucket() -> datetime:
+    return jst_now().replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def _sales_by_bucket(
+    db: Session,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    menu_id: Optional[int] = None,
+):
+    """bucket ごとの (quantity, amount, lines)。bucket 数 = 時間数なので行数は履歴長に比例しない。"""
     q = (
         select(
-            OrderItem.menu_id.label("menu_id"),
+            SalesHourlyRollup.bucket.label("bucket"),
+            func.sum(SalesHourlyRollup.quantity).label("qty"),
+            func.sum(SalesHourlyRollup.quantity * Menu.price).label("amt"),
+            func.sum(SalesHourlyRollup.lines).label("lines"),
+        )
+        .join(Menu, Menu.id == SalesHourlyRollup.menu_id)
+        .group_by(SalesHourlyRollup.bucket)
+    )
+    if start is not None:
+        q = q.where(SalesHourlyRollup.bucket >= start)
+    if end is not None:
+        q = q.where(SalesHourlyRollup.bucket < end)
+    if menu_id is not None:
+        q = q.where(SalesHourlyRollup.menu_id == menu_id)
+    return db.execute(q).all()
+
+
+def _orders_by_bucket(db: Session, start: Optional[datetime] = None):
+    q = select(OrderHourlyRollup.bucket, OrderHourlyRollup.orders)
+    if start is not None:
+        q = q.where(OrderHourlyRollup.bucket >= start)
+    return db.execute(q).all()
+
+
+def _menu_totals(db: Session, days: int, limit: int):
+    qty = func.sum(SalesHourlyRollup.quantity)
+    q = (
+        select(
+            SalesHourlyRollup.menu_id.label("menu_id"),
             Menu.name.label("name"),
-            func.sum(OrderItem.quantity).label("quantity"),
-            func.sum(OrderItem.quantity * Menu.price).label("amount"),
+            qty.label("quantity"),
+            func.sum(SalesHourlyRollup.quantity * Menu.price).label("amount"),
         )
-        .join(Menu, Menu.id == OrderItem.menu_id)
-        .join(Order, Order.id == OrderItem.order_id)
-        .group_by(OrderItem.menu_id, Menu.name)
-        .order_by(desc(func.sum(OrderItem.quantity)))
+        .join(Menu, Menu.id == SalesHourlyRollup.menu_id)
+        .group_by(SalesHourlyRollup.menu_id, Menu.name)
+        .order_by(desc(qty))
         .limit(limit)
     )
+    start = _start_bucket(days)
+    if start is not None:
+        q = q.where(SalesHourlyRollup.bucket >= start)
+    return db.execute(q).all()
 
-    # 期間フィルタ（PostgreSQL 用）
-    if days > 0:
-        from datetime import datetime, timedelta, timezone
 
-        start = datetime.now(timezone.utc) - timedelta(days=days)
-        q = q.where(Order.created_at >= start)  # type: ignore[attr-defined]
+SummaryRange = Literal["today", "7d", "30d"]
+SUMMARY_RANGES = ("today", "7d", "30d")
 
-    rows = db.execute(q).all()
+
+def _summary_start(name: str) -> datetime:
+    if name == "today":
+        return _today_bucket()
+    return _start_bucket(7 if name == "7d" else 30)
+
+
+def _summary_totals(db: Session, names: List[str]) -> Dict[str, Dict[str, Any]]:
+    """
+    複数期間の (注文件数, 売上) を 1 往復で求める。
+    最も古い開始点以降を 1 回だけ走査し、期間ごとに CASE で振り分けて集計する。
+    """
+    starts = {n: _summary_start(n) for n in names}
+    lo = min(starts.values())
+
+    amount = SalesHourlyRollup.quantity * Menu.price
+    amt_sq = (
+        select(*[
+            func.coalesce(func.sum(case((SalesHourlyRollup.bucket >= starts[n], amount), else_=0)), 0).label(f"amt_{i}")
+            for i, n in enumerate(names)
+        ])
+        .join(Menu, Menu.id == SalesHourlyRollup.menu_id)
+        .where(SalesHourlyRollup.bucket >= lo)
+        .subquery()
+    )
+    cnt_sq = (
+        select(*[
+            func.coalesce(func.sum(case((OrderHourlyRollup.bucket >= starts[n], OrderHourlyRollup.orders), else_=0)), 0).label(f"cnt_{i}")
+            for i, n in enumerate(names)
+        ])
+        .where(OrderHourlyRollup.bucket >= lo)
+        .subquery()
+    )
+    # どちらも 1 行なので ON TRUE で横に並べる
+    row = db.execute(select(amt_sq, cnt_sq).select_from(amt_sq.join(cnt_sq, true()))).mappings().one()
+
+    now = datetime.now(timezone.utc)
+    return {
+        n: {
+            "range": n,
+            "period_start": starts[n].replace(tzinfo=JST).isoformat(),
+            "period_end": now.isoformat(),
+            "order_count": int(row[f"cnt_{i}"] or 0),
+            "total_amount": int(row[f"amt_{i}"] or 0),
+        }
+        for i, n in enumerate(names)
+    }
+
+
+@router.get("/summary")
+@_cached_rollup
+def summary(
+    range: SummaryRange = Query("today"),
+    ranges: Optional[str] = Query(
+        None, description="カンマ区切り（例: today,7d,30d）。指定時は全期間を 1 回で返す"
+    ),
+    db: Session = Depends(get_db),
+) -> Dict[str, Any]:
+    if ranges is None:
+        return _summary_totals(db, [range])[range]
+
+    names = list(dict.fromkeys(r.strip() for r in ranges.split(",") if r.strip()))
+    if not names or any(n not in SUMMARY_RANGES for n in names):
+        raise HTTPException(status_code=400, detail="invalid ranges")
+    totals = _summary_totals(db, names)
+    return {"ranges": [totals[n] for n in names]}
+
+
+@router.get("/top-menus")
+@_cached_rollup
+def top_menus(
+    limit: int = 10,
+    days: int = 30,
+    db: Session = Depends(get_db),
+) -> List[Dict[str, Any]]:
+    rows = _menu_totals(db, days, limit)
     return [
         {
             "menu_id": r.menu_id,
@@ -107,39 +203,21 @@ def top_menus(
 
 
 @router.get("/hourly")
+@_cached_rollup
 def hourly(
     days: int = 7,
     db: Session = Depends(get_db),
 ) -> Dict[str, Any]:
     """
-    直近 days 日の時間帯別分布（全メニュー）
+    直近 days 日の時間帯別分布（全メニュー, JST）
+    count は注文明細の行数
     """
     try:
-        from datetime import datetime, timedelta, timezone
-
-        start = datetime.now(timezone.utc) - timedelta(days=days)
-
-        # PostgreSQL 用: created_at から「時」を抽出
-        hour_expr = func.extract("hour", Order.created_at)
-
-        rows = db.execute(
-            select(
-                hour_expr.label("h"),
-                func.count(Order.id).label("cnt"),
-                func.coalesce(
-                    func.sum(OrderItem.quantity * Menu.price), 0
-                ).label("amt"),
-            )
-            .join(OrderItem, OrderItem.order_id == Order.id)
-            .join(Menu, Menu.id == OrderItem.menu_id)
-            .where(Order.created_at >= start)
-            .group_by("h")
-            .order_by("h")
-        ).all()
-
-        by_hour = {
-            int(r.h): (int(r.cnt), int(r.amt)) for r in rows if r.h is not None
-        }
+        by_hour: Dict[int, List[int]] = {}
+        for r in _sales_by_bucket(db, start=_start_bucket(days)):
+            acc = by_hour.setdefault(r.bucket.hour, [0, 0])
+            acc[0] += int(r.lines or 0)
+            acc[1] += int(r.amt or 0)
         buckets = [
             {
                 "hour": h,
@@ -155,43 +233,36 @@ def hourly(
 
 
 @router.get("/daily-sales")
+@_cached_rollup
 def daily_sales(
     days: int = 14,
     db: Session = Depends(get_db),
 ):
     """
-    直近 days 日の日別売上金額＆注文件数（PostgreSQL版）
+    直近 days 日の日別売上金額＆注文件数（JST 日付）
     """
     if days <= 0 or days > 180:
         raise HTTPException(status_code=400, detail="invalid days")
 
-    rows = db.execute(
-        text(
-            """
-            SELECT
-                DATE(o.created_at) AS d,
-                COALESCE(SUM(oi.quantity * m.price), 0) AS sales,
-                COUNT(DISTINCT o.id) AS orders
-            FROM orders o
-            JOIN order_items oi ON oi.order_id = o.id
-            JOIN menus m        ON m.id = oi.menu_id
-            WHERE o.created_at >= (NOW() - (:days || ' days')::interval)
-            GROUP BY DATE(o.created_at)
-            ORDER BY d ASC;
-            """
-        ),
-        {"days": days},
-    ).fetchall()
+    start = _start_bucket(days)
+    sales: Dict[date, int] = {}
+    for r in _sales_by_bucket(db, start=start):
+        d = r.bucket.date()
+        sales[d] = sales.get(d, 0) + int(r.amt or 0)
+    orders: Dict[date, int] = {}
+    for b, n in _orders_by_bucket(db, start=start):
+        orders[b.date()] = orders.get(b.date(), 0) + int(n or 0)
 
     return [
-        {"date": r[0], "sales": int(r[1] or 0), "orders": int(r[2] or 0)}
-        for r in rows
+        {"date": d.isoformat(), "sales": sales[d], "orders": orders.get(d, 0)}
+        for d in sorted(sales)
     ]
 
 
 # ===== ここからメニュー別 =====
 
 @router.get("/menu-totals")
+@_cached_rollup
 def menu_totals(
     days: int = 30,
     limit: int = 50,
@@ -201,113 +272,59 @@ def menu_totals(
     直近 days 日のメニュー別 合計（注文件数・売上金額）
     days <= 0 なら全期間
     """
-    q = (
-        select(
-            OrderItem.menu_id.label("menu_id"),
-            Menu.name.label("name"),
-            func.sum(OrderItem.quantity).label("orders"),
-            func.sum(OrderItem.quantity * Menu.price).label("sales"),
-        )
-        .join(Menu, Menu.id == OrderItem.menu_id)
-        .join(Order, Order.id == OrderItem.order_id)
-        .group_by(OrderItem.menu_id, Menu.name)
-        .order_by(desc(func.sum(OrderItem.quantity)))
-        .limit(limit)
-    )
-
-    if days > 0:
-        from datetime import datetime, timedelta, timezone
-
-        start = datetime.now(timezone.utc) - timedelta(days=days)
-        q = q.where(Order.created_at >= start)  # type: ignore[attr-defined]
-
-    rows = db.execute(q).all()
+    rows = _menu_totals(db, days, limit)
     return [
         {
             "menu_id": r.menu_id,
             "name": r.name,
-            "orders": int(r.orders or 0),
-            "sales": int(r.sales or 0),
+            "orders": int(r.quantity or 0),
+            "sales": int(r.amount or 0),
         }
         for r in rows
     ]
 
 
 @router.get("/menu-daily")
+@_cached_rollup
 def menu_daily(
     menu_id: int = Query(..., description="対象メニューID"),
     days: int = 14,
     db: Session = Depends(get_db),
 ) -> List[Dict[str, Any]]:
     """
-    直近 days 日の 指定メニュー の日別（件数・売上）
-    PostgreSQL 版
+    直近 days 日の 指定メニュー の日別（件数・売上, JST 日付）
     """
     if days <= 0 or days > 180:
         raise HTTPException(status_code=400, detail="invalid days")
 
-    rows = db.execute(
-        text(
-            """
-            SELECT
-                DATE(o.created_at) AS d,
-                COALESCE(SUM(oi.quantity), 0)           AS orders,
-                COALESCE(SUM(oi.quantity * m.price), 0) AS sales
-            FROM orders o
-            JOIN order_items oi ON oi.order_id = o.id
-            JOIN menus m        ON m.id = oi.menu_id
-            WHERE oi.menu_id = :menu_id
-              AND o.created_at >= (NOW() - (:days || ' days')::interval)
-            GROUP BY DATE(o.created_at)
-            ORDER BY d ASC;
-            """
-        ),
-        {"menu_id": menu_id, "days": days},
-    ).fetchall()
+    by_day: Dict[date, List[int]] = {}
+    for r in _sales_by_bucket(db, start=_start_bucket(days), menu_id=menu_id):
+        acc = by_day.setdefault(r.bucket.date(), [0, 0])
+        acc[0] += int(r.qty or 0)
+        acc[1] += int(r.amt or 0)
 
     return [
-        {"date": r[0], "orders": int(r[1] or 0), "sales": int(r[2] or 0)}
-        for r in rows
+        {"date": d.isoformat(), "orders": by_day[d][0], "sales": by_day[d][1]}
+        for d in sorted(by_day)
     ]
 
 
 @router.get("/menu-hourly")
+@_cached_rollup
 def menu_hourly(
     menu_id: int,
     days: int = 7,
     db: Session = Depends(get_db),
 ) -> Dict[str, Any]:
     """
-    直近 days 日の 指定メニュー の時間別（0-23時）件数・売上
-    PostgreSQL 版
+    直近 days 日の 指定メニュー の時間別（0-23時, JST）件数・売上
     """
     try:
-        from datetime import datetime, timedelta, timezone
-
-        start = datetime.now(timezone.utc) - timedelta(days=days)
-        hour_expr = func.extract("hour", Order.created_at)
-
-        rows = db.execute(
-            select(
-                hour_expr.label("h"),
-                func.coalesce(
-                    func.sum(OrderItem.quantity), 0
-                ).label("cnt"),
-                func.coalesce(
-                    func.sum(OrderItem.quantity * Menu.price), 0
-                ).label("amt"),
-            )
-            .join(OrderItem, OrderItem.order_id == Order.id)
-            .join(Menu, Menu.id == OrderItem.menu_id)
-            .where(Order.created_at >= start)
-            .where(OrderItem.menu_id == menu_id)
-            .group_by("h")
-            .order_by("h")
-        ).all()
-
-        by_hour = {
-            int(r.h): (int(r.cnt), int(r.amt)) for r in rows if r.h is not None
-        }
+        by_hour: Dict[int, List[int]] = {}
+        for r in _sales_by_bucket(db, start=_start_bucket(days), menu_id=menu_id):
+            acc = by_hour.setdefault(r.bucket.hour, [0, 0])
+            acc[0] += int(r.qty or 0)
+            acc[1] += int(r.amt or 0)
         buckets = [
             {
                 "hour": h,
@@ -323,7 +340,110 @@ def menu_hourly(
 
 # ===== ここから需要予測 =====
 
+def _stored_forecast(db: Session, menu_id: Optional[int], days: int) -> List[Dict[str, Any]]:
+    """
+    menu_daily_forecast（train_forecast.py の出力）から今日(JST)以降 days 日分を引く。
+    同じ (menu_id, ds) に複数モデルの行があれば trained_at が新しいものを採用。
+    金額 y は yhat（数量）× 現在の Menu.price。
+    menu_id=None（全メニュー）で予測の無いメニューがある日は、そのメニュー分をヒューリスティック
+    （_weekday_avg_by_menu）で足し、heuristic_menus に menu_id を並べる（合計を過小にしないため）。
+    """
+    today = jst_now().date()
+    q = (
+        select(MenuDailyForecast, Menu.price)
+        .join(Menu, Menu.id == MenuDailyForecast.menu_id)
+        .where(MenuDailyForecast.ds >= today, MenuDailyForecast.ds < today + timedelta(days=days))
+    )
+    if menu_id is not None:
+        q = q.where(MenuDailyForecast.menu_id == menu_id)
+
+    latest: Dict[tuple, tuple] = {}
+    for f, price in db.execute(q).all():
+        key = (f.menu_id, f.ds)
+        cur = latest.get(key)
+        if cur is None or (f.trained_at or datetime.min) > (cur[0].trained_at or datetime.min):
+            latest[key] = (f, price)
+
+    by_day: Dict[date, Dict[str, Any]] = {}
+    for (_, ds), (f, price) in sorted(latest.items(), key=lambda kv: kv[0][1]):
+        p = by_day.setdefault(ds, {"date": ds.isoformat(), "y": 0.0, "yhat": 0.0, "yhat_lo": 0.0, "yhat_hi": 0.0, "_models": set(), "_trained": None, "_menus": set()})
+        p["y"] += f.yhat * price
+        p["yhat"] += f.yhat
+        p["yhat_lo"] += f.yhat_lo
+        p["yhat_hi"] += f.yhat_hi
+        p["_models"].add(f.model)
+        p["_menus"].add(f.menu_id)
+        if f.trained_at and (p["_trained"] is None or f.trained_at > p["_trained"]):
+            p["_trained"] = f.trained_at
+
+    all_menus: set = set()
+    if menu_id is None and by_day:
+        all_menus = set(db.execute(select(Menu.id).where(Menu.price.is_not(None))).scalars())
+    missing_any = sorted(set().union(*(all_menus - p["_menus"] for p in by_day.values())))
+    avg = _weekday_avg_by_menu(db, missing_any) if missing_any else {}
+
+    data = []
+    for ds in sorted(by_day):
+        p = by_day[ds]
+        models = p.pop("_models")
+        trained = p.pop("_trained")
+        missing = sorted(all_menus - p.pop("_menus"))
+        for m in missing:
+            amount, qty = avg.get(m, {}).get(ds.weekday(), (0.0, 0.0))
+            p["y"] += amount
+            p["yhat"] += qty
+            p["yhat_lo"] += qty
+            p["yhat_hi"] += qty
+        if missing:
+            models.add("heuristic")
+        p["y"] = int(round(p["y"]))
+        p["model"] = models.pop() if len(models) == 1 else "mixed"
+        p["trained_at"] = trained.isoformat() if trained else None
+        if menu_id is None:
+            p["heuristic_menus"] = missing
+        data.append(p)
+    return data
+
+
+def _weekday_avg_by_menu(db: Session, menu_ids: List[int]) -> Dict[int, Dict[int, tuple]]:
+    """
+    ヒューリスティックと同じ考え方（served の日別売上の曜日平均、その曜日が無ければ全体平均）を
+    メニューごとに。{menu_id: {weekday: (金額, 数量)}}
+    """
+    dialect = db.get_bind().dialect.name
+    d_expr = jst_date(Order.created_at, dialect)
+    if d_expr is None:
+        d_expr = func.date(Order.created_at)
+    rows = db.execute(
+        select(
+            OrderItem.menu_id.label("menu_id"),
+            d_expr.label("d"),
+            func.coalesce(func.sum(OrderItem.quantity * Menu.price), 0).label("sales"),
+            func.coalesce(func.sum(OrderItem.quantity), 0).label("qty"),
+        )
+        .join(OrderItem, OrderItem.order_id == Order.id)
+        .join(Menu, Menu.id == OrderItem.menu_id)
+        .where(Order.status == "served", OrderItem.menu_id.in_(menu_ids))
+        .group_by(OrderItem.menu_id, d_expr)
+    ).all()
+
+    per_menu: Dict[int, Dict[int, List[tuple]]] = {}
+    for r in rows:
+        d = r.d if isinstance(r.d, date) else date.fromisoformat(str(r.d)[:10])
+        per_menu.setdefault(r.menu_id, {}).setdefault(d.weekday(), []).append((float(r.sales or 0), float(r.qty or 0)))
+
+    def mean(vals: List[tuple]) -> tuple:
+        return (sum(v[0] for v in vals) / len(vals), sum(v[1] for v in vals) / len(vals))
+
+    out: Dict[int, Dict[int, tuple]] = {}
+    for m, by_w in per_menu.items():
+        overall = mean([v for vals in by_w.values() for v in vals])
+        out[m] = {w: mean(by_w[w]) if w in by_w else overall for w in range(7)}
+    return out
+
+
 @router.get("/forecast")
+@_cached
 def forecast(
     menu_id: str = Query("all", description="メニューID または 'all'"),
     days: int = Query(7, ge=1, le=31, description="何日先まで予測するか"),
@@ -331,47 +451,49 @@ def forecast(
 ) -> Dict[str, Any]:
     """
     需要予測：
-    - 過去の売上を日別に集計
-    - 曜日ごとの平均売上を求める
-    - それを使って未来 days 日分の売上金額を予測する
+    - menu_daily_forecast に今日以降の予測があればそれを返す（source=stored）
+      all で予測の無いメニューはヒューリスティックで補い、日ごとの heuristic_menus に並べる
+    - 無ければ従来のヒューリスティック（source=heuristic）
+      過去の売上を日別に集計 → 曜日ごとの平均売上 → 未来 days 日分の売上金額
     """
+    if menu_id != "all" and not menu_id.isdigit():
+        # 数字以外が来た場合は空データ
+        return {"menu_id": menu_id, "days": days, "data": []}
+    mid = None if menu_id == "all" else int(menu_id)
 
-    # 1) 日別売上を集計（orders.status = 'served' のみ対象）
-    base_sql = """
-        SELECT
-            DATE(o.created_at) AS d,
-            COALESCE(SUM(oi.quantity * m.price), 0) AS sales
-        FROM orders o
-        JOIN order_items oi ON oi.order_id = o.id
-        JOIN menus m        ON m.id = oi.menu_id
-        WHERE o.status = 'served'
-    """
+    stored = _stored_forecast(db, mid, days)
+    if stored:
+        return {"menu_id": menu_id, "days": days, "source": "stored", "data": stored}
 
-    params: Dict[str, Any] = {}
-    if menu_id != "all":
-        # 数字以外が来た場合は空データ
-        if not menu_id.isdigit():
-            return {"menu_id": menu_id, "days": days, "data": []}
-        base_sql += " AND oi.menu_id = :menu_id"
-        params["menu_id"] = int(menu_id)
-
-    base_sql += """
-        GROUP BY DATE(o.created_at)
-        ORDER BY d ASC;
-    """
+    # 1) 日別売上を集計（orders.status = 'served' のみ対象, JST 日付）
+    dialect = db.get_bind().dialect.name
+    d_expr = jst_date(Order.created_at, dialect)
+    if d_expr is None:
+        d_expr = func.date(Order.created_at)  # 未対応方言：UTC 日付で代用
 
-    rows = db.execute(text(base_sql), params).fetchall()
+    q = (
+        select(
+            d_expr.label("d"),
+            func.coalesce(func.sum(OrderItem.quantity * Menu.price), 0).label("sales"),
+        )
+        .join(OrderItem, OrderItem.order_id == Order.id)
+        .join(Menu, Menu.id == OrderItem.menu_id)
+        .where(Order.status == "served")
+        .group_by(d_expr)
+        .order_by(d_expr)
+    )
+    if mid is not None:
+        q = q.where(OrderItem.menu_id == mid)
+
+    rows = db.execute(q).all()
     if not rows:
         return {"menu_id": menu_id, "days": days, "data": []}
 
     # Python 側で日別データに整形
-    from datetime import timedelta
-
     daily: List[tuple] = []
     for r in rows:
-        d = r[0]      # date
-        sales = int(r[1] or 0)
-        daily.append((d, sales))
+        d = r.d if isinstance(r.d, date) else date.fromisoformat(str(r.d)[:10])
+        daily.append((d, int(r.sales or 0)))
 
     # 2) 曜日ごとの平均売上
     weekday_values: Dict[int, List[int]] = {i: [] for i in range(7)}
@@ -402,13 +524,104 @@ def forecast(
     return {
         "menu_id": menu_id,
         "days": days,
+        "source": "heuristic",
         "data": forecast_data,
     }
 
 
+def _parse_dates(value: Optional[str], name: str) -> List[date]:
+    if not value:
+        return []
+    try:
+        return [date.fromisoformat(v.strip()) for v in value.split(",") if v.strip()]
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"{name} は YYYY-MM-DD のカンマ区切りで指定してください")
+
+
+def _daily_history(db: Session, menu_ids: List[int], start: date, end: date) -> Dict[int, List[float]]:
+    """[start, end) の JST 日次数量（メニューごと, 古い順, 売上の無い日は 0）"""
+    n = (end - start).days
+    hist = {m: [0.0] * n for m in menu_ids}
+    rows = db.execute(
+        select(SalesHourlyRollup.menu_id, SalesHourlyRollup.bucket, SalesHourlyRollup.quantity)
+        .where(
+            SalesHourlyRollup.menu_id.in_(menu_ids),
+            SalesHourlyRollup.bucket >= datetime.combine(start, datetime.min.time()),
+            SalesHourlyRollup.bucket < datetime.combine(end, datetime.min.time()),
+        )
+    ).all()
+    for mid, bucket, qty in rows:
+        hist[mid][(bucket.date() - start).days] += qty or 0
+    return hist
+
+
+@router.get("/forecast/online")
+def forecast_online(
+    menu_id: str = Query("all", description="メニューID または 'all'"),
+    days: int = Query(7, ge=1, le=366, description="今日(JST)から何日分"),
+    holidays: Optional[str] = Query(None, description="what-if: 祝日扱いにする日（YYYY-MM-DD のカンマ区切り）"),
+    closed: Optional[str] = Query(None, description="what-if: 臨時休業日（予測 0、以降のラグにも反映）"),
+    db: Session = Depends(get_db),
+) -> Dict[str, Any]:
+    """
+    登録済みモデル（forecast_model_registry の各メニュー最新版）でその場で予測する。
+    直近の実績はロールアップから取り、学習時に固定した horizon に縛られない。
+    yhat_lo / yhat_hi はメニューごとの区間を合計したもの（全体としては保守的な幅）。
+    analytics_cache には載せない（モデルはメモリ上にあり、新しい版の登録は注文の invalidate では検知できないため）。
+    """
+    if menu_id != "all" and not menu_id.isdigit():
+        raise HTTPException(status_code=400, detail="menu_id は数値または 'all'")
+    catch_up_rollups(db)
+    extra_holidays = _parse_dates(holidays, "holidays")
+    closed_days = set(_parse_dates(closed, "closed"))
+
+    models = model_store.current(db)
+    if menu_id != "all":
+        models = {k: v for k, v in models.items() if k == int(menu_id)}
+    prices = dict(db.execute(select(Menu.id, Menu.price).where(Menu.id.in_(list(models)))).all()) if models else {}
+    targets = [models[m] for m in sorted(models) if m in prices]
+    if not targets:
+        return {"menu_id": menu_id, "days": days, "source": "registry", "models": [], "data": []}
+
+    today = jst_now().date()
+    dates = [today + timedelta(days=i) for i in range(days)]
+    need = max(history_days(m.artifact) for m in targets)
+    hist = _daily_history(db, [m.menu_id for m in targets], today - timedelta(days=need), today)
+    hol = holidays_between(dates[0], dates[-1], extra_holidays)
+
+    yhat = [0.0] * days
+    lo = [0.0] * days
+    hi = [0.0] * days
+    amount = [0.0] * days
+    for m in targets:
+        q = interval_halfwidth(m.artifact) or 0.0
+        for i, v in enumerate(predict_online(m.artifact, hist[m.menu_id], dates, holidays=hol, closed=closed_days)):
+            yhat[i] += v
+            if dates[i] not in closed_days:
+                lo[i] += max(v - q, 0.0)
+                hi[i] += v + q
+            amount[i] += v * prices[m.menu_id]
+
+    return {
+        "menu_id": menu_id,
+        "days": days,
+        "source": "registry",
+        "models": [
+            {"menu_id": m.menu_id, "model": m.model, "config": m.config, "version": m.version,
+             "trained_at": m.trained_at.isoformat() if m.trained_at else None}
+            for m in targets
+        ],
+        "data": [
+            {"date": d.isoformat(), "y": int(round(amount[i])), "yhat": yhat[i], "yhat_lo": lo[i], "yhat_hi": hi[i]}
+            for i, d in enumerate(dates)
+        ],
+    }
+
+
 # ===== ヒートマップ =====
 
 @router.get("/heatmap")
+@_cached_rollup
 def heatmap(
     menu_id: str = Query("all"),
     start: date = Query(..., description="YYYY-MM-DD"),
@@ -416,42 +629,23 @@ def heatmap(
     db: Session = Depends(get_db),
 ):
     """
-    曜日×時間帯ヒートマップ用データ（PostgreSQL版）
+    曜日×時間帯ヒートマップ用データ（JST）
     - dow: 0=Sun ... 6=Sat
     - hour: 0〜23
     - y: 数量
     """
-    params: Dict[str, object] = {"start": start, "end": end}
-    base_join = ""
+    mid = None if menu_id == "all" else int(menu_id)
+    start_b = datetime.combine(start, datetime.min.time())
+    end_b = datetime.combine(end + timedelta(days=1), datetime.min.time())
 
-    if menu_id != "all":
-        base_join = " AND oi.menu_id = :menu_id"
-        params["menu_id"] = int(menu_id)
-
-    sql = text(
-        f"""
-        SELECT
-          EXTRACT(DOW FROM o.created_at AT TIME ZONE 'Asia/Tokyo')::int  AS dow,
-          EXTRACT(HOUR FROM o.created_at AT TIME ZONE 'Asia/Tokyo')::int AS hour,
-          SUM(oi.quantity) AS y
-        FROM orders o
-        JOIN order_items oi ON oi.order_id = o.id
-        WHERE (o.created_at AT TIME ZONE 'Asia/Tokyo')::date
-              BETWEEN :start AND :end
-        {base_join}
-        GROUP BY 1, 2
-        ORDER BY 1, 2
-        """
-    )
+    cells: Dict[tuple, int] = {}
+    for r in _sales_by_bucket(db, start=start_b, end=end_b, menu_id=mid):
+        key = ((r.bucket.weekday() + 1) % 7, r.bucket.hour)  # Python は 0=Mon
+        cells[key] = cells.get(key, 0) + int(r.qty or 0)
 
-    rows = db.execute(sql, params).mappings().all()
     data = [
-        {
-            "dow": int(r["dow"]),
-            "hour": int(r["hour"]),
-            "y": int(r["y"] or 0),
-        }
-        for r in rows
+        {"dow": dow, "hour": hour, "y": y}
+        for (dow, hour), y in sorted(cells.items())
     ]
     # フロントが期待している形式
-    return {"data": data}
\ No newline at end of file
+    return {"data": data}
@@ -1,10 +1,17 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-from sqlalchemy import select
+import asyncio
+import json
+from typing import Optional
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Query, Header, Request
+from fastapi.responses import StreamingResponse
+from sqlalchemy.orm import Session, selectinload
+from sqlalchemy import select, insert
 from datetime import datetime, timezone
 
 from ..database import get_db
 from ..models import Order, OrderItem, Menu
+from ..services.order_events import broker as order_events
+from ..services.cache import analytics_cache
+from ..services.rollup import catch_up_rollups_in_background
 
 router = APIRouter(prefix="/orders", tags=["orders"])
 api_router = APIRouter(prefix="/api", tags=["orders"])
@@ -20,6 +27,78 @@ def _calc_total_from_items(items):
     # items: {"menu_id", "quantity", "price"}
     return int(sum(it["quantity"] * it["price"] for it in items))
 
+def _resolve_order_lines(db: Session, items, qty_keys):
+    """
+    items を検証し (Menu, qty) のリストに解決する。
+    - メニューは IN 句 1 回でまとめて取得（明細数に比例して往復しない）
+    - 検証順は従来どおり「明細ごとに メニュー存在 → 数量」
+    """
+    menu_ids = {it["menu_id"] for it in items}
+    menus = {
+        m.id: m
+        for m in db.execute(select(Menu).where(Menu.id.in_(menu_ids))).scalars().all()
+    }
+
+    lines = []
+    for it in items:
+        m = menus.get(it["menu_id"])
+        if not m:
+            raise HTTPException(status_code=404, detail="menu not found")
+        qty = int(it.get(qty_keys[0]) or it.get(qty_keys[1]) or 0)
+        if qty <= 0:
+            raise HTTPException(status_code=400, detail="invalid qty")
+        lines.append((m, qty))
+    return lines
+
+def _insert_order(db: Session, table_id, lines):
+    """注文ヘッダ＋明細を作成（明細は executemany で一括 INSERT）。commit は呼び出し側。"""
+    # 重要：status は 'placed' に統一（遷移表と整合）
+    order = Order(status="placed", table_id=table_id, created_at=datetime.now(timezone.utc))
+    db.add(order)
+    db.flush()  # order.id
+
+    # OrderItem.price は Menu.price のスナップショット
+    items_payload = [
+        {"menu_id": m.id, "quantity": qty, "price": int(m.price)}
+        for m, qty in lines
+    ]
+    db.execute(
+        insert(OrderItem),
+        [{"order_id": order.id, **it} for it in items_payload],
+    )
+    return order, items_payload
+
+def _publish_created(order: Order, items_payload, db: Session, background: BackgroundTasks) -> None:
+    """commit 後に呼ぶ（ロールバックされた注文を配信しないため）。"""
+    analytics_cache.invalidate()
+    # ロールアップへの取り込みはレスポンスを返した後に（analytics の GET で取り込まずに済むように）
+    background.add_task(catch_up_rollups_in_background, db.get_bind())
+    order_events.publish(
+        "order.created",
+        {
+            "id": order.id,
+            "status": order.status,
+            "table_id": order.table_id,
+            "items": items_payload,
+            "total": _calc_total_from_items(items_payload),
+        },
+    )
+
+def _order_payload(order: Order):
+    """ロード済みの order.items から詳細レスポンスを組み立てる（追加クエリなし）。"""
+    items = [
+        {"menu_id": it.menu_id, "quantity": int(it.quantity), "price": int(it.price)}
+        for it in order.items
+    ]
+    return {
+        "id": order.id,
+        "status": order.status,
+        "table_id": order.table_id,
+        "created_at": order.created_at.isoformat() if order.created_at else None,
+        "items": items,
+        "total": _calc_total_from_items(items),
+    }
+
 def _fetch_items_payload(db: Session, order_id: int):
     rows = db.execute(
         select(OrderItem).where(OrderItem.order_id == order_id)
@@ -31,16 +110,89 @@ def _fetch_items_payload(db: Session, order_id: int):
 
 @router.get("")
 def list_order_ids(status: str, db: Session = Depends(get_db)):
-    rows = db.execute(select(Order.id).where(Order.status == status)).all()
-    ids = [r.id for r in rows]
+    # 読み取り専用：該当なしは空配列（以前のプレースホルダ注文の自動作成は廃止）
+    rows = db.execute(select(Order.id).where(Order.status == status).order_by(Order.id)).all()
+    return [r.id for r in rows]
 
-    # 初期表示のための簡易プレースホルダ
-    if not ids and status == "placed":
-        o = Order(status="placed", table_id=0, created_at=datetime.now(timezone.utc))
-        db.add(o)
-        db.commit()
-        ids = [o.id]
-    return ids
+# ---- GET /orders/board（厨房ボード：注文＋明細を一括取得）----
+BOARD_MAX_LIMIT = 500
+
+@router.get("/board")
+def order_board(
+    status: str = "placed",
+    limit: int = Query(200, ge=1, le=BOARD_MAX_LIMIT),
+    cursor: Optional[int] = Query(None, description="前ページの next_cursor（この id より後を返す）"),
+    db: Session = Depends(get_db),
+):
+    """
+    status の注文を id 昇順で最大 limit 件、明細・合計つきで返す。
+    - 明細は selectinload で IN 句 1 回（注文ごとの N+1 を避ける）
+    - 続きがある場合は next_cursor を返す（キーセットページング）
+    """
+    q = (
+        select(Order)
+        .where(Order.status == status)
+        .options(selectinload(Order.items))
+        .order_by(Order.id)
+        .limit(limit + 1)
+    )
+    if cursor is not None:
+        q = q.where(Order.id > cursor)
+
+    orders = db.execute(q).scalars().all()
+    has_more = len(orders) > limit
+    orders = orders[:limit]
+    return {
+        "status": status,
+        "orders": [_order_payload(o) for o in orders],
+        "next_cursor": orders[-1].id if has_more else None,
+    }
+
+# ---- GET /orders/stream（SSE：注文作成・ステータス変更のプッシュ）----
+SSE_HEARTBEAT_SEC = 15.0
+
+def _sse_format(ev) -> str:
+    return f"id: {ev.id}\nevent: {ev.type}\ndata: {json.dumps(ev.data, ensure_ascii=False)}\n\n"
+
+@router.get("/stream")
+async def order_stream(
+    request: Request,
+    last_event_id: Optional[str] = Query(None, description="この id（<epoch>-<seq>）より後のイベントから再開"),
+    last_event_id_header: Optional[str] = Header(None, alias="Last-Event-ID"),
+):
+    """
+    text/event-stream で order.created / order.status_changed を配信する。
+    - 再接続時はブラウザが送る Last-Event-ID（または ?last_event_id=）以降を再送
+    - id は "<epoch>-<seq>"。epoch はプロセスごとに変わるので、再起動前の id は再送せず reset にする
+    - 再送できない場合は reset イベント → クライアントは /orders/board で取り直す
+    """
+    resume_from = last_event_id or last_event_id_header
+
+    sub = order_events.subscribe(resume_from)
+
+    async def _gen():
+        try:
+            for ev in sub.backlog:
+                yield _sse_format(ev)
+            while True:
+                if await request.is_disconnected():
+                    break
+                try:
+                    ev = await asyncio.wait_for(sub.queue.get(), timeout=SSE_HEARTBEAT_SEC)
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"
+                    continue
+                if ev is None:  # 切断指示（溢れ・シャットダウン）
+                    break
+                yield _sse_format(ev)
+        finally:
+            order_events.unsubscribe(sub)
+
+    return StreamingResponse(
+        _gen(),
+        media_type="text/event-stream",
+        headers={"X-Accel-Buffering": "no"},
+    )
 
 @router.get("/{order_id}")
 def get_order_detail(order_id: int, db: Session = Depends(get_db)):
@@ -66,14 +218,20 @@ def update_order_status(order_id: int, payload: dict, db: Session = Depends(get_
         raise HTTPException(status_code=400, detail="invalid status")
     if new_status not in VALID_TRANSITIONS.get(order.status, set()):
         raise HTTPException(status_code=400, detail="invalid transition")
+    old_status = order.status
     order.status = new_status
     db.add(order)
     db.commit()
+    analytics_cache.invalidate()  # forecast は status='served' を集計対象にしている
+    order_events.publish(
+        "order.status_changed",
+        {"id": order.id, "from": old_status, "to": order.status, "table_id": order.table_id},
+    )
     return {"id": order.id, "status": order.status}
 
 # ---- POST /api/orders（お客様UI用）----
 @api_router.post("/orders", status_code=201)
-def api_create_order(payload: dict, db: Session = Depends(get_db)):
+def api_create_order(payload: dict, background: BackgroundTasks, db: Session = Depends(get_db)):
     """
     items = [{menu_id, qty|quantity}, ...]
     table_no (任意)
@@ -86,26 +244,12 @@ def api_create_order(payload: dict, db: Session = Depends(get_db)):
         raise HTTPException(status_code=400, detail="empty items")
 
     # 事前チェック（メニュー存在と数量のみ）
-    for it in items:
-        m = db.get(Menu, it["menu_id"])
-        if not m:
-            raise HTTPException(status_code=404, detail="menu not found")
-        qty = int(it.get("qty") or it.get("quantity") or 0)
-        if qty <= 0:
-            raise HTTPException(status_code=400, detail="invalid qty")
+    lines = _resolve_order_lines(db, items, ("qty", "quantity"))
 
     try:
-        # 重要：status は 'placed' に統一（遷移表と整合）
-        order = Order(status="placed", table_id=table_no, created_at=datetime.now(timezone.utc))
-        db.add(order)
-        db.flush()  # order.id
-
-        for it in items:
-            m = db.get(Menu, it["menu_id"])
-            qty = int(it.get("qty") or it.get("quantity"))
-            db.add(OrderItem(order_id=order.id, menu_id=m.id, price=m.price, quantity=qty))
-
+        order, items_payload = _insert_order(db, table_no, lines)
         db.commit()
+        _publish_created(order, items_payload, db, background)
         return {"id": order.id, "status": order.status}
     except:
         db.rollback()
@@ -113,34 +257,21 @@ def api_create_order(payload: dict, db: Session = Depends(get_db)):
 
 # ---- POST /orders（スタッフ／テスト互換）----
 @router.post("")
-def create_order(payload: dict, db: Session = Depends(get_db)):
+def create_order(payload: dict, background: BackgroundTasks, db: Session = Depends(get_db)):
     items = payload.get("items") or []
     table_id = payload.get("table_id") or payload.get("table_no") or 0
     if not items:
         raise HTTPException(status_code=400, detail="empty items")
 
     # 事前チェック（メニュー存在と数量のみ）
-    for it in items:
-        m = db.get(Menu, it["menu_id"])
-        if not m:
-            raise HTTPException(status_code=404, detail="menu not found")
-        qty = int(it.get("quantity") or it.get("qty") or 0)
-        if qty <= 0:
-            raise HTTPException(status_code=400, detail="invalid qty")
+    lines = _resolve_order_lines(db, items, ("quantity", "qty"))
 
     try:
-        order = Order(status="placed", table_id=table_id, created_at=datetime.now(timezone.utc))
-        db.add(order)
-        db.flush()
-
-        for it in items:
-            m = db.get(Menu, it["menu_id"])
-            qty = int(it.get("quantity") or it.get("qty"))
-            db.add(OrderItem(order_id=order.id, menu_id=m.id, price=m.price, quantity=qty))
-
+        order, items_payload = _insert_order(db, table_id, lines)
         db.commit()
+        _publish_created(order, items_payload, db, background)
 
-        items_payload = _fetch_items_payload(db, order.id)
+        # 明細は INSERT した内容そのもの（再 SELECT しない）
         total = _calc_total_from_items(items_payload)
         return {
             "id": order.id,
@@ -150,4 +281,4 @@ def create_order(payload: dict, db: Session = Depends(get_db)):
         }
     except:
         db.rollback()
-        raise
\ No newline at end of file
+        raise
@@ -0,0 +1,64 @@
+# backend/app/scripts/purge_placeholder_orders.py
+"""
+旧 GET /orders?status=placed が空のときに自動作成していた
+プレースホルダ注文（status='placed', table_id=0, 明細なし）をバッチ削除する。
+
+実行:
+  cd backend && python -m app.scripts.purge_placeholder_orders --dry-run
+  cd backend && python -m app.scripts.purge_placeholder_orders --batch-size 5000
+"""
+import argparse
+
+from sqlalchemy import select, delete, exists
+from sqlalchemy.orm import Session
+
+from app.database import SessionLocal
+from app.models import Order, OrderItem
+
+
+def _placeholder_ids(db: Session, after_id: int, limit: int) -> list[int]:
+    q = (
+        select(Order.id)
+        .where(Order.status == "placed")
+        .where(Order.table_id == 0)
+        .where(~exists().where(OrderItem.order_id == Order.id))
+        .where(Order.id > after_id)
+        .order_by(Order.id)
+        .limit(limit)
+    )
+    return list(db.execute(q).scalars().all())
+
+
+def purge_placeholder_orders(db: Session, batch_size: int = 1000, dry_run: bool = False) -> int:
+    """削除（dry_run 時は対象）件数を返す。バッチごとに commit し、長いロックを避ける。"""
+    total = 0
+    last_id = 0
+    while True:
+        ids = _placeholder_ids(db, last_id, batch_size)
+        if not ids:
+            break
+        last_id = ids[-1]
+        if not dry_run:
+            db.execute(delete(Order).where(Order.id.in_(ids)))
+            db.commit()
+        total += len(ids)
+        print(f"{'[dry-run] ' if dry_run else ''}purged {total} orders (last id={last_id})")
+    return total
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--batch-size", type=int, default=1000)
+    ap.add_argument("--dry-run", action="store_true")
+    args = ap.parse_args()
+
+    db = SessionLocal()
+    try:
+        n = purge_placeholder_orders(db, batch_size=args.batch_size, dry_run=args.dry_run)
+    finally:
+        db.close()
+    print(f"✅ プレースホルダ注文 {n} 件を{'検出' if args.dry_run else '削除'}しました。")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,35 @@
+# backend/app/scripts/rebuild_sales_rollup.py
+"""
+analytics 用ロールアップを作り直す / 追いつかせる。
+- 通常の差分は注文の書き込み後（とキャッシュミス時）に自動で取り込まれるが、1 回あたりの件数に上限がある
+- マイグレーション 20261018_02 の適用直後はデプロイ手順としてこれを実行し、全履歴を取り込んでおく
+  （リクエスト側では上限件数ずつしか追いつかない）
+- 注文の削除・修正を行った後にも使う（--full）
+
+実行:
+  cd backend && python -m app.scripts.rebuild_sales_rollup            # 差分のみ
+  cd backend && python -m app.scripts.rebuild_sales_rollup --full     # 全件作り直し
+"""
+import argparse
+
+from app.database import SessionLocal
+from app.services.rollup import refresh_rollups, rebuild_rollups, DEFAULT_BATCH_ORDERS
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--full", action="store_true", help="ロールアップを空にして全履歴から再集計")
+    ap.add_argument("--batch-orders", type=int, default=DEFAULT_BATCH_ORDERS)
+    args = ap.parse_args()
+
+    db = SessionLocal()
+    try:
+        fn = rebuild_rollups if args.full else refresh_rollups
+        n = fn(db, batch_orders=args.batch_orders)
+    finally:
+        db.close()
+    print(f"✅ 注文 id {n} 件分をロールアップに反映しました。")
+
+
+if __name__ == "__main__":
+    main()
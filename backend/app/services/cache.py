@@ -0,0 +1,90 @@
+# app/services/cache.py
+from __future__ import annotations
+import functools
+import inspect
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, Optional, Tuple
+
+_MISSING = object()
+
+
+class TTLCache:
+    """
+    サイズ上限つき LRU ＋ TTL のプロセス内キャッシュ。
+    - invalidate() で全消去し世代を進める。計算中に無効化された結果は保存しない
+    - マルチワーカー構成ではワーカーごとに独立（他ワーカーの無効化は TTL で追従）
+    """
+
+    def __init__(self, maxsize: int = 256, ttl: float = 30.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._generation = 0
+
+    @property
+    def generation(self) -> int:
+        return self._generation
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            hit = self._data.get(key)
+            if hit is None:
+                return default
+            expires, value = hit
+            if expires < time.monotonic():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key: Hashable, value: Any, generation: Optional[int] = None) -> None:
+        with self._lock:
+            if generation is not None and generation != self._generation:
+                return
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._data.clear()
+            self._generation += 1
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def cached(self, key_exclude: Tuple[str, ...] = ("db",), before_miss: Optional[Callable[[dict], None]] = None):
+        """
+        FastAPI エンドポイント用デコレータ。キーは 関数名 ＋ キーワード引数（key_exclude 以外）。
+        functools.wraps で元のシグネチャ（Depends 含む）をそのまま FastAPI に見せる。
+        """
+        def deco(fn):
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                key = (fn.__name__,) + tuple(
+                    sorted((k, v) for k, v in kwargs.items() if k not in key_exclude)
+                )
+                value = self.get(key, _MISSING)
+                if value is not _MISSING:
+                    return value
+                gen = self._generation
+                if before_miss is not None:
+                    before_miss(kwargs)
+                value = fn(*args, **kwargs)
+                self.set(key, value, generation=gen)
+                return value
+            # `from __future__ import annotations` のモジュールでも FastAPI が型を解決できるように
+            wrapper.__signature__ = inspect.signature(fn, eval_str=True)
+            return wrapper
+        return deco
+
+
+analytics_cache = TTLCache(
+    maxsize=int(os.getenv("ANALYTICS_CACHE_MAXSIZE", "256")),
+    ttl=float(os.getenv("ANALYTICS_CACHE_TTL_SEC", "30")),
+)
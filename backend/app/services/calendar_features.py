@@ -0,0 +1,65 @@
+# app/services/calendar_features.py
+"""
+日次の学習・予測で使うカレンダー特徴量（曜日 / 月末 / 祝日）。ETL と ML で共用する。
+
+- 祝日は 祝日CSV（指定時）→ holidays パッケージ → どちらも無ければ 0
+- 年単位の表（date → dow / is_month_end / holiday）を一度だけ作って lru_cache で使い回す
+- 呼び出し側は ds で reindex / merge するだけ（行ごとの関数呼び出し・ライブラリ初期化なし）
+- API サーバ（pandas なし）からは jp_holidays() だけを使う
+"""
+from __future__ import annotations
+from datetime import date
+from functools import lru_cache
+from typing import FrozenSet, Iterable, Optional
+
+try:
+    import pandas as pd
+except ImportError:
+    pd = None
+
+CALENDAR_COLS = ["dow", "is_month_end", "holiday"]
+
+
+@lru_cache(maxsize=None)
+def jp_holidays(year: int) -> FrozenSet[date]:
+    """holidays パッケージの日本の祝日（未インストールなら空）"""
+    try:
+        import holidays  # type: ignore
+    except Exception:
+        return frozenset()
+    return frozenset(holidays.country_holidays("JP", years=year).keys())
+
+
+@lru_cache(maxsize=8)
+def load_holiday_csv(path: str) -> FrozenSet[date]:
+    """祝日一覧CSV（1列目または 'ds' 列に YYYY-MM-DD）"""
+    hol = pd.read_csv(path)
+    col = hol["ds"] if "ds" in hol.columns else hol.iloc[:, 0]
+    return frozenset(pd.to_datetime(col).dt.date)
+
+
+@lru_cache(maxsize=16)
+def calendar_table(first_year: int, last_year: int, holiday_csv: Optional[str] = None) -> pd.DataFrame:
+    """
+    first_year/1/1 〜 last_year/12/31 の表（index は日付の DatetimeIndex）。
+    キャッシュを共有するので呼び出し側で書き換えないこと。
+    """
+    idx = pd.date_range(date(first_year, 1, 1), date(last_year, 12, 31), freq="D", name="ds")
+    if holiday_csv:
+        hol = load_holiday_csv(holiday_csv)
+    else:
+        hol = frozenset().union(*(jp_holidays(y) for y in range(first_year, last_year + 1)))
+    return pd.DataFrame({
+        "dow": idx.dayofweek.astype("int64"),  # 月曜=0, …, 日曜=6
+        "is_month_end": idx.is_month_end.astype("int64"),
+        "holiday": idx.isin(pd.DatetimeIndex(sorted(hol))).astype("int64"),
+    }, index=idx)
+
+
+def calendar_for(dates: Iterable, holiday_csv: Optional[str] = None) -> pd.DataFrame:
+    """dates と同じ順・同じ長さのカレンダー特徴量（index は 0..n-1）"""
+    idx = pd.DatetimeIndex(pd.to_datetime(pd.Index(dates))).normalize()
+    if len(idx) == 0:
+        return pd.DataFrame({c: pd.Series(dtype="int64") for c in CALENDAR_COLS})
+    tbl = calendar_table(idx.min().year, idx.max().year, holiday_csv)
+    return tbl.reindex(idx).reset_index(drop=True)
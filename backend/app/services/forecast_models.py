@@ -0,0 +1,172 @@
+# app/services/forecast_models.py
+"""
+需要予測モデルのレジストリ（forecast_model_registry）の読み出しとオンライン推論。
+
+- train_forecast.py が登録した JSON artifact（linear / baseline）をメモリに載せ、純 Python で再帰予測する
+  （API サーバに numpy / pandas / sklearn は不要）
+- 任意の日数、what-if（臨時休業日・追加の祝日）に対応
+- 予測区間は artifact の interval.q（split conformal の半幅）を yhat の上下に付ける
+- レジストリの最大 id を一定間隔で確認し、新しい版が登録されていれば読み直す
+"""
+from __future__ import annotations
+import json
+import os
+import threading
+import time
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta
+from typing import Any, Container, Dict, List, Optional, Sequence
+
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+
+from ..models import ForecastModelRegistry
+from .calendar_features import jp_holidays
+
+# ベースライン名 → (集約方法, 遡る週数)。同じ曜日の過去 k 週の実績をまとめる（train_forecast と共用）
+BASELINE_SPECS = {
+    "naive_tminus7": ("mean", 1),
+    "seasonal_ma_k2": ("mean", 2),
+    "seasonal_ma_k4": ("mean", 4),
+    "seasonal_median_k4": ("median", 4),
+    "seasonal_ewma_k8": ("ewma", 8),
+}
+# seasonal_ewma：1 週古くなるごとに重みをこの倍率で減らす
+SEASONAL_EWMA_DECAY = 0.5
+
+
+def baseline_weights(name: str) -> List[float]:
+    """過去 1..k 週の重み（mean は等重み。median では使わない）"""
+    kind, k = BASELINE_SPECS[name]
+    if kind == "ewma":
+        return [SEASONAL_EWMA_DECAY ** i for i in range(k)]
+    return [1.0] * k
+
+
+@dataclass(frozen=True)
+class RegisteredModel:
+    menu_id: int
+    config: str
+    version: int
+    model: str
+    artifact: Dict[str, Any]
+    trained_at: Optional[datetime]
+
+
+def history_days(art: Dict[str, Any]) -> int:
+    """予測に必要な直近の日数"""
+    if art["kind"] == "linear":
+        return int(art["n_lags"])
+    return 7 * BASELINE_SPECS[art["name"]][1]
+
+
+def _is_month_end(d: date) -> bool:
+    return (d + timedelta(days=1)).day == 1
+
+
+def _linear_step(art: Dict[str, Any], ys: List[float], d: date, holiday: bool) -> float:
+    n = int(art["n_lags"])
+    lags = ys[-1:-n - 1:-1]  # lag1（前日）, lag2, ...
+    if len(lags) < n:
+        # 履歴が足りない新メニューは手元の平均で埋める（train_forecast の global と同じ）
+        fill = sum(lags) / len(lags) if lags else 0.0
+        lags = lags + [fill] * (n - len(lags))
+    return (
+        art["intercept"]
+        + sum(w * v for w, v in zip(art["lag_w"], lags))
+        + art["is_month_end_w"] * _is_month_end(d)
+        + art["holiday_w"] * holiday
+        + art["dow_w"][d.weekday()]
+    )
+
+
+def _baseline_step(art: Dict[str, Any], ys: List[float]) -> float:
+    kind, k = BASELINE_SPECS[art["name"]]
+    got = [(ys[-7 * i], w) for i, w in zip(range(1, k + 1), baseline_weights(art["name"])) if len(ys) >= 7 * i]
+    if not got:
+        return 0.0
+    if kind == "median":
+        vals = sorted(v for v, _ in got)
+        mid = len(vals) // 2
+        return vals[mid] if len(vals) % 2 else (vals[mid - 1] + vals[mid]) / 2
+    return sum(v * w for v, w in got) / sum(w for _, w in got)
+
+
+def predict(
+    art: Dict[str, Any],
+    history: Sequence[float],
+    dates: Sequence[date],
+    holidays: Container[date] = frozenset(),
+    closed: Container[date] = frozenset(),
+) -> List[float]:
+    """
+    history は dates[0] の前日までの日次数量（古い順）。予測値は次の日のラグとして使う（再帰）。
+    closed の日は 0 とし、その 0 も以降のラグ・季節平均に入る。
+    ベースラインは学習時と同じ式を、予測値も履歴とみなして horizon 以降へ延長する。
+    """
+    ys = [float(v) for v in history]
+    out: List[float] = []
+    for d in dates:
+        if d in closed:
+            v = 0.0
+        elif art["kind"] == "linear":
+            v = _linear_step(art, ys, d, d in holidays)
+        else:
+            v = _baseline_step(art, ys)
+        ys.append(v)
+        out.append(v)
+    return out
+
+
+def interval_halfwidth(art: Dict[str, Any]) -> Optional[float]:
+    """学習時のバックテスト残差から求めた予測区間の半幅（無ければ None）"""
+    return (art.get("interval") or {}).get("q")
+
+
+def holidays_between(start: date, end: date, extra: Sequence[date] = ()) -> frozenset:
+    years = range(start.year, end.year + 1)
+    return frozenset().union(*(jp_holidays(y) for y in years), extra)
+
+
+class ModelStore:
+    """各メニューの最新版モデルのプロセス内キャッシュ（ワーカーごとに独立）"""
+
+    def __init__(self, reload_sec: float = 60.0):
+        self.reload_sec = reload_sec
+        self._lock = threading.Lock()
+        self._models: Dict[int, RegisteredModel] = {}
+        self._loaded_id: Optional[int] = None
+        self._checked = float("-inf")
+
+    def current(self, db: Session) -> Dict[int, RegisteredModel]:
+        with self._lock:
+            now = time.monotonic()
+            if now - self._checked >= self.reload_sec:
+                latest = db.execute(select(func.max(ForecastModelRegistry.id))).scalar()
+                self._checked = now
+                if latest != self._loaded_id:
+                    self._models = self._load(db)
+                    self._loaded_id = latest
+            return self._models
+
+    def invalidate(self) -> None:
+        """次の current() で必ず読み直す"""
+        with self._lock:
+            self._checked = float("-inf")
+            self._loaded_id = None
+
+    @staticmethod
+    def _load(db: Session) -> Dict[int, RegisteredModel]:
+        # メニューごとに最後に登録された行（設定をまたいで最新の学習結果）
+        latest_ids = select(func.max(ForecastModelRegistry.id)).group_by(ForecastModelRegistry.menu_id)
+        rows = db.execute(select(ForecastModelRegistry).where(ForecastModelRegistry.id.in_(latest_ids))).scalars()
+        return {
+            r.menu_id: RegisteredModel(
+                menu_id=r.menu_id, config=r.config, version=r.version, model=r.model,
+                artifact=json.loads(r.artifact), trained_at=r.trained_at,
+            )
+            for r in rows
+        }
+
+
+model_store = ModelStore(reload_sec=float(os.getenv("FORECAST_MODEL_RELOAD_SEC", "60")))
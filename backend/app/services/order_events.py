@@ -0,0 +1,128 @@
+# app/services/order_events.py
+from __future__ import annotations
+import asyncio
+import itertools
+import os
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, Deque, Dict, List, Optional, Set, Tuple
+
+# 再接続時の再送に使う直近イベント数
+DEFAULT_HISTORY = 1000
+# 1購読者あたりの未送信イベント上限（超えたら切断→クライアントが Last-Event-ID で再接続）
+DEFAULT_QUEUE_SIZE = 256
+
+
+@dataclass(frozen=True)
+class OrderEvent:
+    seq: int             # プロセス内の通し番号（1 から）
+    type: str            # order.created / order.status_changed / reset
+    data: Dict[str, Any]
+    epoch: str = ""
+
+    @property
+    def id(self) -> str:
+        """SSE の id（"<epoch>-<seq>"）"""
+        return f"{self.epoch}-{self.seq}"
+
+
+def _new_epoch() -> str:
+    """プロセスごとの起動 id（再起動で seq が 1 に戻っても古い Last-Event-ID と区別できる）"""
+    return f"{time.time_ns():x}{os.urandom(2).hex()}"
+
+
+def parse_event_id(value: Optional[str]) -> Optional[Tuple[str, int]]:
+    """"<epoch>-<seq>" → (epoch, seq)。形式が違えば None"""
+    epoch, sep, seq = (value or "").rpartition("-")
+    if not sep or not epoch or not seq.isdigit():
+        return None
+    return epoch, int(seq)
+
+
+@dataclass(eq=False)
+class Subscription:
+    loop: asyncio.AbstractEventLoop
+    queue: "asyncio.Queue[Optional[OrderEvent]]"
+    backlog: List[OrderEvent] = field(default_factory=list)
+
+
+class OrderEventBroker:
+    """
+    プロセス内の注文イベント fan-out。
+    - publish はスレッドセーフ（同期エンドポイントはスレッドプールで動くため）
+    - subscribe は購読開始と同時に last_event_id 以降の履歴を backlog として返す
+    - 履歴から溢れた id・別プロセス（再起動前）の id を指定された場合は reset イベントを先頭に付ける
+    """
+
+    def __init__(self, history: int = DEFAULT_HISTORY, queue_size: int = DEFAULT_QUEUE_SIZE):
+        self._lock = threading.Lock()
+        self.epoch = _new_epoch()
+        self._ids = itertools.count(1)
+        self._last_id = 0
+        self._history: Deque[OrderEvent] = deque(maxlen=history)
+        self._subscribers: Set[Subscription] = set()
+        self._queue_size = queue_size
+
+    @property
+    def last_event_id(self) -> str:
+        return f"{self.epoch}-{self._last_id}"
+
+    def publish(self, type_: str, data: Dict[str, Any]) -> OrderEvent:
+        with self._lock:
+            ev = OrderEvent(seq=next(self._ids), type=type_, data=data, epoch=self.epoch)
+            self._last_id = ev.seq
+            self._history.append(ev)
+            subs = list(self._subscribers)
+        for sub in subs:
+            try:
+                sub.loop.call_soon_threadsafe(self._deliver, sub, ev)
+            except RuntimeError:
+                # ループが既に閉じている購読者
+                self.unsubscribe(sub)
+        return ev
+
+    def _deliver(self, sub: Subscription, ev: Optional[OrderEvent]) -> None:
+        try:
+            sub.queue.put_nowait(ev)
+        except asyncio.QueueFull:
+            # 取りこぼしを黙って続けるより切断して再接続（再送）させる
+            self.unsubscribe(sub)
+            while not sub.queue.empty():
+                sub.queue.get_nowait()
+            sub.queue.put_nowait(None)
+
+    def subscribe(self, last_event_id: Optional[str] = None) -> Subscription:
+        """イベントループ上で呼ぶこと。last_event_id は "<epoch>-<seq>"（以前に配信した id）"""
+        sub = Subscription(loop=asyncio.get_running_loop(), queue=asyncio.Queue(self._queue_size))
+        with self._lock:
+            if last_event_id is not None:
+                parsed = parse_event_id(last_event_id)
+                oldest = self._history[0].seq if self._history else self._last_id + 1
+                if (parsed is None or parsed[0] != self.epoch
+                        or parsed[1] < oldest - 1 or parsed[1] > self._last_id):
+                    # 再送できない（プロセス再起動 / 履歴切れ）→ 全件取り直しを促す
+                    sub.backlog.append(OrderEvent(seq=self._last_id, type="reset", data={}, epoch=self.epoch))
+                else:
+                    sub.backlog.extend(e for e in self._history if e.seq > parsed[1])
+            self._subscribers.add(sub)
+        return sub
+
+    def unsubscribe(self, sub: Subscription) -> None:
+        with self._lock:
+            self._subscribers.discard(sub)
+
+    def close(self) -> None:
+        """全購読者のストリームを終了させる（シャットダウン用）。"""
+        with self._lock:
+            subs = list(self._subscribers)
+            self._subscribers.clear()
+        for sub in subs:
+            try:
+                sub.loop.call_soon_threadsafe(self._deliver, sub, None)
+            except RuntimeError:
+                pass
+
+
+broker = OrderEventBroker()
@@ -0,0 +1,210 @@
+# app/services/rollup.py
+"""
+analytics 用ロールアップ（sales_hourly_rollup / order_hourly_rollup）の差分更新。
+
+- sync_watermarks に「処理済みの最大 orders.id」を持ち、それより新しい注文が触れた JST 時刻バケットを
+  集計し直して置き換える（加算ではないので、同じバケットを何度集計し直しても二重に数えない）
+- commit が id 順と逆転して watermark より小さい id が後から見えることがある（PostgreSQL）。
+  毎回 watermark の RESCAN_IDS 手前からの id も見直し、それらが触れたバケットも集計し直す
+- API 経由以外（シードスクリプト等）で入った注文も次回の refresh で取り込まれる
+- 同時実行は watermark の比較更新（CAS）で排他し、負けた側はロールバックする
+- 取り込みは注文の書き込み後（バックグラウンド）と analytics のキャッシュミス時に、どちらも上限つきで行う。
+  全履歴の取り込み（マイグレーション直後など）はデプロイ手順として
+  `python -m app.scripts.rebuild_sales_rollup` を実行する
+"""
+from __future__ import annotations
+import os
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple, Union
+
+from sqlalchemy import select, func, update, delete, insert
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.orm import Session
+
+from ..models import Order, OrderItem, SalesHourlyRollup, OrderHourlyRollup, SyncWatermark
+from .timebucket import JST, jst_hour_bucket, utc_bound
+
+WATERMARK_NAME = "sales_rollup.last_order_id"
+DEFAULT_BATCH_ORDERS = 20_000
+# リクエスト処理中（書き込み後のバックグラウンド / analytics のキャッシュミス）に取り込む注文 id 数の上限
+REQUEST_CATCHUP_ORDERS = int(os.getenv("ROLLUP_REQUEST_CATCHUP_ORDERS", "2000"))
+
+# 取り込みのたびに見直す watermark 手前の id 数。id を採番してから commit するまでの間に、これ以上の id が
+# 採番されて取り込みまで進んだ注文は取りこぼす（その場合は rebuild_sales_rollup --full で作り直す）
+RESCAN_IDS = int(os.getenv("ROLLUP_RESCAN_IDS", "1000"))
+
+
+def to_jst_bucket(dt: datetime) -> datetime:
+    """created_at（naive は UTC とみなす）→ JST の時刻バケット（naive）"""
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return dt.astimezone(JST).replace(minute=0, second=0, microsecond=0, tzinfo=None)
+
+
+def jst_now() -> datetime:
+    return datetime.now(JST).replace(tzinfo=None)
+
+
+# ---------- バケットの置き換え ----------
+def _replace_buckets(db: Session, buckets: List[datetime], sales_rows: List[Dict], order_rows: List[Dict]) -> None:
+    """buckets のロールアップ行を消して、集計し直した行を入れる"""
+    for i in range(0, len(buckets), 500):
+        chunk = buckets[i:i + 500]
+        db.execute(delete(SalesHourlyRollup).where(SalesHourlyRollup.bucket.in_(chunk)))
+        db.execute(delete(OrderHourlyRollup).where(OrderHourlyRollup.bucket.in_(chunk)))
+    if sales_rows:
+        db.execute(insert(SalesHourlyRollup), sales_rows)
+    if order_rows:
+        db.execute(insert(OrderHourlyRollup), order_rows)
+
+
+# ---------- watermark ----------
+def _read_watermark(db: Session) -> Tuple[bool, int]:
+    row = db.get(SyncWatermark, WATERMARK_NAME)
+    return (row is not None, int(row.value) if row else 0)
+
+
+def _advance_watermark(db: Session, exists: bool, old: int, new: int) -> bool:
+    """old → new に進める。他プロセスが先に進めていたら False。"""
+    if not exists:
+        db.add(SyncWatermark(name=WATERMARK_NAME, value=str(new)))
+        try:
+            db.flush()
+        except IntegrityError:
+            return False
+        return True
+    res = db.execute(
+        update(SyncWatermark)
+        .where(SyncWatermark.name == WATERMARK_NAME, SyncWatermark.value == str(old))
+        .values(value=str(new))
+    )
+    return res.rowcount == 1
+
+
+# ---------- 集計 ----------
+def _aggregate_sql(db: Session, conds: Sequence, bucket) -> Tuple[List[Dict], List[Dict]]:
+    """JST バケットへの丸めと集計を DB 側で行う（転送行数 = メニュー × 時間数）。"""
+    in_range = tuple(conds)
+    sales = db.execute(
+        select(
+            OrderItem.menu_id.label("menu_id"),
+            bucket.label("bucket"),
+            func.coalesce(func.sum(OrderItem.quantity), 0).label("quantity"),
+            func.count().label("lines"),
+        )
+        .join(Order, Order.id == OrderItem.order_id)
+        .where(*in_range)
+        .group_by(OrderItem.menu_id, bucket)
+    ).mappings().all()
+    orders = db.execute(
+        select(bucket.label("bucket"), func.count(func.distinct(Order.id)).label("orders"))
+        .join(OrderItem, OrderItem.order_id == Order.id)
+        .where(*in_range)
+        .group_by(bucket)
+    ).mappings().all()
+    return [dict(r) for r in sales], [dict(r) for r in orders]
+
+
+def _aggregate(rows: Iterable) -> Tuple[List[Dict], List[Dict]]:
+    """SQL 式を組めない方言向け：明細行を Python で JST バケットに集計する。"""
+    sales: Dict[Tuple[int, datetime], List[int]] = defaultdict(lambda: [0, 0])
+    orders: Dict[datetime, set] = defaultdict(set)
+    for order_id, created_at, menu_id, quantity in rows:
+        b = to_jst_bucket(created_at)
+        acc = sales[(menu_id, b)]
+        acc[0] += int(quantity or 0)
+        acc[1] += 1
+        orders[b].add(order_id)
+    sales_rows = [
+        {"menu_id": mid, "bucket": b, "quantity": q, "lines": n}
+        for (mid, b), (q, n) in sales.items()
+    ]
+    order_rows = [{"bucket": b, "orders": len(ids)} for b, ids in orders.items()]
+    return sales_rows, order_rows
+
+
+def _upper_order_id(db: Session) -> int:
+    return int(db.execute(select(func.max(Order.id))).scalar() or 0)
+
+
+def _touched_buckets(db: Session, lo: int, hi: int, bucket) -> List[datetime]:
+    """id が (lo, hi] の注文の JST 時刻バケット"""
+    if bucket is not None:
+        q = select(bucket.label("bucket")).where(Order.id > lo, Order.id <= hi).distinct()
+        return sorted(db.execute(q).scalars())
+    rows = db.execute(select(Order.created_at).where(Order.id > lo, Order.id <= hi)).scalars()
+    return sorted({to_jst_bucket(c) for c in rows})
+
+
+def _recompute_buckets(db: Session, buckets: List[datetime], hi: int, bucket) -> Tuple[List[Dict], List[Dict]]:
+    """buckets に入る id <= hi の注文をすべて集計し直す（created_at の範囲で絞るのでインデックスが効く）"""
+    dialect = db.get_bind().dialect.name
+    lo_ts = utc_bound(buckets[0].replace(tzinfo=JST), dialect)
+    hi_ts = utc_bound((buckets[-1] + timedelta(hours=1)).replace(tzinfo=JST), dialect)
+    conds = (Order.id <= hi, Order.created_at >= lo_ts, Order.created_at < hi_ts)
+    if bucket is not None:
+        sales_rows, order_rows = _aggregate_sql(db, conds, bucket)
+    else:
+        sales_rows, order_rows = _aggregate(db.execute(
+            select(Order.id, Order.created_at, OrderItem.menu_id, OrderItem.quantity)
+            .join(OrderItem, OrderItem.order_id == Order.id)
+            .where(*conds)
+        ).all())
+    # 範囲の途中にある、触れていないバケットはそのまま
+    keep = set(buckets)
+    return [r for r in sales_rows if r["bucket"] in keep], [r for r in order_rows if r["bucket"] in keep]
+
+
+def refresh_rollups(db: Session, batch_orders: int = DEFAULT_BATCH_ORDERS, max_orders: Optional[int] = None) -> int:
+    """
+    watermark 以降の注文をロールアップへ反映し、取り込んだ注文 id 範囲の件数を返す。
+    max_orders を指定すると、その件数分で打ち切る（残りは次回）。
+    """
+    processed = 0
+    upper = _upper_order_id(db)
+    while True:
+        exists, last = _read_watermark(db)
+        if upper <= last or (max_orders is not None and processed >= max_orders):
+            db.rollback()  # 読み取りトランザクションを閉じる
+            return processed
+        hi = min(upper, last + batch_orders)
+        if max_orders is not None:
+            hi = min(hi, last + max_orders - processed)
+
+        try:
+            if not _advance_watermark(db, exists, last, hi):
+                db.rollback()
+                return processed
+            bucket = jst_hour_bucket(Order.created_at, db.get_bind().dialect.name)
+            # 前回までに見えていなかった（commit が遅れた）手前の id も拾う
+            buckets = _touched_buckets(db, max(last - RESCAN_IDS, 0), hi, bucket)
+            if buckets:
+                _replace_buckets(db, buckets, *_recompute_buckets(db, buckets, hi, bucket))
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        processed += hi - last
+
+
+def catch_up_rollups(db: Session, max_orders: Optional[int] = None) -> int:
+    """リクエスト処理中に使う上限つきの refresh_rollups（初回の大量取り込みでリクエストを止めない）"""
+    max_orders = max_orders or REQUEST_CATCHUP_ORDERS
+    return refresh_rollups(db, batch_orders=min(DEFAULT_BATCH_ORDERS, max_orders), max_orders=max_orders)
+
+
+def catch_up_rollups_in_background(bind: Union[Engine, Connection]) -> int:
+    """注文の書き込み後に BackgroundTasks から呼ぶ（リクエストのセッションは閉じているので別セッションで）"""
+    with Session(bind=bind) as db:
+        return catch_up_rollups(db)
+
+
+def rebuild_rollups(db: Session, batch_orders: int = DEFAULT_BATCH_ORDERS) -> int:
+    """ロールアップを空にして全履歴から作り直す（注文の削除・修正後に使う）。"""
+    db.execute(delete(SalesHourlyRollup))
+    db.execute(delete(OrderHourlyRollup))
+    db.execute(delete(SyncWatermark).where(SyncWatermark.name == WATERMARK_NAME))
+    db.commit()
+    return refresh_rollups(db, batch_orders=batch_orders)
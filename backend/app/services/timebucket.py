@@ -0,0 +1,56 @@
+# app/services/timebucket.py
+"""
+JST の日付・時刻バケットを DB 方言ごとの SQL 式で組み立てる（SQLite / PostgreSQL）。
+
+- created_at は UTC で保存されている前提
+  （SQLite: naive な UTC 文字列 / PostgreSQL: timestamptz）
+- 期間の絞り込みは jst_day_range_utc() で UTC の境界に直して created_at を直接比較する
+  （列を関数で包まないのでインデックスが効く）
+- 未対応の方言では None を返すので、呼び出し側は Python 側で計算する
+"""
+from __future__ import annotations
+from datetime import date, datetime, time, timedelta, timezone
+from typing import Optional, Tuple
+
+from sqlalchemy import Date, DateTime, cast, func, type_coerce
+from sqlalchemy.sql.elements import ColumnElement
+
+JST = timezone(timedelta(hours=9))
+JST_TZ_NAME = "Asia/Tokyo"
+SQLITE_JST_OFFSET = "+9 hours"
+
+
+def _pg_jst(col) -> ColumnElement:
+    # timestamptz → JST の timestamp（tz なし）
+    return func.timezone(JST_TZ_NAME, col)
+
+
+def jst_date(col, dialect: str) -> Optional[ColumnElement]:
+    """JST の日付（Python では date として返る）"""
+    if dialect == "postgresql":
+        return cast(_pg_jst(col), Date)
+    if dialect == "sqlite":
+        return type_coerce(func.date(col, SQLITE_JST_OFFSET), Date())
+    return None
+
+
+def jst_hour_bucket(col, dialect: str) -> Optional[ColumnElement]:
+    """JST の時刻を時単位に切り捨てたもの（Python では naive datetime）"""
+    if dialect == "postgresql":
+        return func.date_trunc("hour", _pg_jst(col))
+    if dialect == "sqlite":
+        return type_coerce(func.strftime("%Y-%m-%d %H:00:00", col, SQLITE_JST_OFFSET), DateTime())
+    return None
+
+
+def jst_day_range_utc(start: date, end: date) -> Tuple[datetime, datetime]:
+    """JST の [start, end]（両端含む）を UTC の半開区間 [lo, hi) に変換"""
+    lo = datetime.combine(start, time.min, tzinfo=JST).astimezone(timezone.utc)
+    hi = datetime.combine(end + timedelta(days=1), time.min, tzinfo=JST).astimezone(timezone.utc)
+    return lo, hi
+
+
+def utc_bound(dt: datetime, dialect: str) -> datetime:
+    """比較用の境界値。SQLite は naive UTC 文字列で保存しているので tz を外す。"""
+    dt = dt.astimezone(timezone.utc) if dt.tzinfo else dt
+    return dt.replace(tzinfo=None) if dialect == "sqlite" else dt
@@ -0,0 +1,19 @@
+-- menu_daily_train_quality: day2_build_menu_daily_train.py の品質チェック結果（実行ごと・メニューごとに追記）
+-- 無ければ day2_build_menu_daily_train.py が to_sql で作るが、型を固定したい場合は先に作っておく
+CREATE TABLE IF NOT EXISTS menu_daily_train_quality (
+    run_at        TIMESTAMP   NOT NULL,
+    menu_id       INTEGER     NOT NULL,
+    rows          INTEGER     NOT NULL, -- チェックした行数（--incremental では書いた範囲のみ）
+    first_ds      DATE        NOT NULL,
+    last_ds       DATE        NOT NULL,
+    negatives     INTEGER     NOT NULL, -- y < 0 の行
+    duplicates    INTEGER     NOT NULL, -- 同じ (menu_id, ds) の 2 行目以降
+    gaps          INTEGER     NOT NULL, -- 日付の穴の数
+    missing_days  INTEGER     NOT NULL, -- 穴で抜けている日数の合計
+    outliers      INTEGER     NOT NULL, -- |y - 中央値| > z × 1.4826 × MAD の行
+    zero_runs     INTEGER     NOT NULL, -- 0 が min_zero_run 日以上続いた区間の数
+    max_zero_run  INTEGER     NOT NULL, -- 0 が続いた最長の日数
+    ok            INTEGER     NOT NULL  -- 1: 負値・重複・穴なし（外れ値と 0 の連続は警告のみ）
+);
+
+CREATE INDEX IF NOT EXISTS ix_menu_daily_train_quality_menu_run ON menu_daily_train_quality (menu_id, run_at);
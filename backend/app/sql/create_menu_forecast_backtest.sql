@@ -0,0 +1,19 @@
+-- menu_forecast_backtest: train_forecast.py のローリング起点バックテスト結果（実行ごとに追記）
+-- 無ければ train_forecast.py が to_sql で作るが、型を固定したい場合は先に作っておく
+CREATE TABLE IF NOT EXISTS menu_forecast_backtest (
+    run_at      TIMESTAMP   NOT NULL,
+    menu_id     INTEGER     NOT NULL,
+    model       TEXT        NOT NULL, -- 'ridge' / 'lasso' / 'prophet'
+    baseline    TEXT        NOT NULL, -- 'seasonal_ma_k4' など
+    horizon     INTEGER     NOT NULL,
+    folds       INTEGER     NOT NULL, -- 実際に使えた fold 数
+    mae_ml      REAL,                 -- fold が 0 のときは NULL
+    mape_ml     REAL,                 -- %（y>0 の日のみ）
+    bias_ml     REAL,                 -- 平均(yhat - y)
+    mae_base    REAL,
+    mape_base   REAL,
+    bias_base   REAL,
+    win         INTEGER     NOT NULL  -- 1: ML 採用
+);
+
+CREATE INDEX IF NOT EXISTS ix_menu_forecast_backtest_menu_run ON menu_forecast_backtest (menu_id, run_at);
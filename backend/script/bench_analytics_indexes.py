@@ -0,0 +1,141 @@
+"""
+orders / order_items インデックスの効果測定（SQLite 一時DB）
+- N 件の注文（1注文 1〜3 明細）を過去 365 日に分散して投入
+- analytics 相当のクエリを インデックス無し → 有り で計測
+実行:
+  cd backend && python script/bench_analytics_indexes.py --orders 1000000
+"""
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import create_engine, select, func, desc, text
+
+# backend を sys.path に追加（script/ から直接実行するため）
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if BACKEND_DIR not in sys.path:
+    sys.path.append(BACKEND_DIR)
+
+from app.database import Base
+from app.models import Menu, Order, OrderItem
+
+NEW_INDEXES = ("ix_orders_status_created_at", "ix_orders_created_at", "ix_order_items_covering")
+
+
+def populate(engine, n_orders: int, n_menus: int = 60, seed: int = 0) -> None:
+    rnd = random.Random(seed)
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+    prices = [rnd.choice([390, 450, 520, 650, 680]) for _ in range(n_menus)]
+    statuses = ["served"] * 18 + ["cooking", "placed"]
+
+    with engine.begin() as conn:
+        conn.execute(
+            Menu.__table__.insert(),
+            [{"id": i + 1, "name": f"menu{i + 1}", "price": p} for i, p in enumerate(prices)],
+        )
+
+    chunk = 50_000
+    item_id = 0
+    for start in range(0, n_orders, chunk):
+        orders, items = [], []
+        for oid in range(start + 1, min(start + chunk, n_orders) + 1):
+            created = now - timedelta(minutes=rnd.randrange(365 * 24 * 60))
+            orders.append({"id": oid, "status": rnd.choice(statuses), "table_id": rnd.randint(1, 20), "created_at": created})
+            for mid in rnd.sample(range(1, n_menus + 1), k=rnd.randint(1, 3)):
+                item_id += 1
+                items.append({"id": item_id, "order_id": oid, "menu_id": mid, "price": prices[mid - 1], "quantity": rnd.choice([1, 1, 2])})
+        with engine.begin() as conn:
+            conn.execute(Order.__table__.insert(), orders)
+            conn.execute(OrderItem.__table__.insert(), items)
+
+
+def queries():
+    now = datetime.now(timezone.utc)
+    start_7d = now - timedelta(days=7)
+    start_30d = now - timedelta(days=30)
+    return {
+        "orders?status=placed": select(Order.id).where(Order.status == "placed").order_by(Order.id),
+        "summary(7d) count": select(func.count(Order.id)).where(Order.created_at >= start_7d),
+        "summary(7d) amount": (
+            select(func.coalesce(func.sum(OrderItem.quantity * Menu.price), 0))
+            .join(Menu, Menu.id == OrderItem.menu_id)
+            .join(Order, Order.id == OrderItem.order_id)
+            .where(Order.created_at >= start_7d)
+        ),
+        "top-menus(30d)": (
+            select(OrderItem.menu_id, func.sum(OrderItem.quantity))
+            .join(Order, Order.id == OrderItem.order_id)
+            .where(Order.created_at >= start_30d)
+            .group_by(OrderItem.menu_id)
+            .order_by(desc(func.sum(OrderItem.quantity)))
+            .limit(10)
+        ),
+        "hourly(7d)": (
+            select(func.extract("hour", Order.created_at).label("h"), func.count(Order.id))
+            .join(OrderItem, OrderItem.order_id == Order.id)
+            .where(Order.created_at >= start_7d)
+            .group_by("h")
+        ),
+        "served daily (forecast)": text(
+            "SELECT DATE(o.created_at), SUM(oi.quantity) FROM orders o "
+            "JOIN order_items oi ON oi.order_id = o.id "
+            "WHERE o.status = 'served' AND o.created_at >= :start GROUP BY DATE(o.created_at)"
+        ).bindparams(start=start_30d.replace(tzinfo=None)),
+    }
+
+
+def time_queries(engine, repeat: int) -> dict:
+    out = {}
+    with engine.connect() as conn:
+        for name, q in queries().items():
+            best = float("inf")
+            for _ in range(repeat):
+                t0 = time.perf_counter()
+                conn.execute(q).all()
+                best = min(best, time.perf_counter() - t0)
+            out[name] = best
+    return out
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--orders", type=int, default=1_000_000)
+    ap.add_argument("--repeat", type=int, default=3)
+    args = ap.parse_args()
+
+    fd, path = tempfile.mkstemp(suffix=".sqlite")
+    os.close(fd)
+    engine = create_engine(f"sqlite:///{path}")
+    try:
+        Base.metadata.create_all(engine)
+        with engine.begin() as conn:
+            for ix in NEW_INDEXES:
+                conn.execute(text(f"DROP INDEX IF EXISTS {ix}"))
+
+        t0 = time.perf_counter()
+        populate(engine, args.orders)
+        print(f"populated {args.orders:,} orders in {time.perf_counter() - t0:.1f}s")
+
+        before = time_queries(engine, args.repeat)
+        with engine.begin() as conn:
+            for ix in (i for i in Base.metadata.tables["orders"].indexes | Base.metadata.tables["order_items"].indexes if i.name in NEW_INDEXES):
+                ix.create(conn)
+            conn.execute(text("ANALYZE"))
+        after = time_queries(engine, args.repeat)
+
+        print(f"\n{'query':<26}{'before[ms]':>12}{'after[ms]':>12}{'speedup':>10}")
+        for name in before:
+            b, a = before[name] * 1000, after[name] * 1000
+            print(f"{name:<26}{b:>12.1f}{a:>12.1f}{b / a if a else float('inf'):>9.1f}x")
+    finally:
+        engine.dispose()
+        os.unlink(path)
+
+
+if __name__ == "__main__":
+    main()
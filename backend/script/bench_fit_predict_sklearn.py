@@ -0,0 +1,100 @@
+"""
+fit_predict_sklearn の再帰予測ループの計測（合成データ、DB 不要）
+- 旧実装（1 日ごとに DataFrame を作って pipe.predict）と現実装を同じ入力で比較
+- 予測値が一致することも確認する
+実行:
+  cd backend && python script/bench_fit_predict_sklearn.py --menus 100 --horizon 31
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+# backend を sys.path に追加（script/ から直接実行するため）
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if BACKEND_DIR not in sys.path:
+    sys.path.append(BACKEND_DIR)
+
+from app.ml import train_forecast as tf
+
+
+def _make_holiday_flag(dates: pd.Series) -> pd.Series:
+    """変更前の祝日フラグ（呼び出しごとに holidays を初期化）"""
+    try:
+        import holidays  # type: ignore
+        jp_holidays = holidays.country_holidays("JP")
+        return dates.apply(lambda d: 1 if pd.Timestamp(d).date() in jp_holidays else 0)
+    except Exception:
+        return pd.Series([0] * len(dates), index=dates.index)
+
+
+def legacy_fit_predict_sklearn(train_df: pd.DataFrame, predict_dates: pd.DatetimeIndex, model_name: str) -> pd.DataFrame:
+    """変更前の実装（比較用にそのまま残す）"""
+    pipe = tf._build_sklearn_pipeline(model_name)
+    feat = tf.make_lag_features(train_df).dropna().copy()
+    X = feat[tf.FEATURE_COLS]
+    pipe.fit(X, feat["y"].values)
+
+    hist = train_df.set_index("ds")[["y"]].copy()
+    hist["is_month_end"] = hist.index.is_month_end.astype(int)
+    hist["dow"] = hist.index.dayofweek.astype(int)
+    hist["holiday"] = _make_holiday_flag(pd.Series(hist.index))
+
+    preds = []
+    rolling = hist.copy()
+    for d in predict_dates:
+        last7 = [rolling.iloc[-i]["y"] if len(rolling) >= i else np.nan for i in range(1, 8)]
+        row = {**{f"lag{i}": last7[i - 1] for i in range(1, 8)},
+               "is_month_end": int(pd.Timestamp(d).is_month_end),
+               "holiday": int(_make_holiday_flag(pd.Series([d])).iloc[0]),
+               "dow": int(pd.Timestamp(d).dayofweek)}
+        yhat = float(pipe.predict(pd.DataFrame([row]))[0])
+        preds.append(yhat)
+        rolling.loc[pd.Timestamp(d), ["y", "is_month_end", "dow", "holiday"]] = [yhat, row["is_month_end"], row["dow"], row["holiday"]]
+    return pd.DataFrame({"ds": predict_dates, "yhat": preds, "yhat_lo": preds, "yhat_hi": preds})
+
+
+def make_history(n_menus: int, n_days: int, seed: int = 0) -> dict:
+    rnd = np.random.default_rng(seed)
+    ds = pd.date_range("2025-01-01", periods=n_days, freq="D")
+    out = {}
+    for mid in range(1, n_menus + 1):
+        weekly = np.array([5, 6, 6, 7, 9, 14, 12]) * rnd.uniform(0.5, 3.0)
+        y = weekly[ds.dayofweek] + rnd.normal(0, 1.5, n_days)
+        out[mid] = pd.DataFrame({"ds": ds, "y": y, "dow": ds.dayofweek, "is_month_end": ds.is_month_end.astype(int)})
+    return out
+
+
+def run(fn, hist: dict, predict_dates, model: str):
+    t0 = time.perf_counter()
+    res = {mid: fn(df, predict_dates, model) for mid, df in hist.items()}
+    return time.perf_counter() - t0, res
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--menus", type=int, default=100)
+    ap.add_argument("--horizon", type=int, default=31)
+    ap.add_argument("--days", type=int, default=365)
+    ap.add_argument("--model", choices=["ridge", "lasso"], default="ridge")
+    args = ap.parse_args()
+
+    hist = make_history(args.menus, args.days)
+    last = next(iter(hist.values()))["ds"].max()
+    predict_dates = pd.date_range(last + pd.Timedelta(days=1), periods=args.horizon, freq="D")
+
+    t_old, old = run(legacy_fit_predict_sklearn, hist, predict_dates, args.model)
+    t_new, new = run(tf.fit_predict_sklearn, hist, predict_dates, args.model)
+
+    diff = max(float(np.max(np.abs(old[m]["yhat"].to_numpy() - new[m]["yhat"].to_numpy()))) for m in hist)
+    print(f"menus={args.menus} horizon={args.horizon} history={args.days}d model={args.model}")
+    print(f"{'legacy[s]':>12}{'current[s]':>12}{'speedup':>10}{'max|diff|':>12}")
+    print(f"{t_old:>12.2f}{t_new:>12.2f}{t_old / t_new:>9.1f}x{diff:>12.2e}")
+
+
+if __name__ == "__main__":
+    main()
@@ -10,6 +10,7 @@ from sqlalchemy.orm import sessionmaker
 from app.main import app
 from app.database import Base  # SQLAlchemy Base
 from app.routers.deps import get_db  # 実運用の依存を上書きする
+from app.database import get_db as database_get_db  # orders/menus/analytics はこちらを参照
 # ↑ depsの場所が違う場合は get_db の実体がある場所から import
 
 os.environ["DB_PATH"] = "./udon.db"
@@ -59,8 +60,10 @@ def _override_get_db(TestingSessionLocal):
         finally:
             db.close()
     app.dependency_overrides[get_db] = _get_db
+    app.dependency_overrides[database_get_db] = _get_db
     yield
     app.dependency_overrides.pop(get_db, None)
+    app.dependency_overrides.pop(database_get_db, None)
 
 # ---- TestClient ----
 @pytest.fixture()
@@ -69,6 +72,8 @@ def client():
 
 # ---- シード投入 ----
 from app import models  # Menu, Order, OrderItem, Comment 等を想定
+from app.services.cache import analytics_cache
+from app.services.forecast_models import model_store
 
 @pytest.fixture()
 def seed_data(db):
@@ -76,6 +81,8 @@ def seed_data(db):
     for table in reversed(Base.metadata.sorted_tables):
         db.execute(table.delete())
     db.commit()
+    analytics_cache.invalidate()  # API を経由しない削除なので手動で無効化
+    model_store.invalidate()
 
     menus = [
         models.Menu(name="かけうどん", price=400, stock=10),
@@ -1,3 +1,12 @@
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import func
+
+from app import models
+from app.services import rollup
+from app.services.rollup import JST, jst_now, rebuild_rollups
+
+
 def test_top_menus_counts(client, seed_data):
     # データを作る：かけうどん×2、きつね×1
     menus = client.get("/api/menus").json()
@@ -23,4 +32,127 @@ def test_top_menus_counts(client, seed_data):
 
     # 数量の多い順を確認
     counts = {r["name"]: r.get("count") or r.get("qty") for r in rows}
-    assert counts["かけうどん"] >= counts["きつねうどん"]
\ No newline at end of file
+    assert counts["かけうどん"] >= counts["きつねうどん"]
+
+# ---- ロールアップ経由の集計 ----
+HEADERS = {"X-Staff-Token": "test-token"}
+
+
+def _add_order(db, created_at_jst, lines, order_id=None):
+    """JST の時刻で注文を直接投入する（created_at は UTC で保存）。"""
+    o = models.Order(
+        id=order_id,
+        status="placed",
+        table_id=1,
+        created_at=created_at_jst.replace(tzinfo=JST).astimezone(timezone.utc),
+    )
+    db.add(o)
+    db.flush()
+    for menu_id, qty, price in lines:
+        db.add(models.OrderItem(order_id=o.id, menu_id=menu_id, quantity=qty, price=price))
+    db.commit()
+    return o
+
+
+def test_rollup_backed_endpoints_are_incremental(client, seed_data, db):
+    kake, kitsune, _ = seed_data["menu_ids"]
+    t = (jst_now() - timedelta(days=1)).replace(hour=12, minute=15, second=0, microsecond=0)
+    _add_order(db, t, [(kake, 2, 400), (kitsune, 1, 500)])
+
+    hourly = client.get("/api/analytics/hourly", params={"days": 7}, headers=HEADERS).json()
+    noon = hourly["buckets"][12]
+    assert noon == {"hour": 12, "count": 2, "amount": 2 * 400 + 500}
+
+    # 2件目（同じ時間帯）は watermark 以降の注文が触れたバケットだけ集計し直される
+    _add_order(db, t + timedelta(minutes=20), [(kake, 1, 400)])
+    daily = client.get("/api/analytics/daily-sales", params={"days": 7}, headers=HEADERS).json()
+    assert daily == [{"date": t.date().isoformat(), "sales": 3 * 400 + 500, "orders": 2}]
+
+    totals = client.get("/api/analytics/menu-totals", params={"days": 7}, headers=HEADERS).json()
+    assert [(r["menu_id"], r["orders"]) for r in totals] == [(kake, 3), (kitsune, 1)]
+
+    heat = client.get(
+        "/api/analytics/heatmap",
+        params={"menu_id": str(kake), "start": t.date().isoformat(), "end": t.date().isoformat()},
+        headers=HEADERS,
+    ).json()["data"]
+    assert heat == [{"dow": (t.weekday() + 1) % 7, "hour": 12, "y": 3}]
+
+    assert db.query(models.SalesHourlyRollup).count() == 2
+
+
+def test_rebuild_rollups_matches_incremental(client, seed_data, db):
+    kake, _, tempura = seed_data["menu_ids"]
+    base = (jst_now() - timedelta(days=2)).replace(minute=0, second=0, microsecond=0)
+    for i in range(5):
+        _add_order(db, base + timedelta(hours=i), [(kake, 1, 400), (tempura, i + 1, 650)])
+    client.get("/api/analytics/summary", params={"range": "7d"}, headers=HEADERS)
+    incremental = sorted(
+        (r.menu_id, r.bucket, r.quantity, r.lines) for r in db.query(models.SalesHourlyRollup).all()
+    )
+
+    rebuild_rollups(db)
+    rebuilt = sorted(
+        (r.menu_id, r.bucket, r.quantity, r.lines) for r in db.query(models.SalesHourlyRollup).all()
+    )
+    assert rebuilt == incremental and len(rebuilt) == 10
+
+
+def test_late_committed_order_below_watermark_is_counted(client, seed_data, db):
+    kake = seed_data["menu_ids"][0]
+    t = (jst_now() - timedelta(days=1)).replace(minute=10, second=0, microsecond=0)
+    first = _add_order(db, t, [(kake, 1, 400)]).id
+    late_id = first + 1
+    _add_order(db, t, [(kake, 2, 400)], order_id=late_id + 1)
+    rollup.refresh_rollups(db)  # watermark は late_id を飛び越える
+
+    # 採番済みで commit が遅れた注文（watermark より小さい id）が後から見える
+    _add_order(db, t, [(kake, 4, 400)], order_id=late_id)
+    _add_order(db, t + timedelta(hours=1), [(kake, 1, 400)])
+    rollup.refresh_rollups(db)
+
+    db.expire_all()
+    got = {r.bucket: (r.quantity, r.lines) for r in db.query(models.SalesHourlyRollup).all()}
+    assert got == {t.replace(minute=0): (1 + 2 + 4, 3), t.replace(minute=0) + timedelta(hours=1): (1, 1)}
+    assert db.query(models.OrderHourlyRollup).filter_by(bucket=t.replace(minute=0)).one().orders == 3
+
+
+def test_request_catch_up_is_bounded(client, seed_data, db, monkeypatch):
+    kake = seed_data["menu_ids"][0]
+    t = (jst_now() - timedelta(days=1)).replace(minute=0, second=0, microsecond=0)
+    first = _add_order(db, t, [(kake, 1, 400)]).id
+    for i in range(1, 6):  # API を通さない注文（移行直後の既存履歴の代わり）
+        _add_order(db, t + timedelta(hours=i), [(kake, 1, 400)])
+    monkeypatch.setattr(rollup, "REQUEST_CATCHUP_ORDERS", 2)
+
+    def watermark():
+        db.expire_all()
+        return int(db.get(models.SyncWatermark, rollup.WATERMARK_NAME).value)
+
+    # analytics の GET は上限件数だけ取り込む
+    client.get("/api/analytics/summary", params={"range": "7d"}, headers=HEADERS)
+    assert watermark() == first + 1
+    # 注文の書き込み後はレスポンスの後（バックグラウンド）で取り込む
+    client.post("/api/orders", json={"table_no": 1, "items": [{"menu_id": kake, "qty": 1}]})
+    assert watermark() == first + 3
+    # 残りはデプロイ手順の rebuild_sales_rollup（refresh_rollups）で一括
+    assert rollup.refresh_rollups(db) == 3
+    assert db.query(func.sum(models.SalesHourlyRollup.quantity)).scalar() == 7
+
+
+def test_summary_multi_range_in_one_call(client, seed_data, db):
+    kake = seed_data["menu_ids"][0]
+    now = jst_now()
+    for days_ago, qty in ((0, 1), (3, 2), (20, 4)):
+        _add_order(db, now - timedelta(days=days_ago), [(kake, qty, 400)])
+
+    res = client.get("/api/analytics/summary", params={"ranges": "today,7d,30d"}, headers=HEADERS)
+    assert res.status_code == 200
+    got = {r["range"]: (r["order_count"], r["total_amount"]) for r in res.json()["ranges"]}
+    assert got == {"today": (1, 400), "7d": (2, 1200), "30d": (3, 2800)}
+
+    single = client.get("/api/analytics/summary", params={"range": "7d"}, headers=HEADERS).json()
+    assert (single["range"], single["order_count"], single["total_amount"]) == ("7d", 2, 1200)
+
+    bad = client.get("/api/analytics/summary", params={"ranges": "today,1y"}, headers=HEADERS)
+    assert bad.status_code == 400
@@ -0,0 +1,51 @@
+import time
+
+from app.services.cache import TTLCache
+
+HEADERS = {"X-Staff-Token": "test-token"}
+
+
+def test_lru_eviction_and_ttl(monkeypatch):
+    c = TTLCache(maxsize=2, ttl=10)
+    c.set("a", 1)
+    c.set("b", 2)
+    assert c.get("a") == 1          # a を最近使用に
+    c.set("c", 3)                   # b が追い出される
+    assert c.get("b") is None and c.get("a") == 1 and c.get("c") == 3
+
+    now = time.monotonic()
+    monkeypatch.setattr(time, "monotonic", lambda: now + 11)
+    assert c.get("a") is None
+
+
+def test_result_computed_before_invalidate_is_not_stored():
+    c = TTLCache()
+    gen = c.generation
+    c.invalidate()
+    c.set("k", "stale", generation=gen)
+    assert c.get("k") is None
+
+
+def test_analytics_served_from_cache_until_new_order(client, seed_data, db):
+    kake = seed_data["menu_ids"][0]
+    params = {"days": 7, "limit": 5}
+    first = client.get("/api/analytics/menu-totals", params=params, headers=HEADERS).json()
+    assert first == []
+
+    client.post("/api/orders", json={"table_no": 1, "items": [{"menu_id": kake, "qty": 3}]})
+    after_order = client.get("/api/analytics/menu-totals", params=params, headers=HEADERS).json()
+    assert [(r["menu_id"], r["orders"]) for r in after_order] == [(kake, 3)]
+
+    # API を経由しない書き込みは TTL まで見えない（＝メモリから返している）
+    from app.models import Order, OrderItem
+    o = Order(status="placed", table_id=2)
+    db.add(o)
+    db.flush()
+    db.add(OrderItem(order_id=o.id, menu_id=kake, quantity=10, price=400))
+    db.commit()
+    cached = client.get("/api/analytics/menu-totals", params=params, headers=HEADERS).json()
+    assert cached == after_order
+
+    # 別パラメータは別キー（こちらは新しい注文も反映される）
+    other = client.get("/api/analytics/menu-totals", params={"days": 1, "limit": 5}, headers=HEADERS).json()
+    assert [(r["menu_id"], r["orders"]) for r in other] == [(kake, 13)]
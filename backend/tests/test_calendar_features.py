@@ -0,0 +1,38 @@
+from datetime import date
+
+import pytest
+
+pd = pytest.importorskip("pandas")
+
+from app.services import calendar_features as cf
+
+
+def test_calendar_for_keeps_order_and_flags(tmp_path):
+    csv = tmp_path / "holidays.csv"
+    csv.write_text("ds\n2025-01-01\n2025-05-05\n")
+    dates = [date(2025, 5, 5), date(2024, 12, 31), date(2025, 1, 1), date(2025, 1, 2)]
+
+    cal = cf.calendar_for(dates, holiday_csv=str(csv))
+
+    assert list(cal.columns) == cf.CALENDAR_COLS
+    assert cal["dow"].tolist() == [0, 1, 2, 3]
+    assert cal["is_month_end"].tolist() == [0, 1, 0, 0]
+    assert cal["holiday"].tolist() == [1, 0, 1, 0]
+
+
+def test_calendar_table_is_built_once_per_year_span():
+    cf.calendar_table.cache_clear()
+    cf.calendar_for(pd.date_range("2025-03-01", periods=10))
+    cf.calendar_for(pd.Series(pd.to_datetime(["2025-12-31", "2025-01-01"])))
+    info = cf.calendar_table.cache_info()
+    assert (info.misses, info.hits) == (1, 1)
+
+
+def test_calendar_for_empty():
+    assert cf.calendar_for([]).empty
+
+
+def test_package_holidays_when_installed():
+    pytest.importorskip("holidays")
+    cal = cf.calendar_for([date(2025, 1, 1), date(2025, 1, 6)])
+    assert cal["holiday"].tolist() == [1, 0]
@@ -0,0 +1,144 @@
+from datetime import date, datetime
+
+import pytest
+
+pd = pytest.importorskip("pandas")
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+
+from app.database import Base
+from app.etl import day2_build_menu_daily_train as day2
+from app.models import Menu, Order, OrderItem
+
+
+@pytest.fixture()
+def etl_engine(tmp_path):
+    eng = create_engine(f"sqlite:///{tmp_path / 'etl.sqlite'}")
+    Base.metadata.create_all(eng)
+    with Session(eng) as s:
+        s.add_all([Menu(id=1, name="かけ", price=400), Menu(id=2, name="ざる", price=500)])
+        # (UTC の created_at, menu_id, quantity)
+        lines = [
+            (datetime(2025, 7, 1, 3, 0), 1, 2),
+            (datetime(2025, 7, 1, 14, 59), 1, 1),   # JST 7/1 23:59
+            (datetime(2025, 7, 1, 15, 0), 1, 4),    # JST 7/2 00:00
+            (datetime(2025, 7, 1, 16, 0), 2, -3),   # 負の数量は 0 扱い
+            (datetime(2025, 7, 2, 1, 0), 2, 5),
+        ]
+        for ts, mid, q in lines:
+            s.add(Order(created_at=ts, items=[OrderItem(menu_id=mid, price=400, quantity=q)]))
+        s.commit()
+    yield eng
+    eng.dispose()
+
+
+def test_daily_agg_is_jst_and_pushdown_matches_streaming(etl_engine):
+    want = pd.DataFrame({
+        "menu_id": [1, 1, 2],
+        "ds": [date(2025, 7, 1), date(2025, 7, 2), date(2025, 7, 2)],
+        "y": [3, 4, 5],
+    })
+    pushed = day2.fetch_order_daily_agg(etl_engine)
+    pd.testing.assert_frame_equal(pushed, want, check_dtype=False)
+
+    # チャンクを 2 行にして、複数チャンクにまたがる (menu_id, ds) も足し込まれること
+    streamed = day2.fetch_order_daily_agg(etl_engine, chunk_rows=2, pushdown=False)
+    pd.testing.assert_frame_equal(streamed, want, check_dtype=False)
+
+
+def _train(eng) -> pd.DataFrame:
+    out = pd.read_sql("SELECT menu_id, ds, y, dow, is_month_end FROM menu_daily_train ORDER BY menu_id, ds", eng)
+    return out.assign(ds=pd.to_datetime(out["ds"]).dt.date, is_month_end=out["is_month_end"].astype(int))
+
+
+def _full_rebuild(eng) -> pd.DataFrame:
+    agg = day2.fetch_order_daily_agg(eng)
+    rows = day2.build_train_rows(day2.fetch_menu_ids(eng).tolist(), agg, agg["ds"].min(), agg["ds"].max())
+    rows = day2.add_basic_features(rows, include_month_end=True, holiday_csv=None)
+    return rows[["menu_id", "ds", "y", "dow", "is_month_end"]].sort_values(["menu_id", "ds"]).reset_index(drop=True)
+
+
+def test_incremental_upserts_only_recent_days(etl_engine):
+    from sqlalchemy import inspect, text
+
+    argv = ["--database-url", str(etl_engine.url), "--incremental", "--late-days", "0"]
+    day2.main(argv)
+    assert inspect(etl_engine).get_pk_constraint("menu_daily_train")["constrained_columns"] == ["menu_id", "ds"]
+    assert day2.read_watermark(etl_engine) == date(2025, 7, 2)
+    pd.testing.assert_frame_equal(_train(etl_engine), _full_rebuild(etl_engine), check_dtype=False)
+
+    with Session(etl_engine) as s:
+        s.add(Menu(id=3, name="釜玉", price=550))
+        s.add(Order(created_at=datetime(2025, 7, 2, 5, 0), items=[OrderItem(menu_id=1, price=400, quantity=2)]))  # 遅れて届いた注文
+        s.add(Order(created_at=datetime(2025, 7, 3, 5, 0), items=[OrderItem(menu_id=2, price=500, quantity=1)]))
+        s.add(Order(created_at=datetime(2025, 7, 1, 5, 0), items=[OrderItem(menu_id=3, price=550, quantity=6)]))
+        s.commit()
+    # watermark - late_days より前の行は触らない（わざと壊した値が残る）
+    with etl_engine.begin() as conn:
+        conn.execute(text("UPDATE menu_daily_train SET y = 99 WHERE menu_id = 2 AND ds = '2025-07-01'"))
+
+    day2.main(argv)
+    got = _train(etl_engine)
+    want = _full_rebuild(etl_engine)
+    assert got.loc[(got["menu_id"] == 2) & (got["ds"] == date(2025, 7, 1)), "y"].item() == 99
+    want.loc[(want["menu_id"] == 2) & (want["ds"] == date(2025, 7, 1)), "y"] = 99
+    pd.testing.assert_frame_equal(got, want, check_dtype=False)  # 新メニュー 3 は初日から埋まる
+    assert day2.read_watermark(etl_engine) == date(2025, 7, 3)
+    assert inspect(etl_engine).get_pk_constraint("menu_daily_train")["constrained_columns"] == ["menu_id", "ds"]
+    quality = pd.read_sql("SELECT run_at, menu_id, ok FROM menu_daily_train_quality", etl_engine)
+    assert quality["run_at"].nunique() == 2 and (quality["ok"] == 1).all()
+
+
+def test_full_rebuild_keeps_key_and_moves_watermark(etl_engine, tmp_path):
+    from sqlalchemy import inspect
+
+    url = str(etl_engine.url)
+    day2.main(["--database-url", url, "--incremental"])
+    with Session(etl_engine) as s:
+        s.add(Order(created_at=datetime(2025, 7, 3, 5, 0), items=[OrderItem(menu_id=2, price=500, quantity=1)]))
+        s.commit()
+
+    # --end を前回の watermark より前にした全件作り直し → watermark も --end に戻る
+    day2.main(["--database-url", url, "--end", "2025-07-01", "--csv", str(tmp_path / "train.csv")])
+    assert inspect(etl_engine).get_pk_constraint("menu_daily_train")["constrained_columns"] == ["menu_id", "ds"]
+    assert day2.read_watermark(etl_engine) == date(2025, 7, 1)
+    assert _train(etl_engine)["ds"].max() == date(2025, 7, 1)
+
+    # 次の --incremental は --end の翌日以降を取りこぼさない
+    day2.main(["--database-url", url, "--incremental", "--late-days", "0"])
+    pd.testing.assert_frame_equal(_train(etl_engine), _full_rebuild(etl_engine), check_dtype=False)
+    assert day2.read_watermark(etl_engine) == date(2025, 7, 3)
+
+
+def test_full_rebuild_writes_month_end_like_incremental(etl_engine, tmp_path):
+    url = str(etl_engine.url)
+    with Session(etl_engine) as s:
+        s.add(Order(created_at=datetime(2025, 7, 31, 5, 0), items=[OrderItem(menu_id=1, price=400, quantity=1)]))
+        s.commit()
+    day2.main(["--database-url", url, "--incremental"])
+    incremental = _train(etl_engine)
+    assert incremental.loc[incremental["ds"] == date(2025, 7, 31), "is_month_end"].tolist() == [1, 1]
+
+    # --include-month-end なしの全件作り直しでもテーブルの is_month_end は同じ（CSV には列を出さない）
+    csv = tmp_path / "train.csv"
+    day2.main(["--database-url", url, "--csv", str(csv)])
+    pd.testing.assert_frame_equal(_train(etl_engine), incremental)
+    assert "is_month_end" not in pd.read_csv(csv).columns
+
+
+def test_quality_report_counts_per_menu():
+    ds = pd.date_range("2025-07-01", periods=20, freq="D")
+    a = pd.DataFrame({"menu_id": 1, "ds": ds, "y": [5, 6, 5, 7, 6] * 4})
+    a.loc[3, "y"] = 60                                    # 外れ値
+    b = pd.DataFrame({"menu_id": 2, "ds": ds, "y": [0] * 8 + [3] * 12})  # 0 が 8 日続く
+    b = b.drop(index=[12, 13, 17])                        # 穴 2 箇所（3 日分）
+    b = pd.concat([b, b.iloc[[0]]])                       # 重複 1
+    b.loc[b.index[-2], "y"] = -1                          # 負値
+    df = pd.concat([b, a], ignore_index=True).sample(frac=1, random_state=0)  # 並びはばらばらでよい
+
+    rep = day2.quality_report(df).set_index("menu_id")
+    assert rep.loc[1, ["rows", "outliers", "gaps", "duplicates", "zero_runs", "ok"]].tolist() == [20, 1, 0, 0, 0, 1]
+    assert rep.loc[2, ["gaps", "missing_days", "duplicates", "negatives", "max_zero_run", "zero_runs", "ok"]].tolist() \
+        == [2, 3, 1, 1, 8, 1, 0]
+    assert rep.loc[2, "first_ds"] == date(2025, 7, 1) and rep.loc[2, "last_ds"] == date(2025, 7, 20)
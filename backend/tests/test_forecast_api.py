@@ -16,4 +16,152 @@ def test_heatmap_api():
     assert res.status_code == 200
     data = res.json()
     assert "data" in data
-    assert all("dow" in c and "hour" in c for c in data["data"])
\ No newline at end of file
+    assert all("dow" in c and "hour" in c for c in data["data"])
+
+def test_forecast_uses_jst_days_on_sqlite(client, seed_data, db):
+    from datetime import datetime, timezone
+    from app import models
+
+    kake = seed_data["menu_ids"][0]
+    # UTC 15:30 = JST 翌日 00:30 → JST の日付で集計される
+    for day in (1, 2, 3):
+        o = models.Order(status="served", table_id=1, created_at=datetime(2025, 10, day, 15, 30, tzinfo=timezone.utc))
+        db.add(o)
+        db.flush()
+        db.add(models.OrderItem(order_id=o.id, menu_id=kake, quantity=day, price=400))
+    db.commit()
+
+    res = client.get(f"/api/analytics/forecast?menu_id={kake}&days=2")
+    assert res.status_code == 200
+    assert [p["date"] for p in res.json()["data"]] == ["2025-10-05", "2025-10-06"]
+
+
+def test_forecast_reads_latest_stored_forecast(client, seed_data, db):
+    from datetime import datetime, timedelta
+    from app import models
+    from app.services.rollup import jst_now
+
+    kake, kitsune, _ = seed_data["menu_ids"]  # 400円 / 500円
+    today = jst_now().date()
+    old, new = datetime(2026, 1, 1), datetime(2026, 1, 2)
+    rows = [
+        # kake は 2 モデル分あり、新しい ridge を採用
+        (kake, 0, "seasonal_ma_k4", 9.0, old),
+        (kake, 0, "ridge", 2.0, new),
+        (kake, 1, "ridge", 3.0, new),
+        (kitsune, 0, "ridge", 1.0, new),
+        # 過去日は対象外
+        (kake, -1, "ridge", 99.0, new),
+    ]
+    for mid, offset, model, yhat, trained in rows:
+        db.add(models.MenuDailyForecast(
+            menu_id=mid, ds=today + timedelta(days=offset), model=model,
+            yhat=yhat, yhat_lo=yhat - 1, yhat_hi=yhat + 1, trained_at=trained,
+        ))
+    db.commit()
+
+    one = client.get(f"/api/analytics/forecast?menu_id={kake}&days=7").json()
+    assert one["source"] == "stored"
+    assert [(p["date"], p["yhat"], p["y"], p["model"]) for p in one["data"]] == [
+        (today.isoformat(), 2.0, 800, "ridge"),
+        ((today + timedelta(days=1)).isoformat(), 3.0, 1200, "ridge"),
+    ]
+    assert one["data"][0]["yhat_lo"] == 1.0 and one["data"][0]["yhat_hi"] == 3.0
+
+    all_ = client.get("/api/analytics/forecast?menu_id=all&days=1").json()
+    assert [(p["yhat"], p["y"]) for p in all_["data"]] == [(3.0, 800 + 500)]
+
+
+def test_forecast_all_fills_menus_without_stored_rows(client, seed_data, db):
+    from datetime import timedelta, timezone
+    from app import models
+    from app.services.rollup import JST, jst_now
+
+    kake, kitsune, tempura = seed_data["menu_ids"]  # 400 / 500 / 650 円
+    now = jst_now().replace(hour=12, minute=0, second=0, microsecond=0)
+    today = now.date()
+    for mid, yhat in ((kake, 2.0), (kitsune, 1.0)):
+        db.add(models.MenuDailyForecast(menu_id=mid, ds=today, model="ridge", yhat=yhat, yhat_lo=yhat - 1, yhat_hi=yhat + 1))
+    # tempura は予測が無い → 同じ曜日の served の平均（数量 2 と 4 → 3）で埋める
+    for weeks, qty in ((1, 2), (2, 4)):
+        created = (now - timedelta(weeks=weeks)).replace(tzinfo=JST).astimezone(timezone.utc)
+        o = models.Order(status="served", table_id=1, created_at=created)
+        db.add(o)
+        db.flush()
+        db.add(models.OrderItem(order_id=o.id, menu_id=tempura, quantity=qty, price=650))
+    db.commit()
+
+    body = client.get("/api/analytics/forecast?menu_id=all&days=1").json()
+    assert body["source"] == "stored"
+    p = body["data"][0]
+    assert (p["yhat"], p["y"]) == (2.0 + 1.0 + 3.0, 800 + 500 + 3 * 650)
+    assert (p["yhat_lo"], p["yhat_hi"]) == (1.0 + 0.0 + 3.0, 3.0 + 2.0 + 3.0)
+    assert p["heuristic_menus"] == [tempura] and p["model"] == "mixed"
+
+    one = client.get(f"/api/analytics/forecast?menu_id={kake}&days=1").json()["data"][0]
+    assert (one["yhat"], one["model"]) == (2.0, "ridge") and "heuristic_menus" not in one
+
+
+def _register(db, menu_id, artifact, version=1, config="ridge"):
+    import json
+    from app import models
+    db.add(models.ForecastModelRegistry(
+        menu_id=menu_id, config=config, version=version, model=artifact.get("model", artifact.get("name")),
+        artifact=json.dumps(artifact),
+    ))
+
+
+def test_forecast_online_uses_latest_registered_model(client, seed_data, db, monkeypatch):
+    from datetime import datetime, timedelta
+    from app import models
+    from app.routers import analytics
+    from app.services import rollup
+    from app.services.forecast_models import model_store
+
+    # 祝日（holidays パッケージがあれば効く）に当たらない日に固定する
+    fixed_now = lambda: datetime(2025, 6, 10, 12, 0)
+    monkeypatch.setattr(analytics, "jst_now", fixed_now)
+    monkeypatch.setattr(rollup, "jst_now", fixed_now)
+
+    kake, kitsune, _ = seed_data["menu_ids"]  # 400円 / 500円
+    linear = {
+        "kind": "linear", "model": "ridge", "n_lags": 7, "intercept": 1.0,
+        "lag_w": [0.5, 0, 0, 0, 0, 0, 0], "is_month_end_w": 0.0, "holiday_w": 10.0, "dow_w": [0.0] * 7,
+    }
+    _register(db, kake, {**linear, "intercept": 99.0}, version=1)
+    _register(db, kake, {**linear, "interval": {"coverage": 0.8, "q": 2.5}}, version=2)  # 最新版を使う
+    _register(db, kitsune, {"kind": "baseline", "name": "naive_tminus7"})
+    # 昨日(JST) kake 4 個、7 日前 kitsune 3 個
+    today = fixed_now().replace(hour=0, minute=0, second=0, microsecond=0)
+    db.add(models.SalesHourlyRollup(menu_id=kake, bucket=today - timedelta(hours=12), quantity=4, lines=1))
+    db.add(models.SalesHourlyRollup(menu_id=kitsune, bucket=today - timedelta(days=7) + timedelta(hours=12), quantity=3, lines=1))
+    db.commit()
+
+    res = client.get(f"/api/analytics/forecast/online?menu_id={kake}&days=3")
+    assert res.status_code == 200
+    body = res.json()
+    assert body["source"] == "registry" and body["models"][0]["version"] == 2
+    # 1 + 0.5*4 = 3 → 1 + 0.5*3 = 2.5 → 2.25（前日の予測を次のラグに使う）
+    assert [p["yhat"] for p in body["data"]] == [3.0, 2.5, 2.25]
+    assert body["data"][0]["y"] == 1200
+    assert [(p["yhat_lo"], p["yhat_hi"]) for p in body["data"]] == [(0.5, 5.5), (0.0, 5.0), (0.0, 4.75)]
+
+    # what-if: 今日を祝日、明日を休業日にする
+    d0, d1 = (today.date() + timedelta(days=i) for i in range(2))
+    res = client.get(
+        f"/api/analytics/forecast/online?menu_id={kake}&days=3&holidays={d0}&closed={d1}"
+    )
+    assert [p["yhat"] for p in res.json()["data"]] == [13.0, 0.0, 1.0]
+
+    # all はメニュー合計（kitsune は 7 日前の値）
+    res = client.get("/api/analytics/forecast/online?days=1")
+    assert res.json()["data"] == [{"date": d0.isoformat(), "y": 3 * 400 + 3 * 500, "yhat": 6.0, "yhat_lo": 3.5, "yhat_hi": 8.5}]
+
+    assert client.get("/api/analytics/forecast/online?closed=tomorrow").status_code == 400
+
+    # 新しい版を登録したら、注文が無くても（モデルストアの再読込間隔が過ぎれば）すぐ使われる
+    monkeypatch.setattr(model_store, "reload_sec", 0)
+    _register(db, kake, {**linear, "intercept": 2.0}, version=3)
+    db.commit()
+    body = client.get(f"/api/analytics/forecast/online?menu_id={kake}&days=1").json()
+    assert body["models"][0]["version"] == 3 and body["data"][0]["yhat"] == 4.0
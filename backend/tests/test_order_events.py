@@ -0,0 +1,113 @@
+import asyncio
+
+from app.services.order_events import OrderEventBroker, broker
+
+
+def test_subscriber_receives_published_events():
+    async def run():
+        b = OrderEventBroker()
+        sub = b.subscribe()
+        b.publish("order.created", {"id": 1})
+        b.publish("order.status_changed", {"id": 1, "from": "placed", "to": "cooking"})
+        got = [await asyncio.wait_for(sub.queue.get(), 1) for _ in range(2)]
+        return [(e.seq, e.type) for e in got], got[0].id == f"{b.epoch}-1"
+
+    assert asyncio.run(run()) == ([(1, "order.created"), (2, "order.status_changed")], True)
+
+
+def test_resume_from_last_event_id_replays_missed_events():
+    async def run():
+        b = OrderEventBroker(history=10)
+        for i in range(5):
+            b.publish("order.created", {"id": i})
+        sub = b.subscribe(last_event_id=f"{b.epoch}-3")
+        return [e.seq for e in sub.backlog]
+
+    assert asyncio.run(run()) == [4, 5]
+
+
+def test_resume_beyond_history_sends_reset():
+    async def run():
+        b = OrderEventBroker(history=2)
+        for i in range(5):
+            b.publish("order.created", {"id": i})
+        return [e.type for e in b.subscribe(last_event_id=f"{b.epoch}-1").backlog]
+
+    assert asyncio.run(run()) == ["reset"]
+
+
+def test_resume_with_id_from_previous_process_sends_reset():
+    async def run():
+        before, after = OrderEventBroker(), OrderEventBroker()  # 再起動の前後
+        for b in (before, after):
+            for i in range(5):
+                b.publish("order.created", {"id": i})
+        # seq は範囲内でも epoch が違えば再送しない（epoch の無い旧形式も同じ）
+        stale = after.subscribe(last_event_id=f"{before.epoch}-3").backlog
+        bare = after.subscribe(last_event_id="3").backlog
+        return [e.type for e in stale], [e.type for e in bare], stale[0].id == after.last_event_id
+
+    assert asyncio.run(run()) == (["reset"], ["reset"], True)
+
+
+def test_slow_subscriber_is_disconnected_on_overflow():
+    async def run():
+        b = OrderEventBroker(queue_size=2)
+        sub = b.subscribe()
+        for i in range(3):
+            b.publish("order.created", {"id": i})
+        await asyncio.sleep(0)
+        return await asyncio.wait_for(sub.queue.get(), 1)
+
+    assert asyncio.run(run()) is None
+
+
+def test_order_endpoints_publish_events(client, seed_data):
+    ids = seed_data["menu_ids"]
+    start = broker.last_event_id
+    oid = client.post("/api/orders", json={"table_no": 5, "items": [{"menu_id": ids[0], "qty": 2}]}).json()["id"]
+    client.patch(f"/orders/{oid}", json={"status": "cooking"})
+
+    async def run():
+        sub = broker.subscribe(last_event_id=start)
+        broker.unsubscribe(sub)
+        return sub.backlog
+
+    events = asyncio.run(run())
+    assert [e.type for e in events] == ["order.created", "order.status_changed"]
+    assert events[0].data["id"] == oid and events[0].data["total"] > 0
+    assert events[1].data == {"id": oid, "from": "placed", "to": "cooking", "table_id": 5}
+
+
+class _OneShotBroker(OrderEventBroker):
+    """backlog を送ったらストリームを終える（テストで接続を閉じるため）"""
+
+    def subscribe(self, last_event_id=None):
+        sub = super().subscribe(last_event_id)
+        sub.queue.put_nowait(None)
+        return sub
+
+
+def _read_stream(client, monkeypatch, b, **kwargs):
+    from app.routers import orders
+
+    monkeypatch.setattr(orders, "order_events", b)
+    res = client.get("/orders/stream", **kwargs)
+    assert res.status_code == 200 and res.headers["content-type"].startswith("text/event-stream")
+    return [dict(line.split(": ", 1) for line in block.splitlines()) for block in res.text.strip().split("\n\n")]
+
+
+def test_stream_endpoint_replays_after_last_event_id(client, monkeypatch):
+    b = _OneShotBroker()
+    for i in range(3):
+        b.publish("order.created", {"id": i})
+
+    events = _read_stream(client, monkeypatch, b, headers={"Last-Event-ID": f"{b.epoch}-1"})
+    assert [(e["id"], e["event"], e["data"]) for e in events] == [
+        (f"{b.epoch}-2", "order.created", '{"id": 1}'),
+        (f"{b.epoch}-3", "order.created", '{"id": 2}'),
+    ]
+
+    # 再起動前の id（?last_event_id= でも同じ）→ reset
+    events = _read_stream(client, monkeypatch, b, params={"last_event_id": "0123abcd-2"})
+    assert [(e["id"], e["event"]) for e in events] == [(f"{b.epoch}-3", "reset")]
@@ -0,0 +1,103 @@
+from sqlalchemy import event
+
+from app.models import Order, OrderItem
+
+
+def _count_selects(engine):
+    """engine 上で発行された SELECT 文の数を数えるためのリスト（listen 解除は呼び出し側）。"""
+    stmts = []
+
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith("SELECT"):
+            stmts.append(statement)
+
+    event.listen(engine, "before_cursor_execute", _before)
+    return stmts, _before
+
+
+def test_create_order_resolves_menus_in_one_query(client, seed_data, engine, db):
+    ids = seed_data["menu_ids"]
+    # 同じメニューの重複行も含めた 6 明細
+    items = [{"menu_id": ids[i % 3], "quantity": 1 + i} for i in range(6)]
+
+    stmts, listener = _count_selects(engine)
+    try:
+        r = client.post("/orders", json={"table_id": 3, "items": items})
+    finally:
+        event.remove(engine, "before_cursor_execute", listener)
+
+    assert r.status_code == 200
+    body = r.json()
+    assert [it["menu_id"] for it in body["items"]] == [it["menu_id"] for it in items]
+    assert body["total"] == sum(it["price"] * it["quantity"] for it in body["items"])
+    # メニュー解決は明細数によらず 1 回
+    assert len([s for s in stmts if "FROM menus" in s]) == 1
+
+    rows = db.query(OrderItem).filter(OrderItem.order_id == body["id"]).all()
+    assert len(rows) == 6
+
+
+def test_api_create_order_unknown_menu_is_404_and_writes_nothing(client, seed_data, db):
+    ids = seed_data["menu_ids"]
+    before = db.query(Order).count()
+    r = client.post(
+        "/api/orders",
+        json={"table_no": 1, "items": [{"menu_id": ids[0], "qty": 1}, {"menu_id": 999999, "qty": 1}]},
+    )
+    assert r.status_code == 404
+    assert db.query(Order).count() == before
+
+
+def test_api_create_order_invalid_qty(client, seed_data):
+    ids = seed_data["menu_ids"]
+    r = client.post("/api/orders", json={"table_no": 1, "items": [{"menu_id": ids[0], "qty": 0}]})
+    assert r.status_code == 400
+
+
+def test_order_board_returns_items_and_pages(client, seed_data, engine):
+    ids = seed_data["menu_ids"]
+    created = []
+    for n in range(5):
+        r = client.post("/orders", json={"table_id": n, "items": [{"menu_id": ids[0], "quantity": n + 1}]})
+        created.append(r.json())
+
+    stmts, listener = _count_selects(engine)
+    try:
+        page1 = client.get("/orders/board", params={"status": "placed", "limit": 3}).json()
+    finally:
+        event.remove(engine, "before_cursor_execute", listener)
+    # 注文 1 回 + 明細 1 回（件数によらない）
+    assert len(stmts) == 2
+
+    assert [o["id"] for o in page1["orders"]] == [c["id"] for c in created[:3]]
+    assert page1["orders"][1]["items"] == created[1]["items"]
+    assert page1["orders"][1]["total"] == created[1]["total"]
+    assert page1["next_cursor"] == created[2]["id"]
+
+    page2 = client.get(
+        "/orders/board", params={"status": "placed", "limit": 3, "cursor": page1["next_cursor"]}
+    ).json()
+    assert [o["id"] for o in page2["orders"]] == [c["id"] for c in created[3:]]
+    assert page2["next_cursor"] is None
+
+
+def test_list_order_ids_is_read_only_when_empty(client, seed_data, db):
+    r = client.get("/orders", params={"status": "placed"})
+    assert r.status_code == 200
+    assert r.json() == []
+    assert db.query(Order).count() == 0
+
+
+def test_purge_placeholder_orders_keeps_real_orders(client, seed_data, db):
+    from app.scripts.purge_placeholder_orders import purge_placeholder_orders
+
+    ids = seed_data["menu_ids"]
+    db.add_all([Order(status="placed", table_id=0) for _ in range(5)])
+    db.commit()
+    # table_id=0 でも明細がある注文は実注文
+    real = client.post("/api/orders", json={"items": [{"menu_id": ids[0], "qty": 1}]}).json()["id"]
+
+    assert purge_placeholder_orders(db, batch_size=2, dry_run=True) == 5
+    assert db.query(Order).count() == 6
+    assert purge_placeholder_orders(db, batch_size=2) == 5
+    assert [o.id for o in db.query(Order).all()] == [real]
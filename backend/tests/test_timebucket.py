@@ -0,0 +1,66 @@
+import os
+from datetime import date, datetime, timezone
+
+import pytest
+from sqlalchemy import create_engine, select, literal_column
+from sqlalchemy.dialects import postgresql, sqlite
+
+from app.models import Order
+from app.services import timebucket as tb
+
+DIALECTS = {"sqlite": sqlite.dialect(), "postgresql": postgresql.dialect()}
+
+# UTC 2025-10-01 16:30 = JST 2025-10-02 01:30
+UTC_TS = datetime(2025, 10, 1, 16, 30, tzinfo=timezone.utc)
+EXPECTED = {
+    "date": date(2025, 10, 2),
+    "bucket": datetime(2025, 10, 2, 1, 0),
+}
+
+
+def _exprs(col, dialect):
+    return {
+        "date": tb.jst_date(col, dialect),
+        "bucket": tb.jst_hour_bucket(col, dialect),
+    }
+
+
+@pytest.mark.parametrize("dialect", sorted(DIALECTS))
+def test_expressions_compile_without_postgres_only_casts_on_sqlite(dialect):
+    for name, expr in _exprs(Order.created_at, dialect).items():
+        sql = str(select(expr).compile(dialect=DIALECTS[dialect]))
+        if dialect == "sqlite":
+            assert "::" not in sql and "AT TIME ZONE" not in sql.upper(), (name, sql)
+            assert "+9 hours" in str(select(expr).compile(dialect=DIALECTS[dialect], compile_kwargs={"literal_binds": True}))
+        else:
+            assert "timezone" in sql, (name, sql)
+
+
+def test_unsupported_dialect_returns_none():
+    assert all(v is None for v in _exprs(Order.created_at, "mssql").values())
+
+
+def test_day_range_is_utc_half_open():
+    lo, hi = tb.jst_day_range_utc(date(2025, 10, 2), date(2025, 10, 2))
+    assert lo == datetime(2025, 10, 1, 15, 0, tzinfo=timezone.utc)
+    assert hi == datetime(2025, 10, 2, 15, 0, tzinfo=timezone.utc)
+
+
+def _run(url, dialect, ts_sql):
+    eng = create_engine(url)
+    col = literal_column(ts_sql)
+    with eng.connect() as conn:
+        row = conn.execute(select(*[e.label(k) for k, e in _exprs(col, dialect).items()])).mappings().one()
+    eng.dispose()
+    return dict(row)
+
+
+def test_sqlite_values():
+    # SQLAlchemy が SQLite に保存する naive UTC 文字列と同じ形式
+    assert _run("sqlite://", "sqlite", "'2025-10-01 16:30:00.000000'") == EXPECTED
+
+
+@pytest.mark.skipif(not os.getenv("TEST_POSTGRES_URL"), reason="TEST_POSTGRES_URL 未設定")
+def test_postgresql_values():
+    got = _run(os.environ["TEST_POSTGRES_URL"], "postgresql", "TIMESTAMPTZ '2025-10-01 16:30:00+00'")
+    assert got == EXPECTED
@@ -0,0 +1,401 @@
+import json
+import pathlib
+
+import numpy as np
+import pytest
+
+pd = pytest.importorskip("pandas")
+pytest.importorskip("sklearn")
+
+from sqlalchemy import create_engine, event, text
+
+from app.ml import train_forecast as tf
+
+FORECAST_DDL = (pathlib.Path(tf.__file__).parents[1] / "sql" / "create_menu_daily_forecast.sql").read_text()
+
+
+def make_history(n_menus=4, n_days=84, seed=0) -> pd.DataFrame:
+    """曜日パターン＋ノイズの合成データ（menu_daily_train と同じ列）"""
+    rnd = np.random.default_rng(seed)
+    ds = pd.date_range("2025-07-01", periods=n_days, freq="D")
+    frames = []
+    for mid in range(1, n_menus + 1):
+        weekly = np.array([5, 6, 6, 7, 9, 14, 12]) * mid
+        y = weekly[ds.dayofweek] + rnd.integers(0, 3, n_days)
+        frames.append(pd.DataFrame({
+            "menu_id": mid, "ds": ds, "y": y,
+            "dow": ds.dayofweek, "is_month_end": ds.is_month_end.astype(int),
+        }))
+    return pd.concat(frames, ignore_index=True)
+
+
+@pytest.fixture()
+def train_db(tmp_path):
+    url = f"sqlite:///{tmp_path / 'train.sqlite'}"
+    eng = create_engine(url)
+    hist = make_history()
+    hist.assign(ds=hist["ds"].dt.date).to_sql("menu_daily_train", eng, index=False)
+    with eng.begin() as conn:
+        conn.execute(text(FORECAST_DDL.split(";")[0]))
+    yield url, eng, hist
+    eng.dispose()
+
+
+def _forecasts(eng) -> pd.DataFrame:
+    return pd.read_sql(
+        "SELECT menu_id, ds, model, yhat, yhat_lo, yhat_hi FROM menu_daily_forecast ORDER BY menu_id, ds, model", eng
+    )
+
+
+def test_workers_match_serial_run(train_db, capsys):
+    url, eng, _ = train_db
+    tf.main(["--database-url", url, "--model", "ridge", "--horizon", "7"])
+    serial_out = capsys.readouterr().out
+    serial = _forecasts(eng)
+    assert len(serial) == 4 * 7
+
+    with eng.begin() as conn:
+        conn.execute(text("DELETE FROM menu_daily_forecast"))
+    tf.main(["--database-url", url, "--model", "ridge", "--horizon", "7", "--workers", "2"])
+    parallel_out = capsys.readouterr().out
+
+    pd.testing.assert_frame_equal(serial, _forecasts(eng))
+    assert parallel_out == serial_out
+
+
+def test_recursive_predict_matches_pipeline_step_by_step():
+    hist = make_history(n_menus=1)
+    dates = pd.date_range(hist["ds"].max() + pd.Timedelta(days=1), periods=10, freq="D")
+    out = tf.fit_predict_sklearn(hist, dates, "ridge")
+
+    # 参照：1 日ずつ特徴量を作って pipe.predict
+    pipe = tf._build_sklearn_pipeline("ridge")
+    feat = tf.make_lag_features(hist).dropna()
+    pipe.fit(feat[tf.FEATURE_COLS], feat["y"].values)
+    ys = list(hist["y"].astype(float))
+    cal = tf.calendar_features(dates)
+    for t in range(len(dates)):
+        row = {f"lag{i}": ys[-i] for i in range(1, 8)} | cal.iloc[t].to_dict()
+        ys.append(float(pipe.predict(pd.DataFrame([row])[tf.FEATURE_COLS])[0]))
+
+    np.testing.assert_allclose(out["yhat"].to_numpy(), ys[-10:], rtol=1e-10)
+    assert (out["yhat_lo"] == out["yhat"]).all()
+
+
+def test_rolling_origin_backtest_folds():
+    hist = make_history(n_menus=1)
+    one = tf.rolling_origin_backtest("ridge", "seasonal_ma_k4", hist, horizon=7, folds=4)
+    assert one["folds"] == 4
+    assert np.isfinite(one["mae_ml"]) and np.isfinite(one["mape_ml"])
+
+    # 1 fold は従来の単一分割と同じ
+    single = tf.single_split_backtest("ridge", "seasonal_ma_k4", hist, horizon=7)
+    assert single["folds"] == 1
+    assert single == tf.rolling_origin_backtest("ridge", "seasonal_ma_k4", hist, horizon=7, folds=1)
+
+    # fold の並列実行でも結果は同じ
+    assert tf.rolling_origin_backtest("ridge", "seasonal_ma_k4", hist, horizon=7, folds=4, workers=3) == one
+
+    # 学習データが足りない fold は捨てる
+    short = tf.rolling_origin_backtest("ridge", "seasonal_ma_k4", hist.tail(30), horizon=7, folds=4)
+    assert short["folds"] == 1 and np.isfinite(short["mae_ml"])
+
+
+def test_backtest_results_are_appended(train_db):
+    url, eng, _ = train_db
+    for _ in range(2):
+        tf.main(["--database-url", url, "--model", "ridge", "--horizon", "7", "--folds", "2"])
+    bt = pd.read_sql("SELECT * FROM menu_forecast_backtest ORDER BY run_at, menu_id", eng)
+    assert len(bt) == 2 * 4
+    assert set(bt["folds"]) == {2}
+    assert {"mae_ml", "mape_ml", "bias_ml", "mae_base", "mape_base", "bias_base", "win"} <= set(bt.columns)
+
+
+def test_recursive_predict_batch_matches_single():
+    rnd = np.random.default_rng(1)
+    base, w, tails = rnd.normal(size=(3, 5)), rnd.normal(scale=0.2, size=7), rnd.normal(size=(3, 7))
+    batch = tf.recursive_predict_batch(base, w, tails)
+    for i in range(3):
+        np.testing.assert_allclose(batch[i], tf.recursive_predict(base[i], w, tails[i]))
+
+
+def test_global_mode_forecasts_new_menus(train_db):
+    url, eng, hist = train_db
+    # 履歴 10 日だけの新メニュー（per-menu モードでは --min-history でスキップされる）
+    new = make_history(n_menus=1, n_days=10, seed=3).assign(menu_id=99)
+    new["ds"] = new["ds"] + (hist["ds"].max() - new["ds"].max())
+    new.assign(ds=new["ds"].dt.date).to_sql("menu_daily_train", eng, index=False, if_exists="append")
+
+    tf.main(["--database-url", url, "--model", "ridge", "--horizon", "7", "--global", "--folds", "2"])
+    fc = _forecasts(eng)
+    assert sorted(fc["menu_id"].unique()) == [1, 2, 3, 4, 99]
+    assert (fc.groupby("menu_id").size() == 7).all()
+    assert np.isfinite(fc["yhat"]).all()
+    assert set(fc.loc[fc["menu_id"] == 99, "model"]) == {"global_ridge"}
+
+    bt = pd.read_sql("SELECT menu_id, folds FROM menu_forecast_backtest", eng)
+    assert sorted(bt["menu_id"]) == [1, 2, 3, 4] and set(bt["folds"]) == {2}
+
+
+def test_fit_predict_global_does_not_refit_explicit_none(monkeypatch):
+    hist = make_history(n_menus=2, n_days=5)  # ラグが作れず学習できない
+    dates = pd.date_range(hist["ds"].max() + pd.Timedelta(days=1), periods=3, freq="D")
+    calls = []
+    real = tf.fit_global_artifact
+    monkeypatch.setattr(tf, "fit_global_artifact", lambda *a, **k: calls.append(1) or real(*a, **k))
+
+    assert tf.fit_predict_global(hist, dates, "ridge")["yhat"].isna().all() and len(calls) == 1
+    out = tf.fit_predict_global(hist, dates, "ridge", art=None)
+    assert out["yhat"].isna().all() and len(out) == 2 * 3 and len(calls) == 1
+
+
+def _fc(dates, yhat, lo=True):
+    df = pd.DataFrame({"ds": dates, "yhat": yhat})
+    if lo:
+        df["yhat_lo"], df["yhat_hi"] = df["yhat"] - 1, df["yhat"] + 1
+    return df
+
+
+def test_save_forecasts_upserts_in_one_statement(train_db):
+    _, eng, _ = train_db
+    dates = pd.date_range("2025-10-01", periods=3)
+    tf.save_forecasts(eng, "menu_daily_forecast", [(1, _fc(dates, [1.0, 2.0, 3.0]), "ridge"), (2, _fc(dates, [4.0, 5.0, 6.0], lo=False), "ridge")])
+
+    statements = []
+    listener = lambda *a: statements.append(a[2])
+    event.listen(eng, "before_cursor_execute", listener)
+    try:
+        tf.save_forecasts(eng, "menu_daily_forecast", [(1, _fc(dates[1:], [20.0, 30.0]), "ridge")])
+    finally:
+        event.remove(eng, "before_cursor_execute", listener)
+
+    assert sum("INSERT" in s for s in statements) == 1 and not any("DELETE" in s for s in statements)
+    got = _forecasts(eng)
+    assert got[got["menu_id"] == 1]["yhat"].tolist() == [1.0, 20.0, 30.0]
+    assert got[got["menu_id"] == 1]["yhat_hi"].tolist() == [2.0, 21.0, 31.0]
+    # lo/hi が無い予測は yhat で埋める
+    assert (got[got["menu_id"] == 2]["yhat_lo"] == got[got["menu_id"] == 2]["yhat"]).all()
+
+
+def test_save_forecasts_without_primary_key(tmp_path):
+    eng = create_engine(f"sqlite:///{tmp_path / 'nopk.sqlite'}")
+    with eng.begin() as conn:
+        conn.execute(text("CREATE TABLE fc (menu_id INTEGER, ds DATE, yhat REAL, model TEXT)"))
+    dates = pd.date_range("2025-10-01", periods=2)
+    tf.save_forecasts(eng, "fc", [(1, _fc(dates, [1.0, 2.0]), "ridge")])
+    tf.save_forecasts(eng, "fc", [(1, _fc(dates, [3.0, 4.0]), "ridge")])
+    got = pd.read_sql("SELECT yhat FROM fc ORDER BY ds", eng)
+    assert got["yhat"].tolist() == [3.0, 4.0]
+    eng.dispose()
+
+
+def test_incremental_retrains_only_changed_menus(train_db, capsys):
+    url, eng, _ = train_db
+    base = ["--database-url", url, "--model", "ridge", "--folds", "1", "--incremental"]
+
+    tf.main(base + ["--horizon", "7"])
+    first = _forecasts(eng)
+    states = pd.read_sql("SELECT menu_id, config, chosen_model, model_version FROM menu_forecast_state", eng)
+    assert sorted(states["menu_id"]) == [1, 2, 3, 4] and set(states["config"]) == {"ridge"}
+    assert set(states["model_version"]) == {1}
+    capsys.readouterr()
+
+    # 入力も予測期間も同じ → 何もしない
+    tf.main(base + ["--horizon", "7"])
+    out = capsys.readouterr().out
+    assert out.count("[unchanged]") == 4 and "Saved forecasts     : 0" in out
+
+    # 予測期間だけ変わった → 保存済みモデルで予測し直す（同じ日の値は変わらない）
+    tf.main(base + ["--horizon", "10"])
+    out = capsys.readouterr().out
+    assert out.count("[reuse]") == 4 and "[bt]" not in out
+    longer = _forecasts(eng)
+    assert (longer.groupby("menu_id").size() == 10).all()
+    merged = first.merge(longer, on=["menu_id", "ds", "model"])
+    np.testing.assert_allclose(merged["yhat_x"], merged["yhat_y"])
+
+    # メニュー 2 のデータだけ変わった → メニュー 2 だけ学習し直す
+    with eng.begin() as conn:
+        conn.execute(text("UPDATE menu_daily_train SET y = y + 5 WHERE menu_id = 2 AND ds = (SELECT MIN(ds) FROM menu_daily_train)"))
+    tf.main(base + ["--horizon", "10"])
+    out = capsys.readouterr().out
+    assert "[bt] menu_id=2" in out and out.count("[bt]") == 1 and out.count("[unchanged]") == 3
+    reg = pd.read_sql("SELECT menu_id, version FROM forecast_model_registry WHERE menu_id = 2 ORDER BY version", eng)
+    assert reg["version"].tolist() == [1, 2]
+
+
+def test_incremental_after_tune_uses_latest_model(train_db, capsys):
+    url, eng, _ = train_db
+    base = ["--database-url", url, "--model", "ridge", "--folds", "1"]
+    tf.main(base + ["--incremental", "--horizon", "7"])
+    # --incremental なしの --tune でも状態を書き換える（ハイパーパラメータも状態のハッシュに入る）
+    tf.main(base + ["--horizon", "7", "--tune", "--tune-alphas", "100", "--tune-lags", "14"])
+    states = pd.read_sql("SELECT menu_id, chosen_model, model_version FROM menu_forecast_state ORDER BY menu_id", eng)
+    latest = pd.read_sql(
+        "SELECT menu_id, model, version FROM forecast_model_registry WHERE version = 2 ORDER BY menu_id", eng)
+    assert states["model_version"].tolist() == [2, 2, 2, 2]
+    assert states["chosen_model"].tolist() == latest["model"].tolist()
+    capsys.readouterr()
+
+    tf.main(base + ["--incremental", "--horizon", "10"])
+    out = capsys.readouterr().out
+    assert out.count("[reuse]") == 4 and "[bt]" not in out
+    for r in latest.itertuples():
+        assert f"[reuse] menu_id={r.menu_id} model={r.model}" in out
+    fc = _forecasts(eng).merge(latest, on=["menu_id", "model"])  # 最新版のモデルの行が 10 日分ある
+    assert (fc.groupby("menu_id").size() == 10).all() and fc["menu_id"].nunique() == 4
+
+    # 保存済みのハイパーパラメータが変われば学習し直す
+    with eng.begin() as conn:
+        conn.execute(text("UPDATE forecast_hyperparams SET alpha = 0.1 WHERE menu_id = 3"))
+    tf.main(base + ["--incremental", "--horizon", "10"])
+    out = capsys.readouterr().out
+    assert "[bt] menu_id=3" in out and out.count("[bt]") == 1
+
+
+def test_registered_artifacts_predict_the_same_online(train_db):
+    from app.services import forecast_models
+
+    url, eng, hist = train_db
+    tf.main(["--database-url", url, "--model", "ridge", "--horizon", "7", "--folds", "1"])
+    reg = pd.read_sql("SELECT menu_id, version, model, artifact FROM forecast_model_registry", eng)
+    assert sorted(reg["menu_id"]) == [1, 2, 3, 4] and set(reg["version"]) == {1}
+
+    fc = _forecasts(eng)
+    dates = [d.date() for d in pd.date_range(hist["ds"].max() + pd.Timedelta(days=1), periods=7)]
+    for r in reg.itertuples():
+        art = json.loads(r.artifact)
+        y = hist[hist["menu_id"] == r.menu_id].sort_values("ds")["y"].tolist()
+        online = forecast_models.predict(art, y[-forecast_models.history_days(art):], dates)
+        np.testing.assert_allclose(online, fc[fc["menu_id"] == r.menu_id]["yhat"].to_numpy())
+
+
+def test_conformal_halfwidth():
+    r = np.arange(1, 10, dtype=float)  # n=9 → ceil(10*0.8)=8 番目
+    assert tf.conformal_halfwidth(r, 0.8) == 8.0
+    assert tf.conformal_halfwidth(r[:3], 0.9) == 3.0  # 順位が n を超えたら最大値
+    assert tf.conformal_halfwidth(np.array([np.nan]), 0.8) is None
+
+
+def test_forecasts_carry_conformal_intervals(train_db):
+    url, eng, hist = train_db
+    tf.main(["--database-url", url, "--model", "ridge", "--horizon", "7", "--coverage", "0.9"])
+    fc = _forecasts(eng)
+    assert (fc["yhat_lo"] <= fc["yhat"]).all() and (fc["yhat"] <= fc["yhat_hi"]).all()
+    assert (fc["yhat_lo"] >= 0).all() and (fc["yhat_hi"] > fc["yhat"]).all()
+
+    reg = pd.read_sql("SELECT menu_id, artifact FROM forecast_model_registry", eng)
+    for r in reg.itertuples():
+        q = json.loads(r.artifact)["interval"]["q"]
+        one = fc[fc["menu_id"] == r.menu_id]
+        np.testing.assert_allclose(one["yhat_hi"] - one["yhat"], q)
+
+
+def test_search_hyperparams_prunes_hopeless_candidates():
+    grid = [{"alpha": a, "n_lags": 7} for a in (1.0, 0.1, 10.0)]
+    calls = []
+
+    def evaluate(params, k):
+        calls.append((params["alpha"], k))
+        return np.full(5, {1.0: 2.0, 0.1: 1.0, 10.0: 9.0}[params["alpha"]])
+
+    best = tf.search_hyperparams(evaluate, grid, n_folds=3)
+    assert best["alpha"] == 0.1 and best["mae"] == 1.0 and best["pruned"] == 2
+    # fold 0 のあと最良（1.0）の 1.25 倍を超えた 2 候補は fold 1 以降を評価しない
+    assert calls.count((10.0, 1)) == 0 and calls.count((1.0, 2)) == 0
+    assert tf.param_grid("ridge")[0] == {"alpha": tf.DEFAULT_ALPHA["ridge"], "n_lags": tf.N_LAGS}
+
+
+def test_tune_stores_hyperparams_and_later_runs_reuse_them(train_db, capsys):
+    from app.services import forecast_models
+
+    url, eng, hist = train_db
+    base = ["--database-url", url, "--model", "ridge", "--horizon", "7", "--folds", "2"]
+    tf.main(base + ["--tune", "--tune-alphas", "0.1,1,100", "--tune-lags", "7,14", "--workers", "2"])
+    out = capsys.readouterr().out
+    assert out.count("[tune] menu_id=") == 4
+    hp = pd.read_sql("SELECT menu_id, config, alpha, n_lags FROM forecast_hyperparams ORDER BY menu_id", eng)
+    assert hp["menu_id"].tolist() == [1, 2, 3, 4] and set(hp["config"]) == {"ridge"}
+
+    # 2 回目は探索せず、保存済みの値で学習する（オンライン推論も同じラグ日数で動く）
+    tf.main(base + ["--tune"])
+    assert "[tune]" not in capsys.readouterr().out
+    reg = pd.read_sql("SELECT menu_id, model, artifact FROM forecast_model_registry WHERE version = 2", eng)
+    fc = _forecasts(eng)
+    dates = [d.date() for d in pd.date_range(hist["ds"].max() + pd.Timedelta(days=1), periods=7)]
+    for r in reg[reg["model"] == "ridge"].itertuples():
+        art = json.loads(r.artifact)
+        want = hp[hp["menu_id"] == r.menu_id].iloc[0]
+        assert art["n_lags"] == want["n_lags"] and art["alpha"] == pytest.approx(want["alpha"])
+        y = hist[hist["menu_id"] == r.menu_id].sort_values("ds")["y"].tolist()
+        online = forecast_models.predict(art, y[-forecast_models.history_days(art):], dates)
+        np.testing.assert_allclose(online, fc[fc["menu_id"] == r.menu_id]["yhat"].to_numpy())
+
+
+def test_tune_global_stores_one_row(train_db, capsys):
+    url, eng, _ = train_db
+    tf.main(["--database-url", url, "--model", "lasso", "--horizon", "7", "--folds", "2", "--global",
+             "--tune", "--tune-lags", "7,14"])
+    assert "[tune] global" in capsys.readouterr().out
+    hp = pd.read_sql("SELECT menu_id, config, n_lags FROM forecast_hyperparams", eng)
+    assert hp["menu_id"].tolist() == [tf.GLOBAL_MENU_ID] and hp["config"].tolist() == ["global_lasso"]
+
+
+def _loop_seasonal_ma(train_df, test_dates, k):
+    """変更前の 1 日ずつの実装（比較用）"""
+    hist = train_df.set_index("ds")["y"]
+    out = []
+    for d in test_dates:
+        vals = [hist.get(d - pd.Timedelta(days=7 * i), np.nan) for i in range(1, k + 1)]
+        vals = [v for v in vals if pd.notna(v)]
+        out.append(np.mean(vals) if vals else np.nan)
+    return np.array(out)
+
+
+def test_vectorized_baselines_match_loop_and_online():
+    from app.services import forecast_models
+
+    hist = make_history(n_menus=3, n_days=60)
+    hist = hist.drop(index=hist.index[[5, 40, 41, 100]])  # 欠損日あり
+    cutoff = pd.Timestamp("2025-08-15")
+    train = hist[hist["ds"] <= cutoff]
+    test_dates = pd.date_range(cutoff + pd.Timedelta(days=1), periods=10, freq="D")  # horizon > 7 は NaN を含む
+
+    for name, k in [("naive_tminus7", 1), ("seasonal_ma_k2", 2), ("seasonal_ma_k4", 4)]:
+        batch = tf.baselines_for(name, train, [1, 2, 3], test_dates)
+        for i, mid in enumerate([1, 2, 3]):
+            want = _loop_seasonal_ma(train[train["menu_id"] == mid], test_dates, k)
+            np.testing.assert_allclose(batch[i], want)
+            np.testing.assert_allclose(tf.compute_baseline(name, train[train["menu_id"] == mid], test_dates), want)
+
+    # 中央値・EWMA も 7 日以内はオンライン推論と一致
+    one = train[train["menu_id"] == 3].sort_values("ds")  # 欠損なし
+    days = pd.date_range(one["ds"].min(), cutoff, freq="D")
+    assert len(days) == len(one)
+    for name in ["seasonal_median_k4", "seasonal_ewma_k8"]:
+        art = {"kind": "baseline", "name": name}
+        got = tf.compute_baseline(name, one, test_dates[:7]).to_numpy()
+        online = forecast_models.predict(art, one["y"].tolist(), [d.date() for d in test_dates[:7]])
+        np.testing.assert_allclose(got, online)
+    y = one["y"].to_numpy(dtype=float)
+    assert tf.compute_baseline("seasonal_median_k4", one, test_dates[:1]).iloc[0] == np.median(y[[-7, -14, -21, -28]])
+
+
+def test_dense_history_views_round_trip():
+    hist = make_history(n_menus=3, n_days=30)
+    hist = hist[~((hist["menu_id"] == 2) & (hist["ds"] < "2025-07-05"))]  # 途中から始まるメニュー
+    hist = hist.drop(index=hist.index[40])  # 欠損日
+    dense = tf.DenseHistory.from_frame(hist)
+    assert dense.y.dtype == np.float32 and dense.y.flags.c_contiguous and dense.y.shape == (3, 30)
+
+    s = dense.series(2)
+    assert np.shares_memory(s.values, dense.y)  # コピーではなくビュー
+    assert s.start == pd.Timestamp("2025-07-05") and s.last_date == hist["ds"].max()
+    one = hist[hist["menu_id"] == 2][["ds", "y"]].reset_index(drop=True)
+    pd.testing.assert_frame_equal(s.frame(), one.astype({"y": float}), check_dtype=False)
+
+    back = dense.frame()
+    pd.testing.assert_frame_equal(back, hist[["menu_id", "ds", "y"]].reset_index(drop=True).astype({"y": float}),
+                                  check_dtype=False)
+    w = dense.window([1, 3], pd.date_range("2025-07-29", periods=4, freq="D"))
+    assert np.isnan(w[:, 2:]).all() and not np.isnan(w[:, :2]).any()